@@ -0,0 +1,75 @@
+"""
+住所CSVの一括割り当て (bulk_assign) のベンチマーク
+
+ジオコーディングは 1件 --latency 秒かかる偽のプロバイダ3つで再現する (外部ネットワークには接続しない)。
+アプリと同じく search_address_ultimate (住所ごとの順番検索) を通す。--racer を付けると、画面の検索と共有する
+RacingGeocoder (16 スレッド、締め切り --latency の4倍) を通したときの結果とブレーカーの状態も出す。
+1回目: 並列でジオコーディング / 2回目: 同じCSVをもう一度 (キャッシュから再開) を測る。
+
+    python benchmarks/bench_bulk_assign.py [--rows 1000] [--latency 0.05] [--workers 8] [--racer]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bulk_assign import bulk_assign
+from geo_utils import StopGridIndex
+from geocoding import GeocodeCache, RacingGeocoder, search_address_ultimate
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--stops", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.05, help="偽プロバイダの1件あたりの応答時間 [s]")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--racer", action="store_true", help="RacingGeocoder を通した場合も測る")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    schedules = {}
+    for mode, (route_col, stop_col) in {"通常便": ("route_normal", "stop_normal"), "小中時差便": ("route_jisa", "stop_jisa"), "高時差便": ("route_kotobu", "stop_kotobu")}.items():
+        stops = pd.DataFrame({
+            "route": [f"{mode}{i % 20}" for i in range(args.stops)], "stop_name": [f"バス停{i}" for i in range(args.stops)],
+            "lat": 35.90 + rng.random(args.stops) * 0.2, "lng": 139.55 + rng.random(args.stops) * 0.2,
+        })
+        schedules[mode] = (StopGridIndex(stops), route_col, stop_col)
+
+    def fake_provider(query, session=None, timeout=None):
+        time.sleep(args.latency)
+        if "-" not in query: return None  # 町名だけの問い合わせ
+        n = int(query.rsplit("-", 1)[-1])
+        if n % 50 == 0: return None  # 見つからない住所
+        return 35.90 + (n % 97) / 500, 139.55 + (n % 89) / 450
+    providers = [(f"偽プロバイダ{i}", fake_provider) for i in range(1, 4)]
+    searches = {"serial": lambda address: search_address_ultimate(address, providers)}
+    if args.racer:
+        racer = RacingGeocoder(providers, default_deadline=args.latency * 4, max_workers=16)
+        searches["racer"] = racer.search
+
+    addresses = pd.DataFrame({"name": [f"生徒{i}" for i in range(args.rows)], "address": [f"岩槻区本町3-{i}" for i in range(args.rows)]})
+    print(f"rows={args.rows} latency={args.latency}s workers={args.workers}")
+    print(f"one address at a time: {args.rows * args.latency:.1f}s")
+    for name, search in searches.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = GeocodeCache(os.path.join(tmp, "geocode.sqlite3"))
+            for label in ("first run", "resume (cached)"):
+                t0 = time.perf_counter()
+                result = bulk_assign(addresses, "address", cache, schedules, search=search, max_workers=args.workers)
+                elapsed = time.perf_counter() - t0
+                print(f"[{name}] {label:<16} {elapsed:.2f}s  found={int(result['lat'].notna().sum())} cache hits={cache.hits} misses={cache.misses}")
+        if name == "racer":
+            print(f"[racer] breakers open: {[n for n, b in racer.breakers.items() if b.is_open] or 'none'}")
+            racer.executor.shutdown(wait=False, cancel_futures=True)
+    print(result[["address", "route_normal", "stop_normal", "stop_normal_distance", "stop_jisa", "stop_kotobu"]].head(3).to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
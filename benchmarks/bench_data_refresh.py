@@ -0,0 +1,70 @@
+"""
+データの裏読み直し (caching.BackgroundRefresher) の動作確認
+
+読み込みに --load-seconds 秒かかる偽の読み込み関数で、
+- 最初の get() だけが読み込みを待つこと
+- 読み直しの最中も get() は前の値をすぐ返すこと (待ち時間の最大値)
+- 読み直しに失敗しても前の値を返し続け、失敗回数が数えられること
+を確かめる。従来の「TTL 切れで次の利用者が読み込みを待つ」場合の待ち時間も並べて出す。
+
+    python benchmarks/bench_data_refresh.py [--load-seconds 0.5] [--interval 0.3] [--duration 3]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from caching import BackgroundRefresher
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--load-seconds", type=float, default=0.5)
+    parser.add_argument("--interval", type=float, default=0.3)
+    parser.add_argument("--duration", type=float, default=3.0)
+    args = parser.parse_args(argv)
+
+    state = {"version": 0, "fail": False}
+    def load(previous):
+        time.sleep(args.load_seconds)
+        if state["fail"]: raise ConnectionError("Sheets に接続できません")
+        state["version"] += 1
+        return {"version": state["version"]}
+
+    refresher = BackgroundRefresher(load, interval=args.interval, retry_interval=args.interval)
+    t0 = time.perf_counter()
+    first = refresher.get()
+    print(f"first get (warmup): {(time.perf_counter() - t0) * 1000:.0f} ms version={first['version']}")
+
+    # 利用者の再実行の代わりに、get() を繰り返し呼んで待ち時間を測る
+    waits, seen = [], set()
+    def reader(until):
+        while time.perf_counter() < until:
+            t = time.perf_counter()
+            seen.add(refresher.get()["version"])
+            waits.append(time.perf_counter() - t)
+            time.sleep(0.005)
+    half = time.perf_counter() + args.duration / 2
+    threads = [threading.Thread(target=reader, args=(half,)) for _ in range(4)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    print(f"while refreshing: {len(waits)} gets, max wait {max(waits) * 1000:.2f} ms, versions seen {sorted(seen)}")
+
+    state["fail"] = True
+    before = refresher.get()["version"]
+    time.sleep(args.duration / 2)
+    status = refresher.status()
+    print(f"with failing loads: still version {refresher.get()['version']} (was {before}), failures={status['failures']} consecutive={status['consecutive_failures']} last_error={status['last_error']!r}")
+    state["fail"] = False
+    refresher.refresh_now()
+    time.sleep(args.load_seconds * 1.5)
+    print(f"after recovery: version {refresher.get()['version']} status={ {k: v for k, v in refresher.status().items() if k != 'last_error'} }")
+    refresher.stop()
+    print(f"TTL expiry without background refresh: the next user waits ~{args.load_seconds * 1000:.0f} ms (+ CSV fallback when Sheets fails)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""
+全路線の時刻表・名簿の一括出力 (route_export.py) のベンチマーク
+
+合成データ (synthetic_data.py) でアプリを AppTest でヘッドレス実行し、「一括出力を作成」を押して
+全スケジュール × 登校/下校 × 全路線 のファイル一式を作る時間を形式ごとに測る。
+--workers を複数渡すと、並列に作るスレッド数 (BUS_EXPORT_WORKERS) ごとに比べる。
+
+    python benchmarks/bench_export.py [--students 10000] [--stops 2000] [--formats csv xlsx pdf] [--workers 1 4]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from route_export import available_formats
+from synthetic_data import write_synthetic_data
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "specialexcel_app.py")
+
+
+def run_export(formats):
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+    st.cache_data.clear(); st.cache_resource.clear()
+    at = AppTest.from_file(APP_PATH, default_timeout=1800)
+    at.secrets["app_password"] = "bench"
+    at.session_state["logged_in"] = True
+    at.run()
+    [m for m in at.multiselect if m.label == "形式"][0].set_value(formats)
+    [b for b in at.button if b.label == "一括出力を作成"][0].click()
+    t0 = time.perf_counter()
+    at.run()
+    elapsed = time.perf_counter() - t0
+    if at.exception: raise RuntimeError(at.exception[0].value)
+    path, stats = at.session_state["route_export"]
+    with zipfile.ZipFile(path) as archive: entries = len(archive.namelist())
+    return elapsed, stats, entries
+
+
+def main(argv=None):
+    logging.disable(logging.WARNING)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--students", type=int, default=10000)
+    parser.add_argument("--stops", type=int, default=2000)
+    parser.add_argument("--formats", nargs="+", default=available_formats())
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    args = parser.parse_args(argv)
+
+    print(f"students={args.students} stops={args.stops} cpus={os.cpu_count()} formats={args.formats}")
+    with tempfile.TemporaryDirectory() as data_dir:
+        write_synthetic_data(data_dir, args.students, args.stops)
+        for workers in dict.fromkeys(args.workers):
+            for formats in [[fmt] for fmt in args.formats] + ([args.formats] if len(args.formats) > 1 else []):
+                with tempfile.TemporaryDirectory() as cache_dir:
+                    os.environ.update({"BUS_DATA_DIR": data_dir, "BUS_CACHE_DIR": cache_dir, "BUS_EXPORT_WORKERS": str(workers)})
+                    elapsed, stats, entries = run_export(formats)
+                print(f"  workers={workers:<2} {'+'.join(formats):<13} {elapsed:>6.2f}s  files={entries} zip={stats['bytes'] / 1024 / 1024:.1f} MB (before compression)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
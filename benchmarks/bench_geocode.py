@@ -0,0 +1,60 @@
+"""
+住所検索の逐次版 (search_address_ultimate) と並列版 (RacingGeocoder) の比較
+
+ローカルのスタブ HTTP サーバで 遅い / 失敗する / 正しく返す プロバイダを再現する。
+外部ネットワークには接続しない。スタブは tests/fake_apis.py にあり、tests/test_geocoding.py も同じものを使う。
+
+    python benchmarks/bench_geocode.py [--slow 2.0]
+"""
+import argparse
+import os
+import sys
+import time
+from functools import partial
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tests"))
+from fake_apis import start_server, stub_providers
+from geocoding import GeocodeUnavailable, RacingGeocoder, geocode_gsi, search_address_ultimate
+
+def timed(search, address):
+    t0 = time.perf_counter()
+    try:
+        provider = search(address)[2]
+    except GeocodeUnavailable:
+        provider = "(unavailable)"
+    return time.perf_counter() - t0, provider
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--slow", type=float, default=2.0, help="遅いプロバイダの応答時間 [s]")
+    args = parser.parse_args(argv)
+
+    servers = {b: start_server(b, args.slow) for b in ("slow", "fail", "ok")}
+    scenarios = {
+        "GSI遅い / 農研失敗 / Geocoding.jp正常": ("slow", "fail", "ok"),
+        "GSI正常 / 農研遅い / Geocoding.jp失敗": ("ok", "slow", "fail"),
+    }
+    for label, (gsi, naro, gjp) in scenarios.items():
+        providers = stub_providers(servers, gsi, naro, gjp)
+        racer = RacingGeocoder(providers, default_deadline=args.slow / 2)
+        print(f"[{label}]")
+        for address in ("岩槻区本町3-1", "存在しない町9-9"):
+            t_serial, serial = timed(partial(search_address_ultimate, providers=providers), address)
+            t_race, raced = timed(racer.search, address)
+            print(f"  {address:<12} serial={t_serial:.2f}s {serial}  race={t_race:.2f}s {raced}")
+        racer.executor.shutdown(wait=False, cancel_futures=True)
+
+    # サーキットブレーカー: 失敗し続けるプロバイダは呼ばれなくなる
+    fail_url = servers["fail"][1]
+    racer = RacingGeocoder([("国土地理院", partial(geocode_gsi, url=fail_url + "/gsi"))], default_deadline=1.0)
+    for _ in range(3): timed(racer.search, "岩槻区本町")
+    print(f"breaker open after repeated failures: {racer.breakers['国土地理院'].is_open}")
+    for server, _ in servers.values(): server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+"""
+データのメモリ使用量と、バス停の照合 (対象の生徒・検索結果のバス停を探す処理) の速さ
+
+- object       : CSV を読んで clean_df しただけ (文字列は Python の str)
+- compact      : to_compact_model の後 (文字列の多い列は category、バス停には int32 の stop_id)
+- 照合          : (route, stop_name) の文字列2列の比較 と stop_id の整数比較
+
+    python benchmarks/bench_memory.py [--students 10000] [--stops 2000] [--runs 200]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from data_store import lookup_stop_ids, memory_report, read_csv_auto_encoding, stop_key_index, to_compact_model
+from synthetic_data import write_synthetic_data
+
+
+def per_call_us(fn, runs):
+    t0 = time.perf_counter()
+    for _ in range(runs): fn()
+    return (time.perf_counter() - t0) / runs * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--students", type=int, default=10000)
+    parser.add_argument("--stops", type=int, default=2000)
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        write_synthetic_data(data_dir, args.students, args.stops)
+        stops_df, _ = read_csv_auto_encoding(os.path.join(data_dir, "bus_stops.csv"))
+        students_df, _ = read_csv_auto_encoding(os.path.join(data_dir, "students.csv"))
+
+    before = memory_report(stops=stops_df, students=students_df)
+    compact_stops, compact_students = to_compact_model(stops_df.copy(), students_df.copy())
+    after = memory_report(stops=compact_stops, students=compact_students)
+    print(f"students={len(students_df)} stops={len(stops_df)}")
+    for name in before:
+        print(f"  {name:<9} object {before[name] / 1024:>8.0f} KiB → compact {after[name] / 1024:>8.0f} KiB ({after[name] / before[name]:.0%})")
+    total_before, total_after = sum(before.values()), sum(after.values())
+    print(f"  {'total':<9} object {total_before / 1024:>8.0f} KiB → compact {total_after / 1024:>8.0f} KiB ({total_after / total_before:.0%})")
+
+    # 生徒1人のバス停を探す (地図の中心・時刻表の強調・生徒詳細で使う照合)
+    target = students_df.iloc[len(students_df) // 2]
+    target_id = int(lookup_stop_ids(stop_key_index(compact_stops), [target["route"]], [target["stop_name"]])[0])
+    by_string = per_call_us(lambda: stops_df[(stops_df["route"] == target["route"]) & (stops_df["stop_name"] == target["stop_name"])], args.runs)
+    by_category = per_call_us(lambda: compact_stops[(compact_stops["route"] == target["route"]) & (compact_stops["stop_name"] == target["stop_name"])], args.runs)
+    by_id = per_call_us(lambda: compact_stops[compact_stops["stop_id"] == target_id], args.runs)
+    print(f"stop lookup: str {by_string:.0f} us / category {by_category:.0f} us / stop_id {by_id:.0f} us")
+
+    # 生徒全員に stop_id を付ける (スケジュールごとに1回)
+    key_index = stop_key_index(compact_stops)
+    assign = per_call_us(lambda: lookup_stop_ids(key_index, compact_students["route"], compact_students["stop_name"]), max(1, args.runs // 20))
+    print(f"assign stop_id to {len(compact_students)} students: {assign / 1000:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
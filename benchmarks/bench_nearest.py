@@ -0,0 +1,75 @@
+"""
+最寄りバス停検索のベンチマーク & 精度チェック
+
+旧実装 (geopy.geodesic を1行ずつ apply → 全件ソート) と
+geo_utils.StopGridIndex (ヒュベニの公式 + グリッド索引 + 部分ソート) を比較する。
+アプリは geopy を使わないので requirements.txt には入っていない。geodesic との比較は geopy を入れたときだけ行う (pip install geopy)。
+
+    python benchmarks/bench_nearest.py [--stops 2000] [--queries 1000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from geo_utils import StopGridIndex, hubeny_distance
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stops", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    stops = pd.DataFrame({
+        "route": [f"便{i % 20}" for i in range(args.stops)], "stop_name": [f"バス停{i}" for i in range(args.stops)],
+        "lat": 35.90 + rng.random(args.stops) * 0.2, "lng": 139.55 + rng.random(args.stops) * 0.2,
+    })
+    q_lat = 35.85 + rng.random(args.queries) * 0.3
+    q_lng = 139.50 + rng.random(args.queries) * 0.3
+
+    t0 = time.perf_counter()
+    index = StopGridIndex(stops)
+    print(f"index build ({args.stops} stops): {(time.perf_counter() - t0) * 1000:.2f} ms")
+
+    t0 = time.perf_counter()
+    idx, dist = index.query_many(q_lat, q_lng, k=3)
+    print(f"grid top-3 x {args.queries} queries: {(time.perf_counter() - t0) * 1000:.2f} ms")
+
+    # 総当たりと一致するか
+    lat, lng = stops["lat"].to_numpy(), stops["lng"].to_numpy()
+    mismatches = 0
+    for i in range(args.queries):
+        brute = np.argsort(hubeny_distance(q_lat[i], q_lng[i], lat, lng), kind="stable")[:3]
+        if not np.array_equal(index.stops.index[idx[i]], brute): mismatches += 1
+    print(f"brute-force top-3 mismatches: {mismatches}/{args.queries}")
+
+    try:
+        from geopy.distance import geodesic
+    except ImportError:
+        print("geopy not installed; skipping geodesic comparison")
+        return 0
+    n_old = min(args.queries, 20)
+    t0 = time.perf_counter()
+    for i in range(n_old):
+        d = stops.apply(lambda row, i=i: geodesic((q_lat[i], q_lng[i]), (row["lat"], row["lng"])).meters, axis=1)
+        stops.assign(distance=d).sort_values("distance").head(3)
+    per_query = (time.perf_counter() - t0) / n_old
+    print(f"geopy apply + sort: {per_query * 1000:.1f} ms/query (x {args.queries} = {per_query * args.queries:.1f} s)")
+
+    rel_err = []
+    for i in range(args.queries):
+        for j, dj in zip(idx[i], dist[i]):
+            g = geodesic((q_lat[i], q_lng[i]), (lat[j], lng[j])).meters
+            rel_err.append(abs(dj - g) / g if g > 0 else 0.0)
+    print(f"hubeny vs geodesic: max rel err {max(rel_err):.2e}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
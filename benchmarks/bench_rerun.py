@@ -0,0 +1,82 @@
+"""
+再実行 (rerun) レイテンシのベンチマーク
+
+合成データ (synthetic_data.py: 生徒 10,000 名 / バス停 2,000 件) を一時ディレクトリに書き出し、
+Streamlit の AppTest でアプリをヘッドレス実行して再実行時間と地図 HTML のサイズを計測する。
+BUS_MAP_LIGHT=0 を付けて実行すると、全バス停をポップアップ付きで描く従来の描画と比較できる。
+
+    python benchmarks/bench_rerun.py [--students 10000] [--stops 2000] [--runs 5]
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from synthetic_data import write_synthetic_data
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "specialexcel_app.py")
+
+
+def time_reruns(runs, configure):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(APP_PATH, default_timeout=600)
+    at.secrets["app_password"] = "bench"
+    at.session_state["logged_in"] = True
+    at.run()  # ウォームアップ (データ読み込み・インデックス構築)
+    configure(at)
+    at.run()
+    timings = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        at.run()
+        timings.append(time.perf_counter() - t0)
+        if at.exception: raise RuntimeError(at.exception[0].value)
+    return timings, map_payload_bytes(at)
+
+
+def map_payload_bytes(at):
+    """ブラウザに送られた地図 HTML のバイト数"""
+    return sum(len(iframe.proto.srcdoc.encode("utf-8")) for iframe in at.get("iframe"))
+
+
+def select_route(route):
+    def configure(at):
+        [s for s in at.sidebar.selectbox if s.label == "📍 路線選択"][0].select(route)
+    return configure
+
+
+def set_mode(mode):
+    def configure(at):
+        at.sidebar.radio[0].set_value(mode)
+    return configure
+
+
+def main(argv=None):
+    logging.disable(logging.WARNING)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--students", type=int, default=10000)
+    parser.add_argument("--stops", type=int, default=2000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as data_dir, tempfile.TemporaryDirectory() as cache_dir:
+        route = write_synthetic_data(data_dir, args.students, args.stops)["通常"][0]
+        os.environ["BUS_DATA_DIR"] = data_dir
+        os.environ["BUS_CACHE_DIR"] = cache_dir
+        cases = {
+            "登校 / すべて表示": set_mode("☀️ 登校 (行き)"),
+            "すべて / すべて表示": set_mode("🔄 すべて (全体)"),
+            f"登校 / {route}": select_route(route),
+        }
+        print(f"students={args.students} stops={args.stops} runs={args.runs}")
+        for label, configure in cases.items():
+            timings, payload = time_reruns(args.runs, configure)
+            print(f"{label:<20} median={statistics.median(timings):.3f}s min={min(timings):.3f}s map={payload / 1024:,.0f} KiB")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
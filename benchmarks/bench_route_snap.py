@@ -0,0 +1,109 @@
+"""
+バス停を路線ラインに載せる処理 (geo_utils.SegmentGridIndex / snap_stops_to_routes) のベンチマーク & 精度チェック
+
+合成した路線ライン (ランダムウォーク、--vertices 頂点を --routes 本に分ける) の近くにバス停を置き、
+- インデックスの構築
+- snap_stops_to_routes (路線ごとに候補ライン2本 = 登校・下校 から選ぶ。順番・距離の照合まで)
+- 全線分との総当たり (NumPy でバス停 × 線分をまとめて計算)
+の時間を比べ、総当たりと距離・chainage が一致するかを確かめる。
+
+    python benchmarks/bench_route_snap.py [--stops 3000] [--vertices 40000] [--routes 40] [--runs 5]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from geo_utils import SegmentGridIndex, local_xy, snap_stops_to_routes
+
+
+def make_routes(n_routes, n_vertices, rng):
+    """路線ごとに 登校・下校 の2本 (下校は登校を逆にたどり少しずらしたもの) のラインを作る"""
+    per_line = max(2, n_vertices // (n_routes * 2))
+    lines, route_lines = [], {}
+    for r in range(n_routes):
+        start = np.array([139.6, 35.9]) + rng.random(2) * 0.1
+        angle = rng.uniform(0, 2 * np.pi) + np.cumsum(rng.normal(0, 0.05, per_line))  # 少しずつ曲がる道
+        to_school = start + np.cumsum(0.0002 * np.column_stack([np.cos(angle), np.sin(angle)]), axis=0)
+        from_school = to_school[::-1] + 0.00005
+        route_lines[f"便{r}"] = [len(lines), len(lines) + 1]
+        lines += [to_school.tolist(), from_school.tolist()]
+    return lines, route_lines
+
+
+def make_stops(lines, route_lines, n_stops, rng):
+    """登校のライン上の頂点から選んで数m ずらしたバス停。1% は遠くに (約500m)、1% は隣と sequence を入れ替える"""
+    per_route = max(2, n_stops // len(route_lines))
+    rows = []
+    for route, (line, _) in route_lines.items():
+        coords = np.asarray(lines[line])
+        picks = np.sort(rng.choice(len(coords), size=min(per_route, len(coords)), replace=False))
+        for seq, i in enumerate(picks, start=1):
+            lng, lat = coords[i] + rng.normal(0, 0.00003, 2)
+            rows.append({"route": route, "stop_name": f"{route}-{seq}", "lat": lat, "lng": lng, "sequence": seq})
+    stops = pd.DataFrame(rows)
+    far = rng.choice(len(stops), size=max(1, len(stops) // 100), replace=False)
+    stops.loc[far, "lat"] += 0.005
+    swap = rng.choice(len(stops) - 1, size=max(1, len(stops) // 100), replace=False)
+    seq = stops["sequence"].to_numpy().copy()
+    same_route = stops["route"].to_numpy()[swap] == stops["route"].to_numpy()[swap + 1]
+    seq[swap[same_route]], seq[swap[same_route] + 1] = seq[swap[same_route] + 1], seq[swap[same_route]]
+    stops["sequence"] = seq
+    return stops
+
+
+def brute_force(index, stops, line_of_stop):
+    """各バス停をそのラインの全線分と比べる (インデックスなし)"""
+    px, py = local_xy(stops["lat"].to_numpy(), stops["lng"].to_numpy(), index.lat0, index.lng0)
+    distance, chainage = np.empty(len(stops)), np.empty(len(stops))
+    for line in np.unique(line_of_stop):
+        members = np.flatnonzero(line_of_stop == line)
+        segments = np.arange(index.line_segments[line], index.line_segments[line + 1])
+        t, d = index._project(px[members, None], py[members, None], segments[None, :])
+        j = np.argmin(d, axis=1)
+        k = np.arange(len(members))
+        distance[members] = d[k, j]
+        chainage[members] = index.segment_start[segments[j]] + t[k, j] * index.segment_length[segments[j]]
+    return distance, chainage
+
+
+def median_ms(fn, runs):
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(times), result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stops", type=int, default=3000)
+    parser.add_argument("--vertices", type=int, default=40000)
+    parser.add_argument("--routes", type=int, default=40)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    lines, route_lines = make_routes(args.routes, args.vertices, rng)
+    stops = make_stops(lines, route_lines, args.stops, rng)
+    print(f"stops={len(stops)} lines={len(lines)} vertices={sum(len(line) for line in lines)}")
+
+    build_ms, index = median_ms(lambda: SegmentGridIndex(lines), args.runs)
+    print(f"  index build        {build_ms:>8.1f} ms  ({len(index.ax)} segments in {len(index.cell_keys)} cells)")
+    snap_ms, result = median_ms(lambda: snap_stops_to_routes(stops, index, route_lines), args.runs)
+    print(f"  snap + checks      {snap_ms:>8.1f} ms  (far {int(result['far'].sum())} / out of order {int(result['out_of_order'].sum())})")
+    line_of_stop = result["line"].to_numpy()
+    brute_ms, (distance, chainage) = median_ms(lambda: brute_force(index, stops, line_of_stop), max(1, args.runs // 2))
+    print(f"  brute force        {brute_ms:>8.1f} ms  (chosen lines only)")
+    print(f"  max |diff| vs brute force: distance {np.abs(distance - result['distance_m']).max():.2e} m / chainage {np.abs(chainage - result['chainage_m']).max():.2e} m")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,56 @@
+"""
+SheetsSync を偽の Sheets / Drive API (ローカル HTTP サーバ) に対して動かし、
+問い合わせ回数と所要時間、行単位の差分を表示する。外部ネットワークには接続しない。
+偽 API は tests/fake_apis.py にあり、tests/test_sheets_sync.py も同じものを使う。
+
+    python benchmarks/bench_sheets_sync.py [--students 5000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tests"))
+from fake_apis import SPREADSHEET_ID, FakeSheets, start_fake_api
+from sheets_sync import SheetsSync, build_services
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--students", type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    from google.auth.credentials import AnonymousCredentials
+
+    fake = FakeSheets(args.students)
+    server, endpoint = start_fake_api(fake)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sheets, drive = build_services(AnonymousCredentials(), api_endpoint=endpoint)
+        ranges = {"bus_stops": "bus_stops!A:H", "students": "students!A:I"}
+        sync = SheetsSync(sheets, drive, SPREADSHEET_ID, ranges, snapshot_path=os.path.join(tmp, "snapshot.json"))
+
+        def step(label, action=None):
+            if action: action()
+            fake.requests.clear()
+            t0 = time.perf_counter()
+            tables = sync.sync()
+            elapsed = (time.perf_counter() - t0) * 1000
+            calls = ", ".join(p.rsplit("/", 1)[-1] for p in fake.requests)
+            print(f"{label:<10} {elapsed:7.1f} ms  requests=[{calls}]  students={len(tables['students']) - 1}  diff={sync.stats['last_diff']}")
+
+        step("初回")
+        step("変更なし")
+        step("1行変更+1行追加", fake.edit)
+        step("変更なし")
+        # 再起動しても保存済みスナップショットから始められる
+        sync = SheetsSync(sheets, drive, SPREADSHEET_ID, ranges, snapshot_path=os.path.join(tmp, "snapshot.json"))
+        step("再起動後")
+    server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""
+起動 (コールドスタート) のベンチマーク: 新しい Python プロセスで
+- login_page : プロセス起動 → ログイン画面が出るまで (Python / Streamlit の起動を含む)
+- first_map  : ログイン → 最初の地図が出るまで (データ読み込み・地図の生成を含む)。
+               ログイン画面からパスワードを入れるまでの --think 秒は待ってから測る (その間に裏で重いモジュールを読み込む)
+を測る。ログイン画面が出た時点で読み込まれている重いモジュールも表示する (裏で読み込み中のものを含む)。
+
+データは合成データ (synthetic_data.py)。毎回プロセスを作り直すので、Streamlit のキャッシュも空の状態から測る。
+
+    python benchmarks/bench_startup.py [--students 10000] [--stops 2000] [--runs 3] [--think 3]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from synthetic_data import write_synthetic_data
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "specialexcel_app.py")
+HEAVY_MODULES = ["pandas", "numpy", "folium", "requests", "googleapiclient", "google.oauth2", "xml.etree.ElementTree"]
+
+# 子プロセスで動かす処理 (起動からの時間は子プロセスの中で測る)
+CHILD = """
+import json, logging, sys, time
+t0 = time.perf_counter()
+logging.disable(logging.WARNING)
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=600)
+at.secrets["app_password"] = "bench"
+at.run()
+login_page = time.perf_counter() - t0
+assert not at.exception and at.text_input[0].label == "パスワード", at.exception
+loaded = [m for m in json.loads(sys.argv[2]) if m in sys.modules]
+time.sleep(float(sys.argv[3]))
+at.session_state["logged_in"] = True
+t1 = time.perf_counter()
+at.run()
+first_map = time.perf_counter() - t1
+assert not at.exception and at.get("iframe"), at.exception
+print(json.dumps({"login_page": login_page, "first_map": first_map, "loaded_at_login": loaded}))
+"""
+
+
+def run_once(think):
+    t0 = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", CHILD, APP_PATH, json.dumps(HEAVY_MODULES), str(think)], capture_output=True, text=True, check=True).stdout
+    result = json.loads(out.strip().splitlines()[-1])
+    result["process_total"] = time.perf_counter() - t0 - think
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--students", type=int, default=10000)
+    parser.add_argument("--stops", type=int, default=2000)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--think", type=float, default=3.0, help="ログイン画面からログインするまでの秒数")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        write_synthetic_data(data_dir, args.students, args.stops)
+        results = []
+        for _ in range(args.runs):
+            with tempfile.TemporaryDirectory() as cache_dir:
+                os.environ.update({"BUS_DATA_DIR": data_dir, "BUS_CACHE_DIR": cache_dir})
+                results.append(run_once(args.think))
+
+    print(f"students={args.students} stops={args.stops} runs={args.runs} think={args.think}s")
+    for key in ("login_page", "first_map", "process_total"):  # process_total は think を除いた時間
+        values = [r[key] * 1000 for r in results]
+        print(f"  {key:<14} median {statistics.median(values):>7.0f} ms  (min {min(values):.0f} / max {max(values):.0f})")
+    print(f"  loaded at login page (incl. warm-up): {', '.join(results[-1]['loaded_at_login']) or '(none of ' + ', '.join(HEAVY_MODULES) + ')'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
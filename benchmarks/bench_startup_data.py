@@ -0,0 +1,78 @@
+"""
+データ読み込み (起動時・オフライン時) のベンチマーク: CSV 経由 と Feather スナップショット経由
+
+CSV 経由は従来と同じく UTF-8 で読んで失敗したら cp932 で読み直し、clean_df で文字列を整える。
+
+    python benchmarks/bench_startup_data.py [--students 10000] [--stops 2000] [--runs 5]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from data_store import clean_df, read_snapshot, write_snapshot
+
+ROUTES = ["井沼便", "東岩槻便", "美園便", "西原便", "諏訪便", "加倉便", "小溝便", "府内便"]
+
+
+def read_csv_legacy(path):
+    try:
+        return clean_df(pd.read_csv(path, encoding="utf-8"))
+    except UnicodeDecodeError:
+        return clean_df(pd.read_csv(path, encoding="cp932"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--students", type=int, default=10000)
+    parser.add_argument("--stops", type=int, default=2000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(0)
+    stops = pd.DataFrame({
+        "schedule_type": [rng.choice(["通常", "時差", "高等部"]) for _ in range(args.stops)],
+        "route": [ROUTES[i % len(ROUTES)] for i in range(args.stops)],
+        "stop_name": [f"バス停{i}" for i in range(args.stops)],
+        "lat": [35.9 + rng.random() / 10 for _ in range(args.stops)],
+        "lng": [139.6 + rng.random() / 10 for _ in range(args.stops)],
+        "sequence": list(range(args.stops)), "time_to": "8:00", "time_from": "15:00",
+    })
+    students = pd.DataFrame({
+        "name": [f"生徒 {i}" for i in range(args.students)],
+        "route_normal": [rng.choice(ROUTES) for _ in range(args.students)],
+        "stop_normal": [f"バス停{rng.randrange(args.stops)}" for _ in range(args.students)],
+        "direction": [rng.choice(["登校", "下校", "登下校"]) for _ in range(args.students)],
+    })
+    with tempfile.TemporaryDirectory() as tmp:
+        stops_path, students_path = os.path.join(tmp, "bus_stops.csv"), os.path.join(tmp, "students.csv")
+        stops.to_csv(stops_path, index=False, encoding="cp932")  # 同梱の bus_stops.csv と同じ cp932
+        students.to_csv(students_path, index=False, encoding="cp932")
+        s_df, st_df = read_csv_legacy(stops_path), read_csv_legacy(students_path)
+        write_snapshot(os.path.join(tmp, "snapshot"), s_df, st_df, "csv")
+
+        def bench(fn):
+            timings = []
+            for _ in range(args.runs):
+                t0 = time.perf_counter(); fn(); timings.append(time.perf_counter() - t0)
+            return statistics.median(timings) * 1000
+
+        t_csv = bench(lambda: (read_csv_legacy(stops_path), read_csv_legacy(students_path)))
+        t_snap = bench(lambda: read_snapshot(os.path.join(tmp, "snapshot")))
+        snap_stops, snap_students, _ = read_snapshot(os.path.join(tmp, "snapshot"))
+        print(f"students={args.students} stops={args.stops}")
+        print(f"CSV (utf-8 -> cp932 retry + clean_df): {t_csv:8.1f} ms")
+        print(f"Feather snapshot:                      {t_snap:8.1f} ms")
+        mem = lambda df: df.memory_usage(deep=True).sum() / 1024
+        print(f"memory: CSV frames {mem(s_df) + mem(st_df):,.0f} KiB / snapshot frames {mem(snap_stops) + mem(snap_students):,.0f} KiB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+"""
+アプリ全体のベンチマークスイート (結果を履歴に残して、前回までと比べる)
+
+合成データ (synthetic_data.py) を一時ディレクトリに書き出し、Streamlit の AppTest でアプリをヘッドレス実行して
+次の操作ごとの時間を測る。段階ごとの時間はアプリの計測 (BUS_PROFILE=1) の記録から取る。
+
+- load_cold       : 最初の実行 (CSV 読み込み・スケジュールごとのデータ構築を含む)
+- rerun_warm      : 何も変えずに再実行
+- schedule_switch : 通常便 → 小中時差便 → 高時差便 の切り替え (地図は初回生成)
+- mode_toggle     : 表示モード (登校 / 下校 / すべて) と路線選択の切り替え (地図は表示条件ごとに作り、共有キャッシュに置く)
+- name_search     : 名前検索の入力
+- nearest_stop    : 住所で最寄りバス停検索 (住所キャッシュに入れておくので外部APIには問い合わせない)
+- map_build       : 地図の生成 + HTML 化 (map_build + map_render の段階の中央値)
+- table_build     : 時刻表の作成 (route_tables の段階の中央値)
+
+結果は --history (既定: benchmarks/results/history.jsonl) に1行追記し、同じ規模の直近 --baseline 件の中央値と比べる。
+--check を付けると、--tolerance を超えて遅くなった項目があれば終了コード 1 で終わる。
+
+    python benchmarks/bench_suite.py [--students 10000] [--stops 2000] [--runs 3] [--check]
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from synthetic_data import write_synthetic_data
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "specialexcel_app.py")
+DEFAULT_HISTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", "history.jsonl")
+SCHEDULE_MODES = ["通常便", "小中時差便", "高時差便"]
+DISPLAY_MODES = ["🌙 下校 (帰り)", "🔄 すべて (全体)", "☀️ 登校 (行き)"]
+SEARCH_QUERIES = ["佐藤", "すずき", "高橋 健", "ｻﾄｳ"]
+ADDRESSES = ["ベンチ市本町1-1", "ベンチ市岩槻2-3", "ベンチ市東町4-5"]
+
+
+def git_revision():
+    root = os.path.dirname(APP_PATH)
+    try:
+        sha = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=root, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=root, capture_output=True, text=True).stdout.strip())
+        return sha + ("+dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def seed_geocode_cache(cache_dir, data_dir):
+    """ベンチ用の住所を、通常便のバス停の近くの座標として住所キャッシュに入れておく"""
+    import pandas as pd
+    from geocoding import GeocodeCache
+    stops = pd.read_csv(os.path.join(data_dir, "bus_stops.csv"))
+    stops = stops[stops["schedule_type"] == "通常"]
+    cache = GeocodeCache(os.path.join(cache_dir, "geocode.sqlite3"))
+    for i, address in enumerate(ADDRESSES):
+        stop = stops.iloc[(i * 37) % len(stops)]
+        cache.put(address, float(stop["lat"]) + 0.001, float(stop["lng"]) - 0.001, "ベンチ")
+
+
+def timed_run(at):
+    t0 = time.perf_counter()
+    at.run()
+    elapsed = (time.perf_counter() - t0) * 1000
+    if at.exception: raise RuntimeError(at.exception[0].value)
+    return elapsed
+
+
+def last_profile(at):
+    return at.session_state["profile_history"][-1]
+
+
+def widget(elements, label):
+    return [e for e in elements if e.label == label][0]
+
+
+def run_suite(runs):
+    from streamlit.testing.v1 import AppTest
+    metrics = {k: [] for k in ("load_cold", "rerun_warm", "schedule_switch", "mode_toggle", "name_search", "nearest_stop")}
+    map_build, table_build = [], []
+
+    def collect(at):
+        spans = last_profile(at)["spans"]
+        if "map_build" in spans: map_build.append(spans["map_build"] + spans.get("map_render", 0.0))
+        if "route_tables" in spans: table_build.append(spans["route_tables"])
+
+    for _ in range(runs):
+        # st.cache_* はプロセス内で共有されるので、毎回消してから「起動直後」を測る
+        import streamlit as st
+        st.cache_data.clear(); st.cache_resource.clear()
+        at = AppTest.from_file(APP_PATH, default_timeout=600)
+        at.secrets["app_password"] = "bench"
+        at.session_state["logged_in"] = True
+        metrics["load_cold"].append(timed_run(at)); collect(at)
+        metrics["rerun_warm"].append(timed_run(at)); collect(at)
+        for mode in SCHEDULE_MODES[1:] + SCHEDULE_MODES[:1]:
+            widget(at.sidebar.selectbox, "📅 運行スケジュール").select(mode)
+            metrics["schedule_switch"].append(timed_run(at)); collect(at)
+        for display_mode in DISPLAY_MODES:
+            widget(at.sidebar.radio, "表示モード").set_value(display_mode)
+            metrics["mode_toggle"].append(timed_run(at)); collect(at)
+        route_select = widget(at.sidebar.selectbox, "📍 路線選択")
+        for route in route_select.options[1:3] + route_select.options[:1]:
+            widget(at.sidebar.selectbox, "📍 路線選択").select(route)
+            metrics["mode_toggle"].append(timed_run(at)); collect(at)
+        for query in SEARCH_QUERIES:
+            widget(at.sidebar.text_input, "名前検索").input(query)
+            metrics["name_search"].append(timed_run(at)); collect(at)
+        widget(at.sidebar.text_input, "名前検索").input("")
+        at.run()
+        for address in ADDRESSES:
+            widget(at.sidebar.text_input, "住所を入力").input(address)
+            widget(at.sidebar.button, "最寄りバス停を探す").click()
+            metrics["nearest_stop"].append(timed_run(at)); collect(at)
+    metrics["map_build"], metrics["table_build"] = map_build, table_build
+    return {k: round(statistics.median(v), 2) for k, v in metrics.items() if v}
+
+
+def read_history(path):
+    if not os.path.exists(path): return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(result, history, baseline, tolerance):
+    """同じ規模の直近 baseline 件の中央値と比べる。戻り値: [(項目, 今回, 基準, 比)]"""
+    same_scale = [h for h in history if h["students"] == result["students"] and h["stops"] == result["stops"]][-baseline:]
+    rows = []
+    for key, value in result["metrics"].items():
+        past = [h["metrics"][key] for h in same_scale if key in h["metrics"]]
+        if not past:
+            rows.append((key, value, None, None)); continue
+        reference = statistics.median(past)
+        rows.append((key, value, reference, value / reference if reference else None))
+    regressions = [r for r in rows if r[3] is not None and r[3] > 1 + tolerance]
+    return rows, regressions
+
+
+def main(argv=None):
+    logging.disable(logging.WARNING)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--students", type=int, default=10000)
+    parser.add_argument("--stops", type=int, default=2000)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--history", default=DEFAULT_HISTORY)
+    parser.add_argument("--baseline", type=int, default=5, help="比較に使う直近の記録の件数")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="これを超えて遅くなったら劣化とみなす (0.25 = 25%%)")
+    parser.add_argument("--check", action="store_true", help="劣化があれば終了コード 1")
+    parser.add_argument("--no-record", action="store_true", help="履歴に追記しない")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as data_dir, tempfile.TemporaryDirectory() as cache_dir:
+        write_synthetic_data(data_dir, args.students, args.stops)
+        seed_geocode_cache(cache_dir, data_dir)
+        os.environ.update({"BUS_DATA_DIR": data_dir, "BUS_CACHE_DIR": cache_dir, "BUS_PROFILE": "1"})
+        os.environ.pop("BUS_PROFILE_LOG", None)
+        metrics = run_suite(args.runs)
+
+    result = {"ts": time.time(), "revision": git_revision(), "students": args.students, "stops": args.stops, "runs": args.runs, "metrics": metrics}
+    history = read_history(args.history)
+    rows, regressions = compare(result, history, args.baseline, args.tolerance)
+    print(f"students={args.students} stops={args.stops} runs={args.runs} revision={result['revision']}")
+    for key, value, reference, ratio in rows:
+        if reference is None: print(f"  {key:<16} {value:>9.1f} ms")
+        else: print(f"  {key:<16} {value:>9.1f} ms  (基準 {reference:.1f} ms, {ratio:.2f}x){'  ← 劣化' if ratio and ratio > 1 + args.tolerance else ''}")
+    if not args.no_record:
+        os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+        with open(args.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+    if regressions and args.check:
+        print(f"{len(regressions)} 項目が {args.tolerance:.0%} を超えて遅くなりました")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
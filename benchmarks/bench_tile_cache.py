@@ -0,0 +1,94 @@
+"""
+地図タイルのキャッシュ / 中継サーバ (tile_cache.py) の動作確認とベンチマーク
+
+ローカルのスタブ HTTP サーバを上流 (国土地理院の代わり) にして、外部ネットワークには接続しない。
+- 先読み (prefetch): 1回目は上流から、2回目はディスクから
+- 中継サーバ: ETag / If-None-Match → 304 / Cache-Control
+- サイズ上限を小さくしたときの LRU 削除
+
+    python benchmarks/bench_tile_cache.py [--latency 0.02] [--zooms 14 15 16]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from tile_cache import TileProxy, TileStore, prefetch, serve, tiles_for_bbox
+
+BBOX = (35.93, 139.65, 36.03, 139.75)  # 岩槻周辺
+
+
+class QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass
+
+
+def start_upstream(latency, counter):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            counter["requests"] += 1
+            time.sleep(latency)
+            if self.path.startswith("/xyz/pale/0/"):
+                self.send_response(404); self.end_headers(); return
+            body = ("tile " + self.path).encode("utf-8") * 200  # 数KBの偽タイル
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.end_headers()
+            self.wfile.write(body)
+    server = QuietServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.02, help="上流の1枚あたりの応答時間 [s]")
+    parser.add_argument("--zooms", type=int, nargs="+", default=[14, 15, 16])
+    args = parser.parse_args(argv)
+
+    counter = {"requests": 0}
+    upstream, upstream_url = start_upstream(args.latency, counter)
+    sources = {"pale": (upstream_url + "/xyz/pale/{z}/{x}/{y}.png", "png", "stub")}
+    with tempfile.TemporaryDirectory() as cache_dir:
+        proxy = TileProxy(TileStore(cache_dir), sources=sources)
+        n_tiles = len(tiles_for_bbox(*BBOX, zooms=args.zooms))
+        print(f"bbox tiles at zooms {args.zooms}: {n_tiles} (serial estimate {n_tiles * args.latency:.1f}s)")
+        for label in ("prefetch (cold)", "prefetch (warm)"):
+            before = counter["requests"]
+            stats = prefetch(proxy, "pale", BBOX, zooms=args.zooms, max_workers=8)
+            print(f"{label:<16} {stats['seconds']:.2f}s upstream requests={counter['requests'] - before} {stats}")
+        print(f"store: {len(proxy.store)} tiles / {proxy.store.total_bytes / 1024:.0f} KiB")
+
+        server = serve(proxy, port=0)
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        z, x, y = tiles_for_bbox(*BBOX, zooms=args.zooms[:1])[0]
+        res = requests.get(f"{base}/tiles/pale/{z}/{x}/{y}.png")
+        print(f"proxy GET: {res.status_code} {res.headers['Content-Type']} ETag={res.headers['ETag']} Cache-Control={res.headers['Cache-Control']}")
+        res = requests.get(f"{base}/tiles/pale/{z}/{x}/{y}.png", headers={"If-None-Match": res.headers["ETag"]})
+        print(f"proxy conditional GET: {res.status_code} (body {len(res.content)} bytes)")
+        print(f"proxy unknown source: {requests.get(f'{base}/tiles/nope/1/1/1.png').status_code}")
+        print(f"proxy upstream 404: {requests.get(f'{base}/tiles/pale/0/0/0.png').status_code}")
+        server.shutdown()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        limit = 200 * 1024
+        proxy = TileProxy(TileStore(cache_dir, max_bytes=limit), sources=sources)
+        stats = prefetch(proxy, "pale", BBOX, zooms=args.zooms[:1], max_workers=8)
+        print(f"LRU with {limit // 1024} KiB limit: stored {proxy.store.total_bytes / 1024:.0f} KiB in {len(proxy.store)} tiles, evicted {proxy.store.evictions}")
+    upstream.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,43 @@
+"""
+路線 GeoJSON の送信データ量レポート (スケジュールごと)
+
+元ファイル / 座標の丸めのみ / 丸め+Douglas–Peucker 簡略化 / Encoded Polyline のバイト数を比較する。
+
+    python benchmarks/route_payload_report.py [--decimals 5] [--zoom 16] [--data-dir data]
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from geo_utils import geojson_size_report, meters_per_pixel
+
+SCHEDULE_FILES = {"通常便": "routes.geojson", "小中時差便": "routes_jisa.geojson", "高時差便": "routes_kotobu.geojson"}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--decimals", type=int, default=5)
+    parser.add_argument("--zoom", type=int, default=16, help="この縮尺で 0.5px 未満のずれを間引く")
+    parser.add_argument("--data-dir", default=os.environ.get("BUS_DATA_DIR", "data"))
+    args = parser.parse_args(argv)
+
+    print(f"{'schedule':<10} {'file':<22} {'original':>9} {'quantized':>10} {'simplified':>11} {'polyline':>9}  vertices")
+    for schedule, file_name in SCHEDULE_FILES.items():
+        path = os.path.join(args.data_dir, file_name)
+        if not os.path.exists(path): continue
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        lats = [c[1] for ft in data["features"] if ft["geometry"]["type"] == "LineString" for c in ft["geometry"]["coordinates"]]
+        tolerance_m = meters_per_pixel(args.zoom, sum(lats) / len(lats)) / 2 if lats else 0
+        r = geojson_size_report(data, tolerance_m, args.decimals)
+        print(
+            f"{schedule:<10} {file_name:<22} {r['original_bytes']:>9,} {r['quantized_bytes']:>10,} "
+            f"{r['simplified_bytes']:>11,} {r['polyline_bytes']:>9,}  {r['original_vertices']} -> {r['simplified_vertices']}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+ベンチマーク用の合成データ (バス停 / 生徒 / 路線GeoJSON) を作る
+
+- 3種類の便 (通常 / 時差 / 高等部) のバス停を、アプリの ROUTE_COLORS にある便名で作る
+- バス停は便ごとに少しずつ進む経路上に並べ、その経路を路線GeoJSON (routes*.geojson) として書き出す
+- 生徒は 小学部/中学部/高等部 に分け、通常便 + (小中は時差便 / 高等部は高時差便) に割り当てる。区分は 登校/下校/登下校
+
+    python benchmarks/synthetic_data.py OUT_DIR [--students 10000] [--stops 2000] [--encoding cp932]
+"""
+import argparse
+import ast
+import json
+import os
+import random
+import sys
+
+import pandas as pd
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "specialexcel_app.py")
+
+# schedule_type → (生徒の路線列, 生徒のバス停列, GeoJSON ファイル名)
+SCHEDULE_TYPES = {
+    "通常": ("route_normal", "stop_normal", "routes.geojson"),
+    "時差": ("route_jisa", "stop_jisa", "routes_jisa.geojson"),
+    "高等部": ("route_kotobu", "stop_kotobu", "routes_kotobu.geojson"),
+}
+FAMILY_NAMES = ["佐藤", "鈴木", "高橋", "田中", "伊藤", "渡辺", "山本", "中村", "小林", "加藤", "吉田", "山田", "佐々木", "山口", "松本", "井上", "木村", "林", "斎藤", "清水"]
+GIVEN_NAMES = ["健", "翔", "花子", "未来", "陽菜", "結衣", "蓮", "湊", "大翔", "美咲", "さくら", "はると", "ゆい", "ソウタ", "ユイナ", "悠真", "葵", "凛", "樹", "楓"]
+PLACE_NAMES = ["本町", "岩槻", "東町", "西町", "南平野", "北原", "加倉", "諏訪", "美園", "府内", "蓮田", "小溝", "井沼", "西原", "城町", "宮町", "太田", "大口"]
+
+
+def load_route_names(app_path=APP_PATH):
+    """アプリの ROUTE_COLORS の便名 (アプリを import せずにソースから読む)"""
+    with open(app_path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(t, "id", None) == "ROUTE_COLORS" for t in node.targets):
+            return list(ast.literal_eval(node.value))
+    raise ValueError("ROUTE_COLORS not found")
+
+
+def routes_by_schedule(route_names):
+    """便名を schedule_type ごとに分ける (小中… → 時差 / 高等部… → 高等部 / それ以外 → 通常)"""
+    groups = {t: [] for t in SCHEDULE_TYPES}
+    for name in route_names:
+        if name.startswith("小中"): groups["時差"].append(name)
+        elif name.startswith("高等部"): groups["高等部"].append(name)
+        else: groups["通常"].append(name)
+    return groups
+
+
+def make_stops(n_stops, route_groups, rng):
+    """便ごとに経路を歩かせてバス停を置く。全便の合計がおおよそ n_stops 件"""
+    all_routes = [(t, r) for t, routes in route_groups.items() for r in routes]
+    per_route = max(2, n_stops // max(len(all_routes), 1))
+    stops = []
+    for schedule_type, route in all_routes:
+        lat, lng = 35.93 + rng.random() * 0.1, 139.65 + rng.random() * 0.1
+        heading_lat, heading_lng = rng.uniform(-1, 1), rng.uniform(-1, 1)
+        for seq in range(1, per_route + 1):
+            lat += (heading_lat + rng.uniform(-0.5, 0.5)) * 0.003
+            lng += (heading_lng + rng.uniform(-0.5, 0.5)) * 0.003
+            minutes_to, minutes_from = 7 * 60 + 30 + seq * 3, 15 * 60 + seq * 3
+            stops.append({
+                "schedule_type": schedule_type, "route": route,
+                "stop_name": f"{rng.choice(PLACE_NAMES)}{seq}丁目{route[:2]}",
+                "lat": round(lat, 8), "lng": round(lng, 8), "sequence": seq,
+                "time_to": f"{minutes_to // 60}:{minutes_to % 60:02d}", "time_from": f"{minutes_from // 60}:{minutes_from % 60:02d}",
+            })
+    return stops
+
+
+def make_students(n_students, stops, rng):
+    stops_by_type = {t: [s for s in stops if s["schedule_type"] == t] for t in SCHEDULE_TYPES}
+    students = []
+    for _ in range(n_students):
+        department = rng.choices(["小学部", "中学部", "高等部"], weights=[4, 3, 3])[0]
+        normal = rng.choice(stops_by_type["通常"]) if stops_by_type["通常"] else None
+        extra_type = "高等部" if department == "高等部" else "時差"
+        extra = rng.choice(stops_by_type[extra_type]) if stops_by_type[extra_type] else None
+        row = {
+            "name": f"{rng.choice(FAMILY_NAMES)} {rng.choice(GIVEN_NAMES)}",
+            "department": department,
+            "route": normal["route"] if normal else "", "stop_name": normal["stop_name"] if normal else "",
+            "direction": rng.choice(["登校", "下校", "登下校"]),
+        }
+        for t, (route_col, stop_col, _) in SCHEDULE_TYPES.items():
+            hit = normal if t == "通常" else (extra if t == extra_type else None)
+            row[route_col] = hit["route"] if hit else ""
+            row[stop_col] = hit["stop_name"] if hit else ""
+        students.append(row)
+    return students
+
+
+def write_synthetic_data(data_dir, n_students, n_stops, seed=0, encoding="utf-8"):
+    """data_dir に bus_stops.csv / students.csv / routes*.geojson を書き出す。戻り値: {schedule_type: [便名]}"""
+    rng = random.Random(seed)
+    route_groups = routes_by_schedule(load_route_names())
+    stops = make_stops(n_stops, route_groups, rng)
+    students = make_students(n_students, stops, rng)
+    os.makedirs(data_dir, exist_ok=True)
+    pd.DataFrame(stops).to_csv(os.path.join(data_dir, "bus_stops.csv"), index=False, encoding=encoding)
+    pd.DataFrame(students).to_csv(os.path.join(data_dir, "students.csv"), index=False, encoding=encoding)
+    for schedule_type, (_, _, geojson_name) in SCHEDULE_TYPES.items():
+        features = []
+        for route in route_groups[schedule_type]:
+            coords = [[s["lng"], s["lat"]] for s in stops if s["route"] == route]
+            # 実データと同じく、便名はプロパティのキーに入っている
+            features.append({"type": "Feature", "properties": {route: ""}, "geometry": {"type": "LineString", "coordinates": coords}})
+        with open(os.path.join(data_dir, geojson_name), "w", encoding="utf-8") as f:
+            json.dump({"type": "FeatureCollection", "features": features}, f, ensure_ascii=False)
+    return route_groups
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("out_dir")
+    parser.add_argument("--students", type=int, default=10000)
+    parser.add_argument("--stops", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--encoding", default="utf-8", help="CSV の文字コード (実データと同じ cp932 も可)")
+    args = parser.parse_args(argv)
+    route_groups = write_synthetic_data(args.out_dir, args.students, args.stops, args.seed, args.encoding)
+    print(f"wrote {args.out_dir}: students={args.students} routes=" + " / ".join(f"{t} {len(r)}" for t, r in route_groups.items()))
+    return 0
+
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""
+住所リスト (CSV) からの最寄りバス停の一括割り当て
+
+1. 住所を正規化して重複をまとめ、GeocodeCache にあるものはそのまま使う
+2. 残りは同時実行数を制限したスレッドで並列にジオコーディングし、1件終わるごとにキャッシュへ保存する
+   (途中で止まっても、もう一度実行すれば終わっていない住所だけを問い合わせる = 再開できる)。
+   search は住所1件ずつ逐次に問い合わせる search_address_ultimate が既定: 同時に出る問い合わせは max_workers 件まで。
+   画面の住所検索と共有する RacingGeocoder に渡すと、1件で最大6件の問い合わせが対話的な検索の順番待ちを作る。
+   サービスに接続できなかった住所 (GeocodeUnavailable) はキャッシュせず、geocode_source を UNAVAILABLE_SOURCE にする
+3. 便 (schedule_type) ごとの StopGridIndex でまとめて最寄り k 件を引き、
+   route_normal / stop_normal (jisa / kotobu) の候補列を付けて返す
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+from geocoding import GeocodeUnavailable, normalize_address, search_address_ultimate
+
+ADDRESS_COLUMN_CANDIDATES = ("address", "住所")
+UNAVAILABLE_SOURCE = "接続できず (再実行で再試行)"
+
+def guess_address_column(df):
+    """住所の列名を推測する (見つからなければ先頭の列)"""
+    for col in ADDRESS_COLUMN_CANDIDATES:
+        if col in df.columns: return col
+    return df.columns[0] if len(df.columns) else None
+
+def geocode_many(addresses, cache, search=search_address_ultimate, max_workers=8, progress=None):
+    """
+    住所のリストをジオコーディングする。戻り値: {正規化した住所: (lat, lng, provider)}
+    接続できなかった住所は (None, None, UNAVAILABLE_SOURCE) (キャッシュには保存しない)。
+    progress(済んだ件数, 全件数) は呼び出し元のスレッドから呼ぶ (st.progress を直接渡せる)。
+    """
+    keys = list(dict.fromkeys(normalize_address(str(a)) for a in addresses if str(a).strip()))
+    results = cache.get_many(keys)
+    todo = [key for key in keys if key not in results]
+    done = len(results)
+    if progress: progress(done, len(keys))
+    def lookup(key):
+        try:
+            lat, lng, provider = search(key)
+        except GeocodeUnavailable:
+            return None, None, UNAVAILABLE_SOURCE
+        cache.put(key, lat, lng, provider)
+        return lat, lng, provider
+    if todo:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bulk-geocode") as executor:
+            futures = {executor.submit(lookup, key): key for key in todo}
+            for future in as_completed(futures):
+                try:
+                    results[futures[future]] = future.result()
+                except Exception:
+                    results[futures[future]] = (None, None, None)
+                done += 1
+                if progress: progress(done, len(keys))
+    return results
+
+def assign_nearest_stops(addresses_df, address_col, geocoded, schedules, k=3):
+    """
+    schedules: {便名: (StopGridIndex, route_col, stop_col)}
+    戻り値: addresses_df に lat / lng / geocode_source と、便ごとの
+            route_col / stop_col (最寄り) / {stop_col}_distance / {stop_col}_candidates (近い順 k 件) を足したもの
+    """
+    out = addresses_df.copy()
+    points = [geocoded.get(normalize_address(str(a)), (None, None, None)) for a in out[address_col]]
+    lats = np.array([p[0] if p[0] is not None else np.nan for p in points], dtype=float)
+    lngs = np.array([p[1] if p[1] is not None else np.nan for p in points], dtype=float)
+    out["lat"], out["lng"] = lats, lngs
+    out["geocode_source"] = [p[2] or "" for p in points]
+    for grid_index, route_col, stop_col in schedules.values():
+        idx, dist = grid_index.query_many(lats, lngs, k)
+        stop_routes = grid_index.stops["route"].astype(str).to_numpy()
+        stop_names = grid_index.stops["stop_name"].astype(str).to_numpy()
+        hit = idx[:, 0] >= 0
+        safe = np.where(hit, idx[:, 0], 0)
+        out[route_col] = np.where(hit, stop_routes[safe], "") if len(stop_routes) else ""
+        out[stop_col] = np.where(hit, stop_names[safe], "") if len(stop_names) else ""
+        out[f"{stop_col}_distance"] = np.where(hit, np.round(dist[:, 0]), np.nan)
+        out[f"{stop_col}_candidates"] = [
+            " / ".join(f"{stop_routes[i]}:{stop_names[i]}({int(round(d))}m)" for i, d in zip(row_idx, row_dist) if i >= 0)
+            for row_idx, row_dist in zip(idx, dist)
+        ]
+    return out
+
+def find_nearest_stops_batch(grid_index, queries, geocode, k=3):
+    """
+    住所文字列 または (lat, lng) のリストを受け取り、それぞれの最寄りバス停 k 件を1回の検索で返す。
+    住所は geocode(住所) → (lat, lng, provider) で座標にする。
+    戻り値: 1件ごとに {"query", "lat", "lng", "source", "stops": DataFrame (distance 列付き)} の辞書のリスト
+    """
+    points = []
+    for q in queries:
+        if isinstance(q, str): points.append(geocode(q))
+        else: points.append((float(q[0]), float(q[1]), "座標"))
+    lats = np.array([p[0] if p[0] is not None else np.nan for p in points], dtype=float)
+    lngs = np.array([p[1] if p[1] is not None else np.nan for p in points], dtype=float)
+    idx, dist = grid_index.query_many(lats, lngs, k)
+    results = []
+    for q, (lat, lng, source), row_idx, row_dist in zip(queries, points, idx, dist):
+        hit = row_idx >= 0
+        results.append({
+            "query": q, "lat": lat, "lng": lng, "source": source,
+            "stops": grid_index.stops.iloc[row_idx[hit]].assign(distance=row_dist[hit]),
+        })
+    return results
+
+def bulk_assign(addresses_df, address_col, cache, schedules, search=search_address_ultimate, k=3, max_workers=8, progress=None):
+    """geocode_many → assign_nearest_stops"""
+    geocoded = geocode_many(addresses_df[address_col].tolist(), cache, search, max_workers=max_workers, progress=progress)
+    return assign_nearest_stops(addresses_df, address_col, geocoded, schedules, k=k)
+
+def to_download_csv(df):
+    """Excel でそのまま開ける CSV (BOM 付き UTF-8)"""
+    return df.to_csv(index=False).encode("utf-8-sig")
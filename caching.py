@@ -0,0 +1,224 @@
+"""
+プロセス内で共有する小さなキャッシュ
+
+- LRUCache: 件数 (と任意でおおよそのバイト数) に上限のある LRU
+- SharedViewCache: 全セッション共有の計算結果キャッシュ。キーは データの版 (data_version) + 種類 + 条件。
+  直近に使われた2つのデータの版だけを持ち、それより前の版のものはまとめて捨てる
+- BackgroundRefresher: 値を一定間隔で別スレッドで読み直して入れ替える (読み直し中・失敗時は前の値を返し続ける)。
+  seed を渡すと最初の値はそこから取り、本来の読み込みはすぐ裏で行う
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+def estimate_size(value):
+    """おおよそのメモリ使用量 (バイト)。DataFrame は中身まで数える"""
+    if isinstance(value, pd.DataFrame): return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series): return int(value.memory_usage(deep=True))
+    if isinstance(value, (list, tuple, set)): return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    if isinstance(value, dict): return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    return sys.getsizeof(value)
+
+class LRUCache:
+    """
+    件数上限つきの LRU キャッシュ (スレッドセーフ)。hits / misses / evictions を数える。
+    max_bytes を指定すると、estimate_size で見積もった合計がそれを超えないようにも捨てる。
+    """
+    def __init__(self, max_entries=32, max_bytes=None, sizeof=estimate_size):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._data = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        with self._lock:
+            self.bytes += size - self._sizes.get(key, 0)
+            self._data[key] = value
+            self._sizes[key] = size
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries or (self.max_bytes is not None and self.bytes > self.max_bytes and len(self._data) > 1):
+                old_key, _ = self._data.popitem(last=False)
+                self.bytes -= self._sizes.pop(old_key)
+                self.evictions += 1
+
+    def discard_if(self, predicate):
+        """predicate(key) が真のものを捨てる。戻り値: 捨てた件数"""
+        with self._lock:
+            keys = [k for k in self._data if predicate(k)]
+            for k in keys:
+                del self._data[k]
+                self.bytes -= self._sizes.pop(k)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+class SharedViewCache:
+    """
+    get_or_compute(data_version, "map", 条件, 計算する関数) の形で使う。
+    条件は hash できる値 (タプルなど)。返した値は全セッションで共有されるので、呼び出し側で書き換えないこと。
+    データの読み直しの直後は新旧の版のセッションが混在するので、直近に使われた keep_versions 個の版は
+    どれも残す (版ごとの件数は LRU に任せる)。
+    """
+    def __init__(self, max_entries=256, max_bytes=256 * 1024 * 1024, keep_versions=2):
+        self.cache = LRUCache(max_entries=max_entries, max_bytes=max_bytes)
+        self.keep_versions = keep_versions
+        self.versions = []  # 残している版 (使われた順。最後が直近)
+        self.invalidations = 0
+        self.stats = {}  # 種類 → {"hits", "misses"}
+        self._lock = threading.Lock()
+
+    @property
+    def data_version(self):
+        """直近に使われた版"""
+        return self.versions[-1] if self.versions else None
+
+    def _use_version(self, data_version):
+        """版を直近に使われたものにし、keep_versions 個に入らなくなった版のものを捨てる"""
+        with self._lock:
+            if self.versions and self.versions[-1] == data_version: return
+            known = data_version in self.versions
+            self.versions = [v for v in self.versions if v != data_version] + [data_version]
+            if known: return
+            self.versions, dropped = self.versions[-self.keep_versions:], set(self.versions[:-self.keep_versions])
+            if dropped: self.invalidations += self.cache.discard_if(lambda key: key[0] in dropped)
+
+    def get(self, data_version, namespace, params):
+        self._use_version(data_version)
+        value = self.cache.get((data_version, namespace, params))
+        with self._lock:
+            counter = self.stats.setdefault(namespace, {"hits": 0, "misses": 0})
+            counter["hits" if value is not None else "misses"] += 1
+        return value
+
+    def put(self, data_version, namespace, params, value):
+        self._use_version(data_version)
+        self.cache.put((data_version, namespace, params), value)
+
+    def get_or_compute(self, data_version, namespace, params, compute):
+        """戻り値: (値, キャッシュにあったか)"""
+        value = self.get(data_version, namespace, params)
+        if value is not None: return value, True
+        value = compute()
+        self.put(data_version, namespace, params, value)
+        return value, False
+
+    def summary(self):
+        with self._lock: by_namespace = {k: dict(v) for k, v in self.stats.items()}
+        return {
+            "entries": len(self.cache), "bytes": self.cache.bytes, "max_bytes": self.cache.max_bytes,
+            "evictions": self.cache.evictions, "invalidations": self.invalidations,
+            "by_namespace": by_namespace,
+        }
+
+class BackgroundRefresher:
+    """
+    load(前の値) の結果を持ち、interval 秒ごとに別スレッドで読み直して入れ替える (stale-while-revalidate)。
+    get() が待つのは最初の読み込みだけ (同時に来た呼び出しは同じ1回を待つ)。以降は読み直しの最中でも
+    最後に読めた値をすぐ返す。読み直しに失敗したら前の値のまま、retry_interval 秒後にもう一度試す。
+    seed() を渡すと、最初の get() は load の代わりにその値 (手元の保存データなど) を返し、load はすぐ裏で呼ぶ。
+    seed() が None を返すか失敗したら、最初の get() は load を待つ。
+    """
+    def __init__(self, load, interval=600, retry_interval=60, seed=None):
+        self.load = load
+        self.seed = seed
+        self.interval = interval
+        self.retry_interval = retry_interval
+        self.value = None
+        self.loaded_at = None  # 最後に読めた時刻 (time.time())
+        self.last_duration = None  # 直近の読み込みにかかった秒数 (失敗も含む)
+        self.refreshes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_error = None
+        self._load_lock = threading.Lock()  # 読み込みは同時に1つだけ
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = None
+
+    def get(self):
+        """最後に読めた値。まだ何も読めていなければ読み込みを待つ (失敗したら例外)"""
+        value = self.value
+        if value is not None: return value
+        with self._load_lock:
+            if self.value is None and self.seed is not None:
+                try: seeded = self.seed()
+                except Exception: seeded = None
+                if seeded is not None:
+                    self.value, self.loaded_at = seeded, time.time()
+                    self._wake.set()  # 本来の読み込みは待たずに裏で
+            if self.value is None: self._reload()
+            # 最初の読み込みを一緒に待っていた呼び出しが、それぞれスレッドを起こさないようにロックの中で確かめる
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="BackgroundRefresher", daemon=True)
+                self._thread.start()
+        return self.value
+
+    def _reload(self):
+        t0 = time.perf_counter()
+        try:
+            value = self.load(self.value)
+        except Exception as e:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.last_duration = time.perf_counter() - t0
+        # 値の入れ替えは代入1回なので、読む側が途中の状態を見ることはない
+        self.value, self.loaded_at = value, time.time()
+        self.refreshes += 1
+        self.consecutive_failures = 0
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.retry_interval if self.consecutive_failures else self.interval)
+            self._wake.clear()
+            if self._stopped: break
+            with self._load_lock:
+                try: self._reload()
+                except Exception: pass
+
+    def refresh_now(self):
+        """次の読み直しを待たずに、すぐ裏で読み直す"""
+        self._wake.set()
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+
+    def status(self):
+        return {
+            "age_s": time.time() - self.loaded_at if self.loaded_at else None,
+            "last_duration_s": self.last_duration, "refreshing": self._load_lock.locked(),
+            "refreshes": self.refreshes, "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures, "last_error": self.last_error,
+        }
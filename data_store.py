@@ -0,0 +1,133 @@
+"""
+バス停・生徒データの読み込みと、ローカルの列指向スナップショット (Feather)
+
+読み込みに成功するたびに、正規化・型付け済みの DataFrame を Feather で保存しておき、
+起動時や Google Sheets に繋がらないときはそこから直接読み込む (CSV の再パース・文字コード判定を省く)。
+"""
+import io
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+# カテゴリ型にする列 (値の種類が少ない文字列)
+CATEGORICAL_COLUMNS = {
+    "schedule_type", "route", "stop_name", "direction", "department",
+    "route_normal", "stop_normal", "route_jisa", "stop_jisa", "route_kotobu", "stop_kotobu",
+}
+SNAPSHOT_FILES = {"stops": "bus_stops.feather", "students": "students.feather"}
+SNAPSHOT_META = "snapshot_meta.json"
+
+def clean_df(df):
+    if df.empty: return df
+    df = df.fillna("")
+    for col in df.select_dtypes(include=['object']).columns:
+        df[col] = df[col].astype(str).str.strip()
+        df[col] = df[col].replace(["nan", "None"], "")
+    return df
+
+def detect_encoding(file_path, candidates=("utf-8", "cp932")):
+    """CSV の文字コードを判定する (先頭から順に、全体をデコードできたもの)"""
+    with open(file_path, "rb") as f:
+        raw = f.read()
+    return detect_bytes_encoding(raw, candidates)
+
+def detect_bytes_encoding(raw, candidates=("utf-8", "cp932")):
+    for encoding in candidates:
+        try:
+            raw.decode(encoding)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return candidates[-1]
+
+def read_csv_auto_encoding(file_path, encoding=None):
+    """
+    encoding が分かっていればそれで読む (読めなければ判定し直す)。なければ判定してから読む。
+    戻り値: (DataFrame, encoding)
+    """
+    if encoding:
+        try:
+            return clean_df(pd.read_csv(file_path, encoding=encoding)), encoding
+        except UnicodeDecodeError:
+            pass
+    encoding = detect_encoding(file_path)
+    return clean_df(pd.read_csv(file_path, encoding=encoding)), encoding
+
+def read_csv_bytes(raw):
+    """アップロードされたCSV (bytes) を読む。戻り値: (DataFrame, encoding)"""
+    encoding = detect_bytes_encoding(raw)
+    return clean_df(pd.read_csv(io.BytesIO(raw), encoding=encoding)), encoding
+
+def to_compact_types(df):
+    """カテゴリ列を category 型に、lat/lng を float にする"""
+    df = df.reset_index(drop=True)
+    for col in df.columns:
+        if col in CATEGORICAL_COLUMNS and df[col].dtype != "category":
+            df[col] = df[col].astype(str).astype("category")
+        elif col in ("lat", "lng"):
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+    df.columns = [str(c) for c in df.columns]
+    return df
+
+def stop_key_index(stops_df):
+    """(route, stop_name) の組の索引。組の位置がそのバス停の stop_id になる"""
+    return pd.MultiIndex.from_arrays([stops_df["route"].astype(str), stops_df["stop_name"].astype(str)]).unique()
+
+def lookup_stop_ids(key_index, routes, stop_names):
+    """(route, stop_name) の組 → stop_id の int32 配列 (該当なしは -1)"""
+    keys = pd.MultiIndex.from_arrays([pd.Index(routes).astype(str), pd.Index(stop_names).astype(str)])
+    return key_index.get_indexer(keys).astype(np.int32)
+
+def to_compact_model(stops_df, students_df):
+    """
+    読み込んだデータを、文字列の多い列は category・座標は float64 にし、
+    バス停に stop_id (同じ便・同じ名前の行は同じ番号) を付けた形にする。
+    以降の比較は文字列ではなく stop_id (整数) で行う。
+    """
+    stops_df, students_df = to_compact_types(stops_df), to_compact_types(students_df)
+    if {"route", "stop_name"} <= set(stops_df.columns):
+        stops_df["stop_id"] = lookup_stop_ids(stop_key_index(stops_df), stops_df["route"], stops_df["stop_name"])
+    return stops_df, students_df
+
+def memory_report(**frames):
+    """DataFrame ごとのメモリ使用量 (バイト、中身の文字列も含む)"""
+    return {name: int(df.memory_usage(deep=True).sum()) for name, df in frames.items()}
+
+def write_snapshot(snapshot_dir, stops_df, students_df, source, extra_meta=None):
+    """スナップショットを書き出す (一時ファイルに書いてから置き換える)"""
+    os.makedirs(snapshot_dir, exist_ok=True)
+    for key, df in (("stops", stops_df), ("students", students_df)):
+        path = os.path.join(snapshot_dir, SNAPSHOT_FILES[key])
+        to_compact_types(df).to_feather(path + ".tmp")
+        os.replace(path + ".tmp", path)
+    meta = {"source": source, "written_at": time.time(), **(extra_meta or {})}
+    meta_path = os.path.join(snapshot_dir, SNAPSHOT_META)
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(meta_path + ".tmp", meta_path)
+    return meta
+
+def read_snapshot_meta(snapshot_dir):
+    try:
+        with open(os.path.join(snapshot_dir, SNAPSHOT_META), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def read_snapshot(snapshot_dir):
+    """スナップショットを読み込む。戻り値: (stops_df, students_df, meta)。無い・壊れていれば None"""
+    meta = read_snapshot_meta(snapshot_dir)
+    if meta is None: return None
+    try:
+        stops_df = pd.read_feather(os.path.join(snapshot_dir, SNAPSHOT_FILES["stops"]))
+        students_df = pd.read_feather(os.path.join(snapshot_dir, SNAPSHOT_FILES["students"]))
+    except Exception:
+        return None
+    return stops_df, students_df, meta
+
+def csv_fingerprint(paths):
+    """CSV の更新時刻とサイズ (スナップショットが CSV より古くないかの確認用)"""
+    return {os.path.basename(p): [os.path.getmtime(p), os.path.getsize(p)] for p in paths if os.path.exists(p)}
@@ -0,0 +1,474 @@
+"""
+距離計算・空間インデックスなど、Streamlit に依存しない地理計算のヘルパー
+"""
+import bisect
+import json
+
+import numpy as np
+import pandas as pd
+
+WGS84_A = 6378137.0
+WGS84_E2 = 0.00669437999019758
+
+def hubeny_distance(lat1, lng1, lat2, lng2):
+    """
+    ヒュベニの公式 (WGS84楕円体) による距離[m]。NumPy配列でまとめて計算できる。
+    市内～数十km の範囲では geopy.geodesic との差は 0.1% 未満 (1km で 1m 未満)。
+    """
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lng1, lat2, lng2))
+    lat_m = (lat1 + lat2) / 2
+    w = np.sqrt(1 - WGS84_E2 * np.sin(lat_m) ** 2)
+    m = WGS84_A * (1 - WGS84_E2) / w ** 3
+    n = WGS84_A / w
+    return np.hypot((lat2 - lat1) * m, (lng2 - lng1) * n * np.cos(lat_m))
+
+class StopGridIndex:
+    """
+    バス停の座標を一定間隔 (cell_m メートル) のグリッドに登録した空間インデックス。
+    検索点に近いセルから順に候補を集め、k件目の距離より外側のセルは見ない。
+    query_many は全地点を同じリングごとにまとめて (NumPy の配列演算で) 広げていく。
+    """
+    QUERY_BLOCK = 4096  # query_many で一度に扱う地点数 (候補の配列の大きさを抑える)
+
+    def __init__(self, stops, cell_m=500.0):
+        self.stops = stops.dropna(subset=["lat", "lng"]).reset_index(drop=True)
+        self.lat = self.stops["lat"].to_numpy(dtype=float)
+        self.lng = self.stops["lng"].to_numpy(dtype=float)
+        self.cell_m = cell_m
+        if len(self.stops) == 0: return
+        self.lat0, self.lng0 = float(self.lat.mean()), float(self.lng.mean())
+        gx, gy = self._to_cell(self.lat, self.lng)
+        keys, inverse = np.unique(np.stack([gx, gy], axis=1), axis=0, return_inverse=True)
+        order = np.argsort(inverse.ravel(), kind="stable")
+        bounds = np.cumsum(np.bincount(inverse.ravel(), minlength=len(keys)))[:-1]
+        self.cell_keys = keys
+        self.cell_members = np.split(order, bounds)
+        # query_many 用: セル (gx, gy) → 1つの整数コード (keys と同じ昇順) と、order の中の開始位置・件数
+        self.cell_min, self.cell_max = keys.min(axis=0), keys.max(axis=0)
+        self.cell_codes = self._cell_code(keys[:, 0], keys[:, 1])
+        self.cell_counts = np.bincount(inverse.ravel(), minlength=len(keys))
+        self.cell_starts = np.cumsum(self.cell_counts) - self.cell_counts
+        self.cell_order = order
+
+    def _cell_code(self, gx, gy):
+        return (gx - self.cell_min[0]) * (self.cell_max[1] - self.cell_min[1] + 1) + (gy - self.cell_min[1])
+
+    def _to_cell(self, lat, lng):
+        # インデックス中心まわりの平面近似 (ヒュベニと同じ曲率半径) でメートル座標に変換
+        lat0 = np.radians(self.lat0)
+        w = np.sqrt(1 - WGS84_E2 * np.sin(lat0) ** 2)
+        y = np.radians(np.asarray(lat, dtype=float) - self.lat0) * WGS84_A * (1 - WGS84_E2) / w ** 3
+        x = np.radians(np.asarray(lng, dtype=float) - self.lng0) * WGS84_A / w * np.cos(lat0)
+        return np.floor(x / self.cell_m).astype(np.int64), np.floor(y / self.cell_m).astype(np.int64)
+
+    def query(self, lat, lng, k=3):
+        """1地点の近い順 k 件 → (stops の行番号の配列, 距離[m]の配列)"""
+        if len(self.stops) == 0: return np.empty(0, dtype=np.int64), np.empty(0)
+        k = min(k, len(self.stops))
+        cx, cy = self._to_cell(lat, lng)
+        ring = np.maximum(np.abs(self.cell_keys[:, 0] - cx), np.abs(self.cell_keys[:, 1] - cy))
+        cell_order = np.argsort(ring, kind="stable")
+        cand_idx, cand_dist = np.empty(0, dtype=np.int64), np.empty(0)
+        pos = 0
+        while pos < len(cell_order):
+            r = ring[cell_order[pos]]
+            end = pos + int(np.searchsorted(ring[cell_order[pos:]], r, side="right"))
+            new_idx = np.concatenate([self.cell_members[c] for c in cell_order[pos:end]])
+            cand_idx = np.concatenate([cand_idx, new_idx])
+            cand_dist = np.concatenate([cand_dist, hubeny_distance(lat, lng, self.lat[new_idx], self.lng[new_idx])])
+            pos = end
+            # 次のリングのセルは少なくとも r * cell_m 離れている (1% は平面近似の誤差の余裕)
+            if len(cand_idx) >= k and np.partition(cand_dist, k - 1)[k - 1] <= r * self.cell_m * 0.99: break
+        top = np.argpartition(cand_dist, k - 1)[:k] if len(cand_dist) > k else np.arange(len(cand_dist))
+        top = top[np.argsort(cand_dist[top], kind="stable")]
+        return cand_idx[top], cand_dist[top]
+
+    def query_many(self, lats, lngs, k=3):
+        """複数地点をまとめて検索 → (n, k) の行番号・距離の配列 (足りない分は -1 / NaN)"""
+        lats = np.atleast_1d(np.asarray(lats, dtype=float))
+        lngs = np.atleast_1d(np.asarray(lngs, dtype=float))
+        idx_out = np.full((len(lats), k), -1, dtype=np.int64)
+        dist_out = np.full((len(lats), k), np.nan)
+        valid = np.flatnonzero(~(np.isnan(lats) | np.isnan(lngs)))
+        if len(self.stops) == 0 or len(valid) == 0: return idx_out, dist_out
+        kk = min(k, len(self.stops))
+        for block in np.array_split(valid, -(-len(valid) // self.QUERY_BLOCK)):
+            idx_out[block, :kk], dist_out[block, :kk] = self._query_block(lats[block], lngs[block], kk)
+        return idx_out, dist_out
+
+    @staticmethod
+    def _ring_offsets(r):
+        """中心のセルからちょうど r 個離れたセルの (dx, dy)"""
+        if r == 0: return np.zeros(1, dtype=np.int64), np.zeros(1, dtype=np.int64)
+        side = np.arange(-r, r + 1, dtype=np.int64)
+        inner = side[1:-1]
+        dx = np.concatenate([side, side, np.full(len(inner), -r), np.full(len(inner), r)])
+        dy = np.concatenate([np.full(len(side), -r), np.full(len(side), r), inner, inner])
+        return dx, dy
+
+    def _query_block(self, lat, lng, k):
+        """
+        query と同じ手順 (近いリングから候補を足し、k件目がリングの内側に収まったら終わる) を全地点まとめて行う。
+        リングのセル数が全セル数を超える遠い地点 (データの範囲外) だけは query で1件ずつ調べる。
+        """
+        m = len(lat)
+        cx, cy = self._to_cell(lat, lng)
+        r_max = np.max(np.abs(np.stack([cx - self.cell_min[0], cx - self.cell_max[0], cy - self.cell_min[1], cy - self.cell_max[1]])), axis=0)
+        best_idx = np.full((m, k), -1, dtype=np.int64)
+        best_dist = np.full((m, k), np.inf)
+        active, r = np.arange(m), 0
+        while len(active):
+            if 8 * r > len(self.cell_keys):
+                for i in active: best_idx[i], best_dist[i] = self.query(lat[i], lng[i], k)
+                break
+            dx, dy = self._ring_offsets(r)
+            qx, qy = cx[active][:, None] + dx, cy[active][:, None] + dy
+            inside = (qx >= self.cell_min[0]) & (qx <= self.cell_max[0]) & (qy >= self.cell_min[1]) & (qy <= self.cell_max[1])
+            owner, _ = np.nonzero(inside)
+            codes = self._cell_code(qx[inside], qy[inside])
+            pos = np.minimum(np.searchsorted(self.cell_codes, codes), len(self.cell_codes) - 1)
+            hit = self.cell_codes[pos] == codes
+            members, which = _expand_ranges(self.cell_starts[pos[hit]], self.cell_counts[pos[hit]])
+            cand_q = active[owner[hit]][which]
+            cand_i = self.cell_order[members]
+            cand_d = hubeny_distance(lat[cand_q], lng[cand_q], self.lat[cand_i], self.lng[cand_i])
+            # これまでの上位 k 件と新しい候補を合わせ、地点ごとに距離 (同じなら行番号) の順で k 件残す
+            all_q = np.concatenate([np.repeat(active, k), cand_q])
+            all_i = np.concatenate([best_idx[active].ravel(), cand_i])
+            all_d = np.concatenate([best_dist[active].ravel(), cand_d])
+            order = np.lexsort((all_i, all_d, all_q))
+            rank = np.arange(len(order)) - np.searchsorted(all_q[order], all_q[order])
+            keep = order[rank < k]
+            best_idx[active], best_dist[active] = all_i[keep].reshape(-1, k), all_d[keep].reshape(-1, k)
+            # 次のリングのセルは少なくとも r * cell_m 離れている (1% は平面近似の誤差の余裕)
+            done = (best_dist[active, k - 1] <= r * self.cell_m * 0.99) | (r >= r_max[active])
+            active, r = active[~done], r + 1
+        return best_idx, best_dist
+
+    def nearest_df(self, lat, lng, k=3):
+        """近い順 k 件のバス停 (distance 列付き) の DataFrame"""
+        idx, dist = self.query(lat, lng, k)
+        return self.stops.iloc[idx].assign(distance=dist)
+
+# ---------------------------------------------------------
+# 🧭 バス停を路線ラインに載せる (スナップ・起点からの距離・順番の照合)
+# ---------------------------------------------------------
+def local_xy(lat, lng, lat0, lng0):
+    """(lat0, lng0) まわりの平面近似 (ヒュベニと同じ曲率半径) でメートル座標 (x: 東, y: 北) にする"""
+    lat0_rad = np.radians(lat0)
+    w = np.sqrt(1 - WGS84_E2 * np.sin(lat0_rad) ** 2)
+    x = np.radians(np.asarray(lng, dtype=float) - lng0) * WGS84_A / w * np.cos(lat0_rad)
+    y = np.radians(np.asarray(lat, dtype=float) - lat0) * WGS84_A * (1 - WGS84_E2) / w ** 3
+    return x, y
+
+def _expand_ranges(starts, counts):
+    """[starts[i], starts[i] + counts[i]) を全部つなげた配列と、それぞれが何番目の範囲か"""
+    owner = np.repeat(np.arange(len(counts)), counts)
+    offsets = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + offsets, owner
+
+class SegmentGridIndex:
+    """
+    路線ライン ([[lng, lat], ...] のリスト) の全線分を、外接矩形が重なるグリッドのセル (cell_m メートル四方) に登録した空間インデックス。
+    snap() で点をライン上の最も近い位置に載せ、その位置の起点からの距離 (chainage) を求める。
+    """
+    def __init__(self, lines, cell_m=50.0):
+        self.cell_m = cell_m
+        coords = [np.asarray(line, dtype=float)[:, :2] if len(line) else np.empty((0, 2)) for line in lines]
+        counts = np.array([len(c) for c in coords], dtype=np.int64)
+        self.n_lines = len(coords)
+        points = np.concatenate(coords) if coords else np.empty((0, 2))
+        self.lng0, self.lat0 = (float(v) for v in points.mean(axis=0)) if len(points) else (0.0, 0.0)
+        x, y = local_xy(points[:, 1], points[:, 0], self.lat0, self.lng0)
+        # 各ラインの最後の点以外が線分の始点
+        is_last = np.zeros(len(points), dtype=bool)
+        is_last[np.cumsum(counts)[counts > 0] - 1] = True
+        a = np.flatnonzero(~is_last)
+        self.line_of_segment = np.repeat(np.arange(self.n_lines), counts)[a]
+        self.ax, self.ay, self.bx, self.by = x[a], y[a], x[a + 1], y[a + 1]
+        self.segment_length = np.hypot(self.bx - self.ax, self.by - self.ay)
+        # 線分の始点の chainage = そのラインの中での線分長の累積
+        cum = np.cumsum(self.segment_length) - self.segment_length
+        self.segment_start = cum - cum[np.searchsorted(self.line_of_segment, self.line_of_segment)]
+        # ライン i の線分は line_segments[i]:line_segments[i + 1] (線分はライン順に並んでいる)
+        self.line_segments = np.searchsorted(self.line_of_segment, np.arange(self.n_lines + 1))
+        self.line_length = np.bincount(self.line_of_segment, weights=self.segment_length, minlength=self.n_lines)
+
+        # 線分の外接矩形が重なるセル全部に登録する (セルの番号 → 線分の番号, CSR 形式)
+        x0, x1 = np.floor(np.minimum(self.ax, self.bx) / cell_m).astype(np.int64), np.floor(np.maximum(self.ax, self.bx) / cell_m).astype(np.int64)
+        y0, y1 = np.floor(np.minimum(self.ay, self.by) / cell_m).astype(np.int64), np.floor(np.maximum(self.ay, self.by) / cell_m).astype(np.int64)
+        nx, ny = x1 - x0 + 1, y1 - y0 + 1
+        offsets, segment = _expand_ranges(np.zeros(len(nx), dtype=np.int64), nx * ny)
+        keys = self._cell_key(x0[segment] + offsets % nx[segment], y0[segment] + offsets // nx[segment])
+        order = np.argsort(keys, kind="stable")
+        self.cell_keys, cell_start = np.unique(keys[order], return_index=True)
+        self.cell_start = cell_start
+        self.cell_count = np.diff(np.append(cell_start, len(order)))
+        self.cell_segments = segment[order]
+
+    @staticmethod
+    def _cell_key(cx, cy):
+        return (cx + (1 << 30)) * (1 << 31) + (cy + (1 << 30))
+
+    def _project(self, px, py, segment):
+        """点を線分に垂直に下ろす → (線分上の位置 0〜1, 距離[m])。px / py と segment の形は揃える (ブロードキャストできればよい)"""
+        ax, ay = self.ax[segment], self.ay[segment]
+        dx, dy = self.bx[segment] - ax, self.by[segment] - ay
+        len2 = dx * dx + dy * dy
+        t = np.clip(((px - ax) * dx + (py - ay) * dy) / np.where(len2 > 0, len2, 1.0), 0.0, 1.0)
+        return t, np.hypot(ax + t * dx - px, ay + t * dy - py)
+
+    def snap(self, lats, lngs, line_ids=None, search_m=None):
+        """
+        各点を line_ids[i] 番のライン (-1 / None なら全ライン) 上の最も近い位置に載せる。
+        まず周囲 search_m メートル (既定は cell_m) のセルの線分だけで探し、そこで見つからなかった点だけ
+        そのラインの全線分と比べる (結果はどちらでも同じ)。
+        戻り値: (距離[m], chainage[m], 線分の番号) の配列。載せられない点 (座標なし・ラインに線分なし) は NaN / -1
+        """
+        lats, lngs = np.atleast_1d(np.asarray(lats, dtype=float)), np.atleast_1d(np.asarray(lngs, dtype=float))
+        n = len(lats)
+        line_ids = np.full(n, -1, dtype=np.int64) if line_ids is None else np.atleast_1d(np.asarray(line_ids, dtype=np.int64))
+        distance, chainage, best = np.full(n, np.nan), np.full(n, np.nan), np.full(n, -1, dtype=np.int64)
+        valid = ~(np.isnan(lats) | np.isnan(lngs))
+        if n == 0 or len(self.ax) == 0 or not valid.any(): return distance, chainage, best
+        px, py = local_xy(np.where(valid, lats, self.lat0), np.where(valid, lngs, self.lng0), self.lat0, self.lng0)
+        search_m = self.cell_m if search_m is None else search_m
+        ring = max(1, int(np.ceil(search_m / self.cell_m)))
+
+        # 周囲のセルの (点, 線分) の組を全部作って、まとめて距離を計算する
+        points = np.flatnonzero(valid)
+        d = np.arange(-ring, ring + 1)
+        ox, oy = np.repeat(d, len(d)), np.tile(d, len(d))
+        cx, cy = np.floor(px[points] / self.cell_m).astype(np.int64), np.floor(py[points] / self.cell_m).astype(np.int64)
+        keys = self._cell_key((cx[:, None] + ox).ravel(), (cy[:, None] + oy).ravel())
+        pos = np.minimum(np.searchsorted(self.cell_keys, keys), len(self.cell_keys) - 1)
+        hit = self.cell_keys[pos] == keys
+        cell_point = np.repeat(points, len(ox))[hit]
+        segment, owner = _expand_ranges(self.cell_start[pos[hit]], self.cell_count[pos[hit]])
+        segment = self.cell_segments[segment]
+        point = cell_point[owner]
+        same_line = (line_ids[point] < 0) | (self.line_of_segment[segment] == line_ids[point])
+        point, segment = point[same_line], segment[same_line]
+        t, dist = self._project(px[point], py[point], segment)
+        # 組は点の順に並んでいるので、点ごとの最小は reduceat で取れる (同じ距離なら先の線分)
+        starts = np.flatnonzero(np.r_[True, point[1:] != point[:-1]]) if len(point) else np.empty(0, dtype=np.int64)
+        is_min = dist == np.repeat(np.minimum.reduceat(dist, starts), np.diff(np.r_[starts, len(point)])) if len(point) else np.empty(0, dtype=bool)
+        at_min = np.flatnonzero(is_min)
+        first = at_min[np.r_[True, point[at_min[1:]] != point[at_min[:-1]]]] if len(at_min) else at_min
+        distance[point[first]], best[point[first]] = dist[first], segment[first]
+        t_best = np.full(n, np.nan)
+        t_best[point[first]] = t[first]
+
+        # 探した範囲の外にしか線分がない点は、ラインごとにそのラインの全線分と比べる (ラインから遠いバス停など)
+        rest = np.flatnonzero(valid & ~(distance <= ring * self.cell_m))
+        for line in np.unique(line_ids[rest]):
+            candidates = np.arange(len(self.ax)) if line < 0 else np.arange(self.line_segments[line], self.line_segments[line + 1])
+            if len(candidates) == 0: continue
+            members = rest[line_ids[rest] == line]
+            for chunk in np.array_split(members, max(1, len(members) * len(candidates) // 2_000_000)):
+                t_all, dist_all = self._project(px[chunk, None], py[chunk, None], candidates[None, :])
+                j = np.argmin(dist_all, axis=1)
+                k = np.arange(len(chunk))
+                distance[chunk], best[chunk], t_best[chunk] = dist_all[k, j], candidates[j], t_all[k, j]
+
+        found = best >= 0
+        chainage[found] = self.segment_start[best[found]] + t_best[found] * self.segment_length[best[found]]
+        return distance, chainage, best
+
+def sequence_mismatches(sequence, chainage):
+    """
+    sequence の順と chainage (ラインの起点からの距離) の順が合わないものの真偽配列。
+    sequence 順に並べた chainage の最長単調部分列 (増加・減少の長い方。ラインの向きはどちらでもよい) に入らないものを
+    「順番が合わない」とする。
+    """
+    sequence, chainage = np.asarray(sequence, dtype=float), np.asarray(chainage, dtype=float)
+    order = np.argsort(sequence, kind="stable")
+    def longest_non_decreasing(values):
+        tails, tail_idx, prev = [], [], np.full(len(values), -1)
+        for i, v in enumerate(values.tolist()):
+            k = bisect.bisect_right(tails, v)
+            if k == len(tails): tails.append(v); tail_idx.append(i)
+            else: tails[k], tail_idx[k] = v, i
+            prev[i] = tail_idx[k - 1] if k > 0 else -1
+        keep = np.zeros(len(values), dtype=bool)
+        i = tail_idx[-1] if tail_idx else -1
+        while i >= 0:
+            keep[i] = True
+            i = prev[i]
+        return keep
+    keep_up, keep_down = longest_non_decreasing(chainage[order]), longest_non_decreasing(-chainage[order])
+    keep = keep_up if keep_up.sum() >= keep_down.sum() else keep_down
+    mismatch = np.zeros(len(sequence), dtype=bool)
+    mismatch[order] = ~keep
+    return mismatch
+
+def snap_stops_to_routes(stops_df, index, route_lines, max_distance_m=50.0):
+    """
+    バス停 (route, lat, lng, 任意で sequence) を、その路線のライン (route_lines: 路線名 → index のラインの番号のリスト) に載せる。
+    路線にラインが複数あるとき (登校・下校など) は、バス停までの距離の中央値が一番小さいラインを使う。
+    戻り値: stops_df と同じ index の DataFrame
+      line (使ったラインの番号。ラインがなければ -1), distance_m, chainage_m,
+      far (ラインから max_distance_m より遠い), out_of_order (sequence の順が chainage の順と合わない。遠いバス停は判定しない)
+    """
+    n = len(stops_df)
+    line_out, distance_out, chainage_out = np.full(n, -1, dtype=np.int64), np.full(n, np.nan), np.full(n, np.nan)
+    routes = stops_df["route"].astype(str).to_numpy()
+    lats, lngs = stops_df["lat"].to_numpy(dtype=float), stops_df["lng"].to_numpy(dtype=float)
+    # (バス停, 候補のライン) の組をまとめて1回で載せる
+    rows, lines = [], []
+    for route, candidates in route_lines.items():
+        members = np.flatnonzero(routes == str(route))
+        for line in candidates:
+            rows.append(members)
+            lines.append(np.full(len(members), line, dtype=np.int64))
+    if rows:
+        rows, lines = np.concatenate(rows), np.concatenate(lines)
+        distance, chainage, _ = index.snap(lats[rows], lngs[rows], lines)
+        pairs = pd.DataFrame({"route": routes[rows], "line": lines, "distance_m": distance})
+        line_score = pairs.groupby(["route", "line"], sort=False)["distance_m"].median().fillna(np.inf)
+        chosen_line = {route: line for route, line in line_score.groupby(level="route", sort=False).idxmin()}
+        use = (lines == np.array([chosen_line[r] for r in routes[rows]], dtype=np.int64)) & ~np.isnan(distance)
+        line_out[rows[use]], distance_out[rows[use]], chainage_out[rows[use]] = lines[use], distance[use], chainage[use]
+
+    far = distance_out > max_distance_m
+    out_of_order = np.zeros(n, dtype=bool)
+    if "sequence" in stops_df.columns:
+        sequence = pd.to_numeric(stops_df["sequence"], errors="coerce").to_numpy(dtype=float)
+        checkable = (line_out >= 0) & ~far & ~np.isnan(sequence) & ~np.isnan(chainage_out)
+        for route in np.unique(routes[checkable]):
+            members = np.flatnonzero(checkable & (routes == route))
+            out_of_order[members] = sequence_mismatches(sequence[members], chainage_out[members])
+    return pd.DataFrame({
+        "line": line_out, "distance_m": distance_out, "chainage_m": chainage_out, "far": far, "out_of_order": out_of_order,
+    }, index=stops_df.index)
+
+# ---------------------------------------------------------
+# 🛣️ 路線ラインの軽量化 (座標の丸め + Douglas–Peucker 簡略化)
+# ---------------------------------------------------------
+def meters_per_pixel(zoom, lat):
+    """Web メルカトル (256px タイル) の 1px あたりのメートル数"""
+    return 156543.03392 * np.cos(np.radians(lat)) / (2 ** zoom)
+
+def simplify_line(coords, tolerance_m):
+    """
+    [[lng, lat], ...] を Douglas–Peucker で簡略化する。tolerance_m メートル以内のずれの頂点は間引く。
+    始点・終点は必ず残す。
+    """
+    pts = np.asarray(coords, dtype=float)
+    if len(pts) <= 2 or tolerance_m <= 0: return [list(p) for p in pts]
+    # ライン中心まわりの平面近似 (メートル)
+    lat0 = np.radians(pts[:, 1].mean())
+    w = np.sqrt(1 - WGS84_E2 * np.sin(lat0) ** 2)
+    xy = np.column_stack([
+        np.radians(pts[:, 0]) * WGS84_A / w * np.cos(lat0),
+        np.radians(pts[:, 1]) * WGS84_A * (1 - WGS84_E2) / w ** 3,
+    ])
+    keep = np.zeros(len(pts), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(pts) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2: continue
+        seg = xy[last] - xy[first]
+        rel = xy[first + 1:last] - xy[first]
+        seg_len2 = seg @ seg
+        if seg_len2 == 0:
+            dist = np.hypot(rel[:, 0], rel[:, 1])
+        else:
+            t = np.clip(rel @ seg / seg_len2, 0, 1)
+            dist = np.hypot(rel[:, 0] - t * seg[0], rel[:, 1] - t * seg[1])
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance_m:
+            mid = first + 1 + i
+            keep[mid] = True
+            stack.append((first, mid))
+            stack.append((mid, last))
+    return [list(p) for p in pts[keep]]
+
+def _map_lines(geometry, fn):
+    """LineString / MultiLineString / Polygon の各ラインに fn を適用したジオメトリを返す"""
+    g_type, coords = geometry.get("type"), geometry.get("coordinates")
+    if g_type == "LineString": return {"type": g_type, "coordinates": fn(coords)}
+    if g_type in ("MultiLineString", "Polygon"): return {"type": g_type, "coordinates": [fn(c) for c in coords]}
+    if g_type == "MultiPolygon": return {"type": g_type, "coordinates": [[fn(c) for c in poly] for poly in coords]}
+    return geometry
+
+def simplify_geojson(geojson_data, tolerance_m=1.0, decimals=5):
+    """
+    FeatureCollection のラインを簡略化し、座標を小数 decimals 桁に丸めた新しい dict を返す (元は変更しない)。
+    decimals=5 でおよそ 1m 単位。
+    """
+    def fn(line):
+        simplified = simplify_line(line, tolerance_m) if tolerance_m > 0 else line
+        out = []
+        for lng, lat, *rest in simplified:
+            p = [round(float(lng), decimals), round(float(lat), decimals)]
+            if not out or out[-1] != p: out.append(p)
+        if len(out) == 1 and len(simplified) > 1: out.append(out[0])  # LineString は2点以上必要
+        return out
+    features = []
+    for feature in geojson_data.get("features", []):
+        new_feature = dict(feature)
+        if feature.get("geometry"): new_feature["geometry"] = _map_lines(feature["geometry"], fn)
+        features.append(new_feature)
+    return {**geojson_data, "features": features}
+
+def encode_polyline(coords, precision=5):
+    """[[lng, lat], ...] を Google Encoded Polyline 形式の文字列にする"""
+    factor = 10 ** precision
+    result, prev_lat, prev_lng = [], 0, 0
+    for lng, lat, *_ in coords:
+        lat_i, lng_i = int(round(lat * factor)), int(round(lng * factor))
+        for delta in (lat_i - prev_lat, lng_i - prev_lng):
+            v = ~(delta << 1) if delta < 0 else delta << 1
+            while v >= 0x20:
+                result.append(chr((0x20 | (v & 0x1F)) + 63))
+                v >>= 5
+            result.append(chr(v + 63))
+        prev_lat, prev_lng = lat_i, lng_i
+    return "".join(result)
+
+def decode_polyline(encoded, precision=5):
+    """encode_polyline の逆変換 → [[lng, lat], ...]"""
+    factor = 10 ** precision
+    coords, index, lat, lng = [], 0, 0, 0
+    while index < len(encoded):
+        deltas = []
+        for _ in range(2):
+            shift, value = 0, 0
+            while True:
+                b = ord(encoded[index]) - 63
+                index += 1
+                value |= (b & 0x1F) << shift
+                shift += 5
+                if b < 0x20: break
+            deltas.append(~(value >> 1) if value & 1 else value >> 1)
+        lat += deltas[0]
+        lng += deltas[1]
+        coords.append([lng / factor, lat / factor])
+    return coords
+
+def geojson_size_report(geojson_data, tolerance_m=1.0, decimals=5):
+    """元 / 丸めのみ / 丸め+簡略化 / Encoded Polyline のバイト数と頂点数"""
+    def n_vertices(data):
+        count = 0
+        def fn(line):
+            nonlocal count
+            count += len(line)
+            return line
+        for f in data.get("features", []):
+            if f.get("geometry"): _map_lines(f["geometry"], fn)
+        return count
+    def size(data): return len(json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+    quantized = simplify_geojson(geojson_data, 0, decimals)
+    simplified = simplify_geojson(geojson_data, tolerance_m, decimals)
+    encoded = []
+    for f in simplified.get("features", []):
+        g = f.get("geometry") or {}
+        if g.get("type") == "LineString": encoded.append(encode_polyline(g["coordinates"], decimals))
+    return {
+        "original_bytes": size(geojson_data), "original_vertices": n_vertices(geojson_data),
+        "quantized_bytes": size(quantized),
+        "simplified_bytes": size(simplified), "simplified_vertices": n_vertices(simplified),
+        "polyline_bytes": sum(len(e) for e in encoded),
+    }
@@ -0,0 +1,349 @@
+"""
+住所 → 座標 (ジオコーディング)
+
+1. 国土地理院API (最強・あいまい検索可)
+2. 農研機構API
+3. Geocoding.jp
+4. 最後の手段: 数字を削除して町名だけで検索
+
+結果は SQLite に保存し (GeocodeCache)、同じ住所を何度も外部APIに問い合わせないようにする。
+「見つからない」と保存するのは全プロバイダが実際に「なし」と答えたときだけ。通信・HTTPエラーや締め切り超過が
+混じっていたら GeocodeUnavailable を送出し、キャッシュには保存しない (一時的な障害で1時間「見つからない」にならないように)。
+RacingGeocoder は 住所 × プロバイダ の全組み合わせを並列に問い合わせる (順番待ちをしない)。
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+# ---------------------------------------------------------
+# 🌐 プロバイダ (どれも (lat, lng) か None を返す。通信・HTTPエラーは例外)
+# ---------------------------------------------------------
+GSI_URL = "https://msearch.gsi.go.jp/address-search/AddressSearch"
+NARO_URL = "https://aginfo.cgk.affrc.go.jp/ws/geocode/search"
+GEOCODING_JP_URL = "https://www.geocoding.jp/api/"
+
+def _requests():
+    """requests は最初に問い合わせるときに読み込む (起動直後のログイン画面では使わないので)"""
+    import requests
+    return requests
+
+def geocode_gsi(query, session=None, timeout=10, url=GSI_URL):
+    """国土地理院 API (Msearch)"""
+    session = session or _requests()
+    res = session.get(url, params={"q": query}, timeout=timeout)
+    res.raise_for_status()
+    if res.status_code == 200:
+        data = res.json()
+        if len(data) > 0:
+            coords = data[0]["geometry"]["coordinates"]  # [lon, lat]
+            return float(coords[1]), float(coords[0])
+    return None
+
+def geocode_naro(query, session=None, timeout=10, url=NARO_URL):
+    """農研機構 API"""
+    session = session or _requests()
+    headers = {"User-Agent": "school_bus_app_v5"}
+    res = session.get(url, params={"addr": query}, headers=headers, timeout=timeout)
+    res.raise_for_status()
+    if res.status_code == 200:
+        data = res.json()
+        if data.get("result") and len(data["result"]) > 0:
+            top = data["result"][0]
+            return float(top["lat"]), float(top["lon"])
+    return None
+
+def geocode_geocoding_jp(query, session=None, timeout=10, url=GEOCODING_JP_URL):
+    """Geocoding.jp"""
+    session = session or _requests()
+    res = session.get(f"{url}?q={query}", timeout=timeout)
+    res.raise_for_status()
+    if res.status_code == 200:
+        import xml.etree.ElementTree as ET
+        tree = ET.fromstring(res.content)
+        lat_node = tree.find("coordinate/lat")
+        lng_node = tree.find("coordinate/lng")
+        if lat_node is not None and lng_node is not None:
+            return float(lat_node.text), float(lng_node.text)
+    return None
+
+class GeocodeUnavailable(Exception):
+    """どのプロバイダでも見つからず、しかも答えなかった (エラー・締め切り超過・スキップ) プロバイダがあった"""
+    def __init__(self, errors):
+        self.errors = errors  # [(プロバイダ名, 理由)]
+        super().__init__("住所検索サービスに接続できませんでした: " + " / ".join(f"{name}: {reason}" for name, reason in errors))
+
+# 優先順 (名前, 関数)
+PROVIDERS = [
+    ("国土地理院", geocode_gsi),
+    ("農研機構", geocode_naro),
+    ("Geocoding.jp", geocode_geocoding_jp),
+]
+
+def normalize_address(address_str):
+    """キャッシュのキー: NFKC 正規化 + 前後・連続空白の整理"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", address_str)).strip()
+
+def build_search_queries(address_str):
+    """そのままの住所 と、数字を除去した町名のみ (例: 深作3 -> 深作)"""
+    normalized_addr = normalize_address(address_str)
+    search_queries = [normalized_addr]
+    addr_without_digits = re.sub(r'\d+[-]*\d*', '', normalized_addr).strip()
+    if addr_without_digits and addr_without_digits != normalized_addr:
+        search_queries.append(addr_without_digits)
+    return search_queries
+
+def pooled_session(max_connections):
+    """プロバイダごとに max_connections 本まで接続を使い回す HTTP セッション"""
+    requests = _requests()
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=len(PROVIDERS), pool_maxsize=max_connections)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def search_address_ultimate(address_str, providers=None, session=None):
+    """
+    住所を順番にプロバイダへ問い合わせ、(lat, lng, プロバイダ名) を返す。
+    全プロバイダが「見つからない」と答えたら (None, None, None)。エラーになったプロバイダがあれば GeocodeUnavailable。
+    session (pooled_session) を渡すと、その接続を使い回す
+    """
+    providers = PROVIDERS if providers is None else providers
+    errors = []
+    for query in build_search_queries(address_str):
+        for provider_name, provider in providers:
+            try:
+                hit = provider(query) if session is None else provider(query, session=session)
+            except Exception as e:
+                errors.append((provider_name, f"{type(e).__name__}: {e}"))
+                continue
+            if hit is not None:
+                return hit[0], hit[1], provider_name
+    if errors: raise GeocodeUnavailable(errors)
+    return None, None, None
+
+# ---------------------------------------------------------
+# 🏁 並列問い合わせ (レース)
+# ---------------------------------------------------------
+class CircuitBreaker:
+    """連続 max_failures 回失敗したプロバイダは reset_after 秒間スキップする"""
+    def __init__(self, max_failures=3, reset_after=60.0):
+        self.max_failures = max_failures
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self.opened_at is None: return True
+            if now - self.opened_at >= self.reset_after:
+                # 半開: 1回だけ試させ、失敗したらまた開く
+                self.opened_at = None
+                self.failures = self.max_failures - 1
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self, now=None):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.max_failures:
+                self.opened_at = time.monotonic() if now is None else now
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+class RacingGeocoder:
+    """
+    住所 × プロバイダ の全組み合わせを共有 HTTP セッション上で並列に問い合わせる。
+    結果の採用順は逐次版 (search_address_ultimate) と同じ優先順位で、
+    より優先度の高い問い合わせがすべて「見つからない/失敗」と確定した時点で返す。
+    プロバイダごとの締め切り (deadlines) は問い合わせが実際に始まってから数え、過ぎたものは失敗扱いにする。
+    失敗が続いたプロバイダは CircuitBreaker でしばらくスキップする。
+    スレッドの空き待ちで max_queue_wait 秒を過ぎたものは、プロバイダのせいではないのでブレーカーには数えない。
+    """
+    def __init__(self, providers=None, deadlines=None, default_deadline=5.0, max_workers=16, max_queue_wait=10.0, breaker_factory=CircuitBreaker):
+        self.providers = PROVIDERS if providers is None else providers
+        self.deadlines = deadlines or {}
+        self.default_deadline = default_deadline
+        self.max_queue_wait = max_queue_wait
+        self.session = pooled_session(max_workers)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="geocode")
+        self.breakers = {name: breaker_factory() for name, _ in self.providers}
+
+    def search(self, address_str):
+        """
+        戻り値は search_address_ultimate と同じ (lat, lng, プロバイダ名)。
+        (None, None, None) は全プロバイダが「見つからない」と答えたときだけ。失敗・締め切り超過・ブレーカーで
+        飛ばしたものがあって見つからなければ GeocodeUnavailable
+        """
+        jobs = []  # 優先順: (プロバイダ名, future, 締め切り秒数, 登録時刻)
+        started = {}  # ジョブの番号 → 実行が始まった時刻
+        errors = []
+        def run(i, provider, query, limit):
+            started[i] = time.monotonic()
+            return provider(query, session=self.session, timeout=limit)
+        for query in build_search_queries(address_str):
+            for provider_name, provider in self.providers:
+                if not self.breakers[provider_name].allow():
+                    errors.append((provider_name, "ブレーカー作動中"))
+                    continue
+                limit = self.deadlines.get(provider_name, self.default_deadline)
+                future = self.executor.submit(run, len(jobs), provider, query, limit)
+                jobs.append((provider_name, future, limit, time.monotonic()))
+
+        NOT_FOUND, FAILED = "not_found", "failed"
+        outcome = [None] * len(jobs)  # None: 未確定 / NOT_FOUND / FAILED / (lat, lng)
+        pending = {future: i for i, (_, future, _, _) in enumerate(jobs)}
+        def deadline(i):
+            # 始まっていれば 開始 + 締め切り、まだ順番待ちなら 登録 + 締め切り + 順番待ちの上限
+            _, _, limit, submitted = jobs[i]
+            return started[i] + limit if i in started else submitted + limit + self.max_queue_wait
+        try:
+            while True:
+                # 先頭から順に確定しているものを見て、勝者が決まれば返す
+                for i, result in enumerate(outcome):
+                    if result is None: break
+                    if result not in (NOT_FOUND, FAILED): return result[0], result[1], jobs[i][0]
+                else:
+                    if errors: raise GeocodeUnavailable(errors)
+                    return None, None, None
+                now = time.monotonic()
+                for future, i in list(pending.items()):
+                    if now >= deadline(i):
+                        outcome[i] = FAILED
+                        if i in started:
+                            errors.append((jobs[i][0], "締め切り超過"))
+                            self.breakers[jobs[i][0]].record_failure()
+                        else:
+                            errors.append((jobs[i][0], "順番待ちで時間切れ"))
+                        del pending[future]
+                if not pending: continue
+                wake = min(deadline(i) for i in pending.values())
+                # 順番待ちのものは始まると締め切りが早まるので、ときどき見直す
+                if any(i not in started for i in pending.values()): wake = min(wake, now + 0.05)
+                done, _ = wait(list(pending), timeout=max(0.0, wake - now), return_when=FIRST_COMPLETED)
+                for future in done:
+                    i = pending.pop(future)
+                    try:
+                        hit = future.result()
+                        self.breakers[jobs[i][0]].record_success()
+                    except Exception as e:
+                        hit = FAILED
+                        errors.append((jobs[i][0], f"{type(e).__name__}: {e}"))
+                        self.breakers[jobs[i][0]].record_failure()
+                    outcome[i] = hit if hit is not None else NOT_FOUND
+        finally:
+            # 残りは不要 (未開始のものは取り消し、実行中のものは結果を捨てる)
+            for future in pending:
+                future.cancel()
+
+# ---------------------------------------------------------
+# 💾 永続キャッシュ (SQLite)
+# ---------------------------------------------------------
+class GeocodeCache:
+    """
+    正規化した住所 → (lat, lng, プロバイダ) を SQLite に保存するキャッシュ。
+    見つかった結果は ttl 秒、「見つからなかった」結果は negative_ttl 秒だけ有効。
+    max_entries を超えたら最後に使われた時刻が古いものから削除する (LRU)。
+    """
+    def __init__(self, path, ttl=30 * 24 * 3600, negative_ttl=3600, max_entries=20000):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path): os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS geocode ("
+                " query TEXT PRIMARY KEY, lat REAL, lng REAL, provider TEXT,"
+                " created_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn: yield conn
+        finally:
+            conn.close()
+
+    def get(self, address_str, now=None):
+        """ヒットすれば (lat, lng, provider) ※見つからなかった結果は (None, None, None)。キャッシュになければ None"""
+        key = normalize_address(address_str)
+        now = time.time() if now is None else now
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT lat, lng, provider, created_at FROM geocode WHERE query = ?", (key,)).fetchone()
+            if row is not None:
+                lat, lng, provider, created_at = row
+                ttl = self.ttl if lat is not None else self.negative_ttl
+                if now - created_at < ttl:
+                    conn.execute("UPDATE geocode SET last_access = ? WHERE query = ?", (now, key))
+                    self.hits += 1
+                    return lat, lng, provider
+                conn.execute("DELETE FROM geocode WHERE query = ?", (key,))
+            self.misses += 1
+            return None
+
+    def get_many(self, addresses, now=None):
+        """get をまとめて1回の接続で行う。戻り値: {正規化した住所: (lat, lng, provider)} (ヒットしたものだけ)"""
+        keys = list(dict.fromkeys(normalize_address(a) for a in addresses))
+        now = time.time() if now is None else now
+        found = {}
+        with self._lock, self._connect() as conn:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT query, lat, lng, provider, created_at FROM geocode WHERE query IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for key, lat, lng, provider, created_at in rows:
+                    ttl = self.ttl if lat is not None else self.negative_ttl
+                    if now - created_at < ttl: found[key] = (lat, lng, provider)
+            conn.executemany("UPDATE geocode SET last_access = ? WHERE query = ?", [(now, key) for key in found])
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put(self, address_str, lat, lng, provider, now=None):
+        key = normalize_address(address_str)
+        now = time.time() if now is None else now
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO geocode (query, lat, lng, provider, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, lat, lng, provider, now, now),
+            )
+            count = conn.execute("SELECT COUNT(*) FROM geocode").fetchone()[0]
+            if count > self.max_entries:
+                conn.execute(
+                    "DELETE FROM geocode WHERE query IN (SELECT query FROM geocode ORDER BY last_access ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM geocode").fetchone()[0]
+
+def geocode_with_cache(address_str, cache, search=search_address_ultimate):
+    """
+    キャッシュ → なければ search で検索して保存。戻り値は search_address_ultimate と同じ。
+    search が GeocodeUnavailable を送出したときは保存せずにそのまま送出する (次は問い合わせ直す)
+    """
+    cached = cache.get(address_str)
+    if cached is not None: return cached
+    lat, lng, provider = search(address_str)
+    cache.put(address_str, lat, lng, provider)
+    return lat, lng, provider
@@ -0,0 +1,80 @@
+"""
+地図に載せる独自レイヤー (folium の MacroElement)
+
+LazyStopLayer: バス停の CircleMarker をまとめて1つのレイヤーにする。
+ポップアップの HTML はマーカーごとに埋め込まず、バス停の情報を1つの JSON 配列として一度だけ埋め込み、
+クリックされたときに JavaScript で組み立てる (地図の HTML が バス停数 × 生徒数 で大きくならない)。
+"""
+import json
+
+from branca.element import MacroElement
+from jinja2 import Template
+
+class LazyStopLayer(MacroElement):
+    """
+    add_stop(lat, lng, style, route, stop_name, time_to, time_from, students, popup_color) で追加する。
+    style は CircleMarker のオプション (radius, color, weight, fill_color, fill_opacity)。
+    同じ style / 同じ路線はまとめて参照するので、1件あたりは座標と文字列だけになる。
+    """
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var styles = {{ this.to_js(this.styles) }};
+            var routes = {{ this.to_js(this.routes) }};
+            var stops = {{ this.to_js(this.stops) }};
+            function esc(text) {
+                return String(text).replace(/[&<>"']/g, function(c) {
+                    return {"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#39;"}[c];
+                });
+            }
+            function popupHtml(s) {
+                var route = routes[s[3]];
+                return '<div style="font-family:sans-serif; width:220px;">'
+                    + '<h4 style="margin:0; color:' + route[1] + ';">' + esc(s[4]) + '</h4>'
+                    + '<div style="background-color:#f0f0f0; padding:5px; margin:5px 0; border-radius:4px;"><small>'
+                    + '行き:' + esc(s[5]) + ' / 帰り:' + esc(s[6]) + '</small></div>'
+                    + '<div style="margin-top:5px; font-size:0.9em;"><strong>生徒:</strong> ' + esc(s[7]) + '</div>'
+                    + '<small style="color:gray;">' + esc(route[0]) + '</small>'
+                    + '</div>';
+            }
+            var layer = L.featureGroup();
+            stops.forEach(function(s) {
+                L.circleMarker([s[0], s[1]], styles[s[2]])
+                    .bindPopup(function() { return popupHtml(s); }, {maxWidth: 250})
+                    .addTo(layer);
+            });
+            layer.addTo({{ this._parent.get_name() }});
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self):
+        super().__init__()
+        self._name = "LazyStopLayer"
+        self.styles, self.routes, self.stops = [], [], []
+        self._style_ids, self._route_ids = {}, {}
+
+    def add_stop(self, lat, lng, style, route, stop_name, time_to, time_from, students, popup_color):
+        style_key = tuple(sorted(style.items()))
+        if style_key not in self._style_ids:
+            self._style_ids[style_key] = len(self.styles)
+            self.styles.append({
+                "radius": style["radius"], "color": style["color"], "weight": style["weight"],
+                "fill": True, "fillColor": style["fill_color"], "fillOpacity": style["fill_opacity"],
+            })
+        route_key = (str(route), popup_color)
+        if route_key not in self._route_ids:
+            self._route_ids[route_key] = len(self.routes)
+            self.routes.append(list(route_key))
+        self.stops.append([
+            round(float(lat), 6), round(float(lng), 6), self._style_ids[style_key], self._route_ids[route_key],
+            str(stop_name), str(time_to), str(time_from), str(students),
+        ])
+
+    @staticmethod
+    def to_js(value):
+        """<script> にそのまま書ける JSON (日本語は \\uXXXX にせず UTF-8 のまま)"""
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":")).replace("</", "<\\/")
+
+    def __len__(self):
+        return len(self.stops)
@@ -0,0 +1,71 @@
+"""
+生徒の名前検索インデックス
+
+- 全角/半角 (NFKC)、ひらがな/カタカナ、大文字/小文字、空白の違いを無視して比べる
+- 正規化したキーの 2文字組 (bigram) → 行 の転置インデックスで候補を絞ってから部分一致を確認する
+- 名前のほか、学部 (department) とバス停名 (stop_name) でも引ける
+"""
+import unicodedata
+
+KATAKANA_START, KATAKANA_END = ord("ァ"), ord("ヶ")
+
+def normalize_search_text(text):
+    """NFKC → 小文字 → カタカナをひらがなに → 空白を除去"""
+    text = unicodedata.normalize("NFKC", str(text)).lower()
+    folded = "".join(chr(ord(c) - 0x60) if KATAKANA_START <= ord(c) <= KATAKANA_END else c for c in text)
+    return "".join(folded.split())
+
+def _grams(key):
+    if len(key) < 2: return set(key)
+    return {key[i:i + 2] for i in range(len(key) - 1)}
+
+# 一致の種類ごとの順位 (小さいほど上に出す)
+RANK_NAME_EXACT, RANK_NAME_PREFIX, RANK_NAME_CONTAINS, RANK_OTHER_PREFIX, RANK_OTHER_CONTAINS = range(5)
+
+class StudentSearchIndex:
+    """
+    students_df の行ラベルを返す検索インデックス。
+    search("さとう") → 順位付きの行ラベルのリスト
+    """
+    def __init__(self, students_df, fields=("name", "department", "stop_name")):
+        self.fields = [f for f in fields if f in students_df.columns]
+        self.labels = list(students_df.index)
+        self.keys = {f: [normalize_search_text(v) for v in students_df[f]] for f in self.fields}
+        self.sort_keys = self.keys.get("name", [""] * len(self.labels))
+        # bigram と 1文字 の両方を登録 (1文字の検索にも対応する)
+        self.postings = {}
+        for f in self.fields:
+            for pos, key in enumerate(self.keys[f]):
+                for gram in _grams(key) | set(key):
+                    self.postings.setdefault(gram, set()).add(pos)
+
+    def _candidates(self, query_key):
+        grams = _grams(query_key)
+        lists = sorted((self.postings.get(g, set()) for g in grams), key=len)
+        if not lists or not lists[0]: return set()
+        result = set(lists[0])
+        for other in lists[1:]:
+            result &= other
+            if not result: break
+        return result
+
+    def search(self, query, limit=None):
+        query_key = normalize_search_text(query)
+        if not query_key: return []
+        ranked = []
+        for pos in self._candidates(query_key):
+            rank = None
+            name_key = self.keys["name"][pos] if "name" in self.keys else ""
+            if name_key == query_key: rank = RANK_NAME_EXACT
+            elif name_key.startswith(query_key): rank = RANK_NAME_PREFIX
+            elif query_key in name_key: rank = RANK_NAME_CONTAINS
+            else:
+                for f in self.fields:
+                    if f == "name": continue
+                    key = self.keys[f][pos]
+                    if key.startswith(query_key): rank = RANK_OTHER_PREFIX if rank is None else min(rank, RANK_OTHER_PREFIX)
+                    elif query_key in key and rank is None: rank = RANK_OTHER_CONTAINS
+            if rank is not None: ranked.append((rank, self.sort_keys[pos], pos))
+        ranked.sort()
+        if limit is not None: ranked = ranked[:limit]
+        return [self.labels[pos] for _, _, pos in ranked]
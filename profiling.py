@@ -0,0 +1,65 @@
+"""
+1回の再実行 (rerun) の段階ごとの所要時間と件数の記録
+
+    profiler = RerunProfiler(enabled=True)
+    with profiler.span("load_data"): ...
+    profiler.count("map_html_bytes", len(html))
+    record = profiler.finish()   # {"ts", "total_ms", "spans": {段階: ms}, "counts": {...}}
+
+enabled=False のときは span() が何もしないコンテキストを返すだけなので、計測の負荷はほぼ無い。
+"""
+import json
+import os
+import time
+from contextlib import nullcontext
+
+_NOOP = nullcontext()
+
+class _Span:
+    __slots__ = ("profiler", "name", "t0")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = (time.perf_counter() - self.t0) * 1000
+        self.profiler.spans[self.name] = self.profiler.spans.get(self.name, 0.0) + elapsed
+        return False
+
+class RerunProfiler:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.spans = {}   # 段階名 → ms (同じ名前は合算)
+        self.counts = {}
+        self.t0 = time.perf_counter()
+
+    def span(self, name):
+        return _Span(self, name) if self.enabled else _NOOP
+
+    def count(self, name, value=1):
+        if self.enabled: self.counts[name] = self.counts.get(name, 0) + value
+
+    def finish(self, **extra):
+        """計測結果を1件のレコードにまとめる (無効なら None)"""
+        if not self.enabled: return None
+        return {
+            "ts": time.time(),
+            "total_ms": round((time.perf_counter() - self.t0) * 1000, 2),
+            "spans": {k: round(v, 2) for k, v in self.spans.items()},
+            "counts": dict(self.counts),
+            **extra,
+        }
+
+def append_jsonl(path, record):
+    """レコードを JSON Lines ファイルに1行追記する"""
+    if os.path.dirname(path): os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+def to_jsonl(records):
+    return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
@@ -0,0 +1,179 @@
+"""
+全路線の時刻表・利用生徒名簿の一括出力 (CSV / XLSX / PDF を1つの ZIP に)
+
+- 時刻表は build_schedule_bundle の "timetable" (画面の時刻表と同じ、バス停ごとに生徒名をまとめたもの) から作る
+- 名簿は画面の名簿と同じ build_roster で作る
+- ファイルの生成はスレッドで並列に行い、できたものから順に ZIP (ファイル) に書き込む (圧縮は書き込む側のスレッドで、生成と重なる)。
+  書き込み待ちのファイルは同時実行数の2倍までしか持たないので、全ファイルをメモリに溜めない。
+  プロセスは使わない: Streamlit はアプリのスクリプトを __main__ として動かすので、spawn した子プロセスがアプリ全体を実行し直してしまう
+
+XLSX は openpyxl、PDF は reportlab が入っているときだけ使える (available_formats)。
+出力先のディレクトリは prune_exports で、今のデータ版以外の ZIP と置き去りの書きかけを消す。
+"""
+import importlib.util
+import io
+import os
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from xml.sax.saxutils import escape
+
+import pandas as pd
+
+DIRECTIONS = {"登校": ("time_to", "students_to"), "下校": ("time_from", "students_from")}
+# 形式 → 必要なモジュール (None は標準で使える)
+FORMAT_MODULES = {"csv": None, "xlsx": "openpyxl", "pdf": "reportlab"}
+ROSTER_COLUMNS = {"name": "生徒名", "department": "学部", "stop_name": "利用バス停", "direction": "区分"}
+PDF_FONT = "HeiseiKakuGo-W5"  # reportlab 内蔵の日本語フォント (埋め込み不要)
+PDF_WRAP_CHARS = 20  # これより長いセルだけ折り返す
+
+def available_formats():
+    return [fmt for fmt, module in FORMAT_MODULES.items() if module is None or importlib.util.find_spec(module) is not None]
+
+def prune_exports(directory, keep_prefix, stale_tmp_seconds=3600):
+    """
+    directory の ZIP のうち keep_prefix で始まらないもの (前のデータ版の出力) と、
+    stale_tmp_seconds より前に書きかけのまま残った .tmp を消す。戻り値: 消したファイル数
+    """
+    removed, now = 0, time.time()
+    for entry in os.scandir(directory):
+        if not entry.is_file(): continue
+        if entry.name.endswith(".zip"): stale = not entry.name.startswith(keep_prefix)
+        elif entry.name.endswith(".tmp"): stale = now - entry.stat().st_mtime > stale_tmp_seconds
+        else: continue
+        if not stale: continue
+        try:
+            os.unlink(entry.path)
+            removed += 1
+        except FileNotFoundError: pass  # 別のセッションが先に消した
+    return removed
+
+def build_roster(students_df, route_timetable, route, direction=None):
+    """
+    路線の利用生徒名簿 (バス停順 → 名前順)。direction が "登校" / "下校" ならその区分の生徒だけ。
+    route_timetable はその路線の時刻表 (stop_name と sequence の列を使う)。
+    """
+    roster_df = students_df[students_df["route"] == route].copy()
+    if direction is not None: roster_df = roster_df[roster_df["direction"].str.contains(direction, na=False)]
+    if "sequence" in route_timetable.columns and not route_timetable.empty and not roster_df.empty:
+        route_stops_order = route_timetable[["stop_name", "sequence"]]
+        roster_df = pd.merge(roster_df.assign(stop_name=roster_df["stop_name"].astype(str)), route_stops_order, on="stop_name", how="left")
+        roster_df = roster_df.sort_values(by=["sequence", "name"])
+    else:
+        roster_df = roster_df.sort_values(by="name")
+    display_cols = ["name", "stop_name", "direction"]
+    if "department" in roster_df.columns: display_cols.insert(1, "department")
+    return roster_df[display_cols]
+
+def timetable_for_export(route_timetable, direction):
+    time_col, students_col = DIRECTIONS[direction]
+    return pd.DataFrame({
+        "バス停名": route_timetable["stop_name"].values,
+        "時間": route_timetable[time_col].values,
+        f"{direction}生徒": route_timetable[students_col].values,
+    })
+
+def export_tables(bundle, schedule_modes=None, directions=tuple(DIRECTIONS)):
+    """
+    出力する表を順に返す: (ZIP 内のパス (拡張子なし), 見出し, 表を作る関数)。
+    表は関数を呼んだときに作る (先に全部作って持たないため)。
+    """
+    for schedule_mode in schedule_modes or list(bundle):
+        view = bundle[schedule_mode]
+        timetable = view["timetable"]
+        route_timetables = dict(tuple(timetable.groupby("route", sort=False)))
+        for direction in directions:
+            for route in view["routes"]:
+                route_timetable = route_timetables.get(str(route), timetable.iloc[0:0])
+                base = f"{schedule_mode}/{direction}/{route}"
+                yield (f"{base}_時刻表", f"{route} 時刻表 ({schedule_mode}・{direction})",
+                       lambda t=route_timetable, d=direction: timetable_for_export(t, d))
+                yield (f"{base}_名簿", f"{route} 利用生徒名簿 ({schedule_mode}・{direction})",
+                       lambda s=view["students"], t=route_timetable, r=route, d=direction: build_roster(s, t, r, d).rename(columns=ROSTER_COLUMNS))
+
+def render(df, fmt, title):
+    """表 1つを fmt の形式のバイト列にする"""
+    if fmt == "csv":
+        return df.to_csv(index=False).encode("utf-8-sig")  # Excel で文字化けしないように BOM 付き
+    if fmt == "xlsx":
+        buffer = io.BytesIO()
+        df.to_excel(buffer, index=False, sheet_name=title[:31].replace("/", "・"), engine="openpyxl")
+        return buffer.getvalue()
+    if fmt == "pdf":
+        return render_pdf(df, title)
+    raise ValueError(f"未対応の形式: {fmt}")
+
+def render_pdf(df, title):
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.lib.styles import ParagraphStyle
+    from reportlab.lib.units import mm
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+    from reportlab.platypus import LongTable, Paragraph, SimpleDocTemplate, Spacer, TableStyle
+
+    if PDF_FONT not in pdfmetrics.getRegisteredFontNames(): pdfmetrics.registerFont(UnicodeCIDFont(PDF_FONT))
+    cell_style = ParagraphStyle("cell", fontName=PDF_FONT, fontSize=9, leading=11)
+    title_style = ParagraphStyle("title", fontName=PDF_FONT, fontSize=14, leading=18)
+    def cell(value):
+        # 折り返しが要る長い文字列だけ Paragraph にする (Paragraph は重いので、短いものは文字列のまま)
+        text = str(value)
+        return Paragraph(escape(text), cell_style) if len(text) > PDF_WRAP_CHARS else text
+    rows = [list(map(str, df.columns))]
+    rows += [[cell(v) for v in row] for row in df.itertuples(index=False)]
+    if len(rows) == 1: rows.append(["(なし)"] + [""] * (len(df.columns) - 1))
+    page = landscape(A4)
+    width = page[0] - 20 * mm
+    # 最後の列 (生徒名の一覧など) を広く取る
+    col_widths = [width * 0.2] * (len(df.columns) - 1) + [width - width * 0.2 * (len(df.columns) - 1)]
+    table = LongTable(rows, colWidths=col_widths, repeatRows=1)
+    table.setStyle(TableStyle([
+        ("FONT", (0, 0), (-1, -1), PDF_FONT, 9),
+        ("GRID", (0, 0), (-1, -1), 0.3, colors.grey),
+        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#EEEEEE")),
+        ("VALIGN", (0, 0), (-1, -1), "TOP"),
+    ]))
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=page, leftMargin=10 * mm, rightMargin=10 * mm, topMargin=10 * mm, bottomMargin=10 * mm, title=title)
+    doc.build([Paragraph(escape(title), title_style), Spacer(1, 4 * mm), table])
+    return buffer.getvalue()
+
+def render_files(path, title, df, formats):
+    """1つの表を各形式にする。戻り値: [(ZIP 内のファイル名, 形式, バイト列, かかった秒数)]"""
+    outputs = []
+    for fmt in formats:
+        t = time.perf_counter()
+        outputs.append((f"{path}.{fmt}", fmt, render(df, fmt, title), time.perf_counter() - t))
+    return outputs
+
+def write_export_zip(fileobj, bundle, formats=("csv",), schedule_modes=None, max_workers=4, progress=None):
+    """
+    全路線の時刻表・名簿を fileobj (書き込み可能なファイル) に ZIP で書き出す。
+    表はこのスレッドで作り、ファイルへの変換だけを max_workers 並列で行う。
+    progress(済んだファイル数, 全ファイル数) は呼び出し元のスレッドから呼ぶ。
+    戻り値: {"files", "bytes", "seconds", "render_seconds": {形式: 合計秒}}
+    """
+    tables = list(export_tables(bundle, schedule_modes))
+    total = len(tables) * len(formats)
+    stats = {"files": 0, "bytes": 0, "seconds": 0.0, "render_seconds": {fmt: 0.0 for fmt in formats}}
+    t0 = time.perf_counter()
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="route-export")
+    with zipfile.ZipFile(fileobj, "w", compression=zipfile.ZIP_DEFLATED) as archive, executor:
+        pending = set()
+        def drain(block_until_below):
+            nonlocal pending
+            while len(pending) > block_until_below:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for name, fmt, data, seconds in future.result():
+                        archive.writestr(name, data)
+                        stats["files"] += 1
+                        stats["bytes"] += len(data)
+                        stats["render_seconds"][fmt] += seconds
+                    if progress: progress(stats["files"], total)
+        for path, title, make_table in tables:
+            pending.add(executor.submit(render_files, path, title, make_table(), formats))
+            drain(max_workers * 2)
+        drain(0)
+    stats["seconds"] = time.perf_counter() - t0
+    return stats
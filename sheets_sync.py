@@ -0,0 +1,198 @@
+"""
+Google Sheets との同期
+
+- 認証済みのクライアント (sheets v4 / drive v3) を1つ作って使い回す
+- まず Drive のメタデータ (modifiedTime / version) だけを見て、変わっていなければ前回のスナップショットを返す
+- 変わっていれば batchGet で全シートを1回で取得し、前回のスナップショットとの行単位の差分を計算して保存する
+  (Sheets API に差分取得は無いので、差分は手元で計算する)
+- API の定義 (discovery document) は、使うメソッドだけに絞ったものを discovery/ に同梱して使う
+  (作り直すとき: python sheets_sync.py write-discovery)
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+SHEETS_SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive.metadata.readonly",
+]
+
+DISCOVERY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "discovery")
+# 同梱する API とメソッド (SheetsSync が呼ぶものだけ)
+DISCOVERY_METHODS = {
+    ("sheets", "v4"): ["spreadsheets.values.batchGet"],
+    ("drive", "v3"): ["files.get"],
+}
+
+def discovery_path(api, version):
+    return os.path.join(DISCOVERY_DIR, f"{api}.{version}.json")
+
+def trim_discovery(document, methods):
+    """
+    discovery document を、methods ("spreadsheets.values.batchGet" など) とそれが参照する schema だけに絞る。
+    API 全体の定義は数百KBあるが、使うのは数メソッドだけなので、読み込み・解析が軽くなる。
+    """
+    trimmed = {k: v for k, v in document.items() if k not in ("resources", "schemas", "methods")}
+    trimmed["resources"] = {}
+    refs = []
+    for method_path in methods:
+        *resource_names, method_name = method_path.split(".")
+        src, dst = document, trimmed
+        for name in resource_names:
+            src = src["resources"][name]
+            dst = dst.setdefault("resources", {}).setdefault(name, {k: v for k, v in src.items() if k not in ("resources", "methods")})
+        method = src["methods"][method_name]
+        dst.setdefault("methods", {})[method_name] = method
+        refs += [method[k]["$ref"] for k in ("request", "response") if k in method]
+    schemas, all_schemas = {}, document.get("schemas", {})
+    while refs:
+        name = refs.pop()
+        if name in schemas or name not in all_schemas: continue
+        schemas[name] = all_schemas[name]
+        refs += _schema_refs(all_schemas[name])
+    trimmed["schemas"] = schemas
+    return trimmed
+
+def _schema_refs(node):
+    if isinstance(node, dict):
+        return ([node["$ref"]] if "$ref" in node else []) + [r for v in node.values() for r in _schema_refs(v)]
+    if isinstance(node, list):
+        return [r for v in node for r in _schema_refs(v)]
+    return []
+
+def write_discovery(output_dir=DISCOVERY_DIR):
+    """googleapiclient に入っている定義から、同梱用の絞った定義を書き出す"""
+    from googleapiclient.discovery_cache import get_static_doc
+    os.makedirs(output_dir, exist_ok=True)
+    for (api, version), methods in DISCOVERY_METHODS.items():
+        trimmed = trim_discovery(json.loads(get_static_doc(api, version)), methods)
+        with open(os.path.join(output_dir, f"{api}.{version}.json"), "w", encoding="utf-8") as f:
+            json.dump(trimmed, f, ensure_ascii=False, indent=1, sort_keys=True)
+
+def build_service(api, version, credentials, client_options=None):
+    """同梱の定義があればそれから作る (ネットワークにも googleapiclient 同梱の全定義にも触れない)"""
+    from googleapiclient.discovery import build, build_from_document
+    path = discovery_path(api, version)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return build_from_document(f.read(), credentials=credentials, client_options=client_options)
+    return build(api, version, credentials=credentials, client_options=client_options, cache_discovery=False)
+
+def build_services(credentials, api_endpoint=None):
+    """sheets / drive のサービスを作る。api_endpoint を渡すとそのURL (テスト用の偽API) に接続する"""
+    sheets_options = {"api_endpoint": api_endpoint} if api_endpoint else None
+    # api_endpoint は servicePath ごと置き換えるので、drive は本物と同じ /drive/v3/ を付ける
+    drive_options = {"api_endpoint": api_endpoint.rstrip("/") + "/drive/v3/"} if api_endpoint else None
+    sheets = build_service("sheets", "v4", credentials, sheets_options)
+    drive = build_service("drive", "v3", credentials, drive_options)
+    return sheets, drive
+
+def diff_rows(old_rows, new_rows):
+    """
+    行単位の差分 (ヘッダー行は除く)。同じ内容の行が複数あっても数で比べる。
+    戻り値: {"added": [行], "removed": [行], "unchanged": 件数}
+    """
+    old_count = Counter(tuple(r) for r in old_rows[1:])
+    new_count = Counter(tuple(r) for r in new_rows[1:])
+    added = new_count - old_count
+    removed = old_count - new_count
+    return {
+        "added": [list(r) for r in added.elements()],
+        "removed": [list(r) for r in removed.elements()],
+        "unchanged": sum((old_count & new_count).values()),
+    }
+
+class SheetsSync:
+    """
+    ranges: {"bus_stops": "bus_stops!A:H", ...} の形で、名前 → 取得範囲
+    sync() は {名前: [[ヘッダー], [行], ...]} を返す。
+    """
+    def __init__(self, sheets_service, drive_service, spreadsheet_id, ranges, snapshot_path=None):
+        self.sheets = sheets_service
+        self.drive = drive_service
+        self.spreadsheet_id = spreadsheet_id
+        self.ranges = ranges
+        self.snapshot_path = snapshot_path
+        self.snapshot = self._read_snapshot()
+        self.stats = {"metadata_calls": 0, "batch_gets": 0, "unchanged": 0, "last_diff": None, "last_sync": None}
+        self._lock = threading.Lock()  # googleapiclient (httplib2) はスレッドセーフではない
+
+    def _read_snapshot(self):
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path): return None
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            if set(snapshot.get("tables", {})) != set(self.ranges): return None
+            return snapshot
+        except (OSError, ValueError):
+            return None
+
+    def _write_snapshot(self):
+        if not self.snapshot_path: return
+        if os.path.dirname(self.snapshot_path): os.makedirs(os.path.dirname(self.snapshot_path), exist_ok=True)
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot, f, ensure_ascii=False)
+        os.replace(tmp_path, self.snapshot_path)
+
+    def revision(self):
+        """スプレッドシートの更新時刻とバージョン。取れなければ None"""
+        self.stats["metadata_calls"] += 1
+        try:
+            meta = self.drive.files().get(fileId=self.spreadsheet_id, fields="modifiedTime,version", supportsAllDrives=True).execute()
+            return f"{meta.get('modifiedTime')}#{meta.get('version')}"
+        except Exception:
+            return None
+
+    def sync(self, force=False):
+        with self._lock:
+            revision = self.revision()
+            if not force and revision is not None and self.snapshot and self.snapshot.get("revision") == revision:
+                self.stats["unchanged"] += 1
+                self.stats["last_sync"] = time.time()
+                return self.snapshot["tables"]
+
+            names = list(self.ranges)
+            self.stats["batch_gets"] += 1
+            res = self.sheets.spreadsheets().values().batchGet(
+                spreadsheetId=self.spreadsheet_id, ranges=[self.ranges[n] for n in names]
+            ).execute()
+            value_ranges = res.get("valueRanges", [])
+            fetched = {n: (value_ranges[i].get("values", []) if i < len(value_ranges) else []) for i, n in enumerate(names)}
+
+            old_tables = self.snapshot["tables"] if self.snapshot else {}
+            old_revision = self.snapshot.get("revision") if self.snapshot else None
+            tables, diffs = {}, {}
+            for n, new_rows in fetched.items():
+                old_rows = old_tables.get(n)
+                if old_rows and new_rows and old_rows[0] == new_rows[0]:
+                    diff = diff_rows(old_rows, new_rows)
+                    diffs[n] = {"added": len(diff["added"]), "removed": len(diff["removed"]), "unchanged": diff["unchanged"]}
+                else:
+                    diffs[n] = {"added": max(len(new_rows) - 1, 0), "removed": max(len(old_rows or []) - 1, 0), "unchanged": 0}
+                tables[n] = new_rows  # 並び順はシートに合わせる
+            changed = any(d["added"] or d["removed"] for d in diffs.values()) or old_tables.keys() != tables.keys()
+            self.snapshot = {"revision": revision, "synced_at": time.time(), "tables": tables}
+            self.stats["last_diff"] = diffs
+            self.stats["last_sync"] = time.time()
+            if changed or revision != old_revision: self._write_snapshot()
+            return tables
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="同梱する API 定義 (discovery document) の作成")
+    parser.add_argument("command", choices=["write-discovery"])
+    parser.add_argument("--output-dir", default=DISCOVERY_DIR)
+    args = parser.parse_args(argv)
+    write_discovery(args.output_dir)
+    for (api, version) in DISCOVERY_METHODS:
+        path = os.path.join(args.output_dir, f"{api}.{version}.json")
+        print(f"{path}: {os.path.getsize(path) / 1024:.1f} KiB")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
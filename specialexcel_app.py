@@ -1,31 +1,49 @@
 import streamlit as st
-import pandas as pd
-import folium
-from folium.plugins import Fullscreen
-from streamlit_folium import st_folium
 import json
 import os
-import unicodedata
-import requests
-import xml.etree.ElementTree as ET
-import re
-
-# 住所検索・距離計算用ライブラリ
-try:
-    from geopy.distance import geodesic
-    HAS_GEOPY = True
-except ImportError:
-    HAS_GEOPY = False
-
-# Google API 関連
-from googleapiclient.discovery import build
-from google.oauth2.service_account import Credentials
+import time
+import hashlib
+import tempfile
+from collections import deque
 
 # =========================================================
 # 🔐 0. 簡易ログイン & 設定
 # =========================================================
 PASSWORD = st.secrets.get("app_password", "bus")
+ADMIN_PASSWORD = st.secrets.get("admin_password")  # このパスワードでログインすると管理者 (計測パネルが見える)
 SPREADSHEET_ID = "1yXSXSjYBaV2jt2BNO638Y2YZ6U7rdOCv5ScozlFq_EE"
+DATA_DIR = os.environ.get("BUS_DATA_DIR", "data")
+CACHE_DIR = os.environ.get("BUS_CACHE_DIR", ".cache")
+# 路線ラインの軽量化: 座標の小数桁 (5桁 ≒ 1m) と、この縮尺で 0.5px 未満のずれを間引く (0 で簡略化なし)
+ROUTE_COORD_DECIMALS = int(os.environ.get("BUS_ROUTE_DECIMALS", "5"))
+ROUTE_SIMPLIFY_ZOOM = int(os.environ.get("BUS_ROUTE_SIMPLIFY_ZOOM", "16"))
+# 軽量描画: 選択中の路線だけポップアップ付きで描き、それ以外のバス停は1つの軽いレイヤーにまとめる
+MAP_LIGHT_MODE = os.environ.get("BUS_MAP_LIGHT", "1") != "0"
+# データ (Sheets / CSV) を裏で読み直す間隔と、失敗したときに再び試すまでの秒数
+DATA_REFRESH_SECONDS = int(os.environ.get("BUS_DATA_REFRESH_SECONDS", "600"))
+DATA_RETRY_SECONDS = int(os.environ.get("BUS_DATA_RETRY_SECONDS", "60"))
+# 全セッション共有の計算結果キャッシュ (地図・時刻表・最寄りバス停) の上限
+SHARED_CACHE_ENTRIES = int(os.environ.get("BUS_SHARED_CACHE_ENTRIES", "256"))
+SHARED_CACHE_MB = int(os.environ.get("BUS_SHARED_CACHE_MB", "256"))
+GEOCODE_MODE = os.environ.get("BUS_GEOCODE_MODE", "race")  # "race": 全プロバイダ並列 / "serial": 従来の順番検索
+# 住所CSVの一括割り当てで同時に問い合わせる住所の数 (一括割り当ては常に住所ごとの順番検索。画面の検索とは接続を分ける)
+BULK_GEOCODE_WORKERS = int(os.environ.get("BUS_BULK_GEOCODE_WORKERS", "8"))
+# 再実行ごとの段階別の計測: "admin": 管理者のセッションだけ / "1": 常に / "0": しない (計測パネルは常に管理者だけに出す)
+PROFILE_MODE = os.environ.get("BUS_PROFILE", "admin")
+PROFILE_HISTORY = int(os.environ.get("BUS_PROFILE_HISTORY", "20"))
+PROFILE_LOG = os.environ.get("BUS_PROFILE_LOG")  # 指定すると計測結果を JSON Lines で追記する
+# 地図タイルの中継 (tile_cache.py): ブラウザから見た中継サーバの URL (利用者の各ブラウザから届く URL を指定する)。
+# BUS_TILE_PROXY_EMBED=1 ならこのプロセス内で起動する (BUS_TILE_PROXY_URL が未設定なら起動しない)。
+# 待ち受けは既定で 127.0.0.1 のみ。ほかの端末へ公開するときは BUS_TILE_PROXY_HOST とリバースプロキシ側で設定する
+TILE_PROXY_EMBED = os.environ.get("BUS_TILE_PROXY_EMBED") == "1"
+TILE_PROXY_HOST = os.environ.get("BUS_TILE_PROXY_HOST", "127.0.0.1")
+TILE_PROXY_PORT = int(os.environ.get("BUS_TILE_PROXY_PORT", "8765"))
+TILE_PROXY_URL = os.environ.get("BUS_TILE_PROXY_URL")
+TILE_CACHE_MB = int(os.environ.get("BUS_TILE_CACHE_MB", "500"))
+# バス停と路線ラインの照合で「路線から離れている」とする距離 (m)
+SNAP_MAX_DISTANCE_M = float(os.environ.get("BUS_SNAP_MAX_DISTANCE_M", "100"))
+# 時刻表・名簿の一括出力でファイルを並列に作るスレッド数 (既定は CPU 数、最大4)
+EXPORT_WORKERS = int(os.environ.get("BUS_EXPORT_WORKERS", str(min(4, os.cpu_count() or 1))))
 
 # 🎨 配色設定
 ROUTE_COLORS = {
@@ -53,6 +71,19 @@ ROUTE_COLORS = {
 }
 DEFAULT_COLOR = "#333333"
 
+@st.cache_resource
+def start_import_warmup():
+    """ログイン画面を出した後、パスワード入力を待つ間に重いモジュールを裏で読み込んでおく (プロセスにつき1回)"""
+    import importlib
+    import threading
+    def warm():
+        for name in ("pandas", "numpy", "folium", "folium.plugins", "map_layers", "geo_utils", "data_store", "name_search"):
+            try: importlib.import_module(name)
+            except Exception: pass
+    thread = threading.Thread(target=warm, name="import-warmup", daemon=True)
+    thread.start()
+    return thread
+
 def check_password():
     if "logged_in" not in st.session_state:
         st.session_state["logged_in"] = False
@@ -62,82 +93,366 @@ def check_password():
         st.markdown("## 🔒 スクールバス運行管理")
         input_pass = st.text_input("パスワード", type="password")
         if st.button("ログイン", type="primary"):
-            if input_pass == PASSWORD:
+            if ADMIN_PASSWORD and input_pass == ADMIN_PASSWORD:
+                st.session_state["logged_in"] = True
+                st.session_state["is_admin"] = True
+                st.rerun()
+            elif input_pass == PASSWORD:
                 st.session_state["logged_in"] = True
                 st.rerun()
             else:
                 st.error("パスワードが違います")
+        start_import_warmup()
         return False
     return True
 
 if not check_password():
     st.stop()
 
+# ログイン画面では使わないモジュール (地図・データ処理・外部API) は、ログインしてから読み込む
+import pandas as pd
+import numpy as np
+import folium
+from folium.plugins import Fullscreen
+
+from geo_utils import SegmentGridIndex, StopGridIndex, meters_per_pixel, simplify_geojson, snap_stops_to_routes
+from caching import BackgroundRefresher, SharedViewCache
+from geocoding import (
+    GeocodeCache, GeocodeUnavailable, RacingGeocoder, geocode_with_cache, normalize_address, pooled_session, search_address_ultimate,
+)
+from data_store import (
+    clean_df, csv_fingerprint, lookup_stop_ids, read_csv_auto_encoding, read_csv_bytes, read_snapshot, read_snapshot_meta,
+    stop_key_index, to_compact_model, write_snapshot,
+)
+from sheets_sync import SHEETS_SCOPES, SheetsSync, build_services
+from name_search import StudentSearchIndex
+from bulk_assign import UNAVAILABLE_SOURCE, bulk_assign, find_nearest_stops_batch, guess_address_column, to_download_csv
+from route_export import available_formats, build_roster, prune_exports, write_export_zip
+from profiling import RerunProfiler, append_jsonl, to_jsonl
+from map_layers import LazyStopLayer
+from tile_cache import TILE_SOURCES, TileProxy, TileStore, proxied_url, serve as serve_tiles
+
 st.set_page_config(layout="wide", page_title="スクールバス運行マップ (Pro)")
 
+is_admin = st.session_state.get("is_admin", False)
+profiler = RerunProfiler(enabled=PROFILE_MODE == "1" or (PROFILE_MODE == "admin" and is_admin))
+
 # ---------------------------------------------------------
 # 📥 データ読み込み
 # ---------------------------------------------------------
-def clean_df(df):
-    if df.empty: return df
-    df = df.fillna("")
-    for col in df.select_dtypes(include=['object']).columns:
-        df[col] = df[col].astype(str).str.strip()
-        df[col] = df[col].replace(["nan", "None"], "")
-    return df
-
-def read_csv_auto_encoding(file_path):
-    try:
-        return clean_df(pd.read_csv(file_path, encoding='utf-8'))
-    except UnicodeDecodeError:
-        return clean_df(pd.read_csv(file_path, encoding='cp932'))
+LOCAL_CSV_PATHS = [os.path.join(DATA_DIR, "bus_stops.csv"), os.path.join(DATA_DIR, "students.csv")]
+SNAPSHOT_DIR = os.path.join(CACHE_DIR, "snapshot")
 
-def load_local_csv():
+def load_local_csv(encodings=None):
+    """戻り値: (stops_df, students_df, 成功したか, {ファイル名: 文字コード})"""
+    encodings = encodings or {}
     try:
-        s_df = read_csv_auto_encoding("data/bus_stops.csv")
-        st_df = read_csv_auto_encoding("data/students.csv")
-        return s_df, st_df, True
+        s_path, st_path = LOCAL_CSV_PATHS
+        s_df, s_enc = read_csv_auto_encoding(s_path, encodings.get(os.path.basename(s_path)))
+        st_df, st_enc = read_csv_auto_encoding(st_path, encodings.get(os.path.basename(st_path)))
+        return s_df, st_df, True, {os.path.basename(s_path): s_enc, os.path.basename(st_path): st_enc}
     except FileNotFoundError:
-        return pd.DataFrame(), pd.DataFrame(), False
+        return pd.DataFrame(), pd.DataFrame(), False, {}
 
-def load_from_google_sheets():
-    if "google_credentials" not in st.secrets:
-        raise ValueError("Secretsなし")
+def read_usable_snapshot():
+    """スナップショット (stops, students, meta)。無い・CSV 由来で CSV の方が新しければ None"""
+    snapshot = read_snapshot(SNAPSHOT_DIR)
+    if snapshot and (snapshot[2]["source"] != "csv" or snapshot[2].get("csv") == csv_fingerprint(LOCAL_CSV_PATHS)):
+        return snapshot
+    return None
+
+def load_offline():
+    """
+    Sheets が使えないときの読み込み。
+    スナップショットがあればそれを直接使う (CSV 由来のものは CSV が更新されていなければ)。
+    無ければ CSV を読み、記録済みの文字コードを使ってスナップショットを作り直す。
+    """
+    snapshot = read_usable_snapshot()
+    if snapshot:
+        label = "CSV (Offline・スナップショット)" if snapshot[2]["source"] == "csv" else "Google Sheets (Offline・スナップショット)"
+        return snapshot[0], snapshot[1], label
+    meta = read_snapshot_meta(SNAPSHOT_DIR) or {}
+    stops_df, students_df, success, encodings = load_local_csv(meta.get("encodings"))
+    if not success: return None
+    stops_df, students_df = normalize_frames(stops_df, students_df)
+    try: write_snapshot(SNAPSHOT_DIR, stops_df, students_df, "csv", {"encodings": encodings, "csv": csv_fingerprint(LOCAL_CSV_PATHS)})
+    except Exception: pass
+    return stops_df, students_df, "CSV (Offline)"
+
+@st.cache_resource
+def get_sheets_sync():
+    """認証済みクライアントを1つだけ作り、全セッションで使い回す"""
+    from google.oauth2.service_account import Credentials  # Google API は使うときだけ読み込む
     creds_dict = dict(st.secrets["google_credentials"])
     if "private_key" in creds_dict:
         creds_dict["private_key"] = creds_dict["private_key"].replace("\\n", "\n")
-    credentials = Credentials.from_service_account_info(
-        creds_dict, scopes=["https://www.googleapis.com/auth/spreadsheets"]
+    credentials = Credentials.from_service_account_info(creds_dict, scopes=SHEETS_SCOPES)
+    sheets_service, drive_service = build_services(credentials)
+    return SheetsSync(
+        sheets_service, drive_service, SPREADSHEET_ID,
+        {"bus_stops": "bus_stops!A:H", "students": "students!A:I"},
+        snapshot_path=os.path.join(CACHE_DIR, "sheets_snapshot.json"),
     )
-    service = build('sheets', 'v4', credentials=credentials)
-    sheet_stops = service.spreadsheets().values().get(spreadsheetId=SPREADSHEET_ID, range="bus_stops!A:H").execute()
-    rows_stops = sheet_stops.get('values', [])
+
+def load_from_google_sheets():
+    if "google_credentials" not in st.secrets:
+        raise ValueError("Secretsなし")
+    tables = get_sheets_sync().sync()
+    rows_stops = tables["bus_stops"]
     stops_df = pd.DataFrame(rows_stops[1:], columns=rows_stops[0]) if rows_stops else pd.DataFrame()
-    sheet_students = service.spreadsheets().values().get(spreadsheetId=SPREADSHEET_ID, range="students!A:I").execute()
-    rows_students = sheet_students.get('values', [])
+    rows_students = tables["students"]
     students_df = pd.DataFrame(rows_students[1:], columns=rows_students[0]) if rows_students else pd.DataFrame()
     return clean_df(stops_df), clean_df(students_df)
 
-@st.cache_data(ttl=600)
-def load_data():
-    data_source = "未定義"
-    try:
-        stops_df, students_df = load_from_google_sheets()
-        if stops_df.empty: raise ValueError("Sheet Empty")
-        data_source = "Google Sheets (Live)"
-    except Exception:
-        stops_df, students_df, success = load_local_csv()
-        if success: data_source = "CSV (Offline)"
-        else:
-            st.error("❌ データ読み込み失敗"); st.stop()
+def normalize_frames(stops_df, students_df):
     stops_df["lat"] = pd.to_numeric(stops_df["lat"], errors='coerce')
     stops_df["lng"] = pd.to_numeric(stops_df["lng"], errors='coerce')
     for col in ["time_to", "time_from"]:
         if col not in stops_df.columns: stops_df[col] = "-"
     if "direction" not in students_df.columns: students_df["direction"] = "-"
-    return stops_df, students_df, data_source
+    return stops_df, students_df
+
+LIVE_SOURCE = "Google Sheets (Live)"
+STARTUP_SNAPSHOT_SOURCE = "Google Sheets (スナップショット・更新中)"
+
+def fetch_data(previous=None):
+    """
+    Sheets → (読めなければ) スナップショット / CSV の順に読む。戻り値: (stops, students, 読み込み元, data_version)
+    裏のスレッドからも呼ぶので、Streamlit の表示はしない。
+    previous が Sheets から読めたデータなら、Sheets の失敗で古いオフラインのデータには戻さず例外にする (previous を使い続ける)。
+    """
+    live = None
+    try:
+        stops_df, students_df = load_from_google_sheets()
+        if stops_df.empty: raise ValueError("Sheet Empty")
+        data_source = LIVE_SOURCE
+        stops_df, students_df = live = normalize_frames(stops_df, students_df)
+    except Exception:
+        if previous is not None and previous[2] == LIVE_SOURCE: raise
+        offline = load_offline()
+        if offline is None: raise RuntimeError("データ読み込み失敗")
+        stops_df, students_df, data_source = offline
+    # 文字列の多い列は category に、バス停には整数の stop_id を付ける
+    stops_df, students_df = to_compact_model(stops_df, students_df)
+    data_version = compute_data_version(stops_df, students_df)
+    if live is not None and (read_snapshot_meta(SNAPSHOT_DIR) or {}).get("data_version") != data_version:
+        # スナップショットは中身が変わったときだけ書き直す
+        try: write_snapshot(SNAPSHOT_DIR, *live, "sheets", {"data_version": data_version})
+        except Exception: pass
+    if previous is not None and previous[2] == data_source and previous[3] == data_version: return previous
+    return stops_df, students_df, data_source, data_version
 
-raw_stops_df, raw_students_df, current_source = load_data()
+def load_startup_snapshot():
+    """
+    起動直後の最初の値。スナップショットがあればそれをすぐ返し (Sheets は裏のスレッドで読む)、無ければ None。
+    CSV 由来のものは load_offline と同じ読み込み元の表示にする。
+    """
+    snapshot = read_usable_snapshot()
+    if snapshot is None: return None
+    stops_df, students_df, meta = snapshot
+    data_source = "CSV (Offline・スナップショット)" if meta["source"] == "csv" else STARTUP_SNAPSHOT_SOURCE
+    stops_df, students_df = to_compact_model(stops_df, students_df)
+    return stops_df, students_df, data_source, compute_data_version(stops_df, students_df)
+
+@st.cache_resource(on_release=lambda refresher: refresher.stop())
+def get_data_refresher():
+    """
+    データは裏のスレッドで DATA_REFRESH_SECONDS ごとに読み直し、読めたら入れ替える (全セッション共有)。
+    起動直後はスナップショットから始め、Sheets はすぐ裏で読みに行く。
+    """
+    return BackgroundRefresher(fetch_data, interval=DATA_REFRESH_SECONDS, retry_interval=DATA_RETRY_SECONDS, seed=load_startup_snapshot)
+
+def load_data():
+    """待つのは起動後の最初の読み込みだけ。以降は裏で読み直し済みのデータをすぐ返す"""
+    try: return get_data_refresher().get()
+    except Exception:
+        st.error("❌ データ読み込み失敗"); st.stop()
+
+def compute_data_version(*dfs):
+    """読み込んだデータ内容のハッシュ (キャッシュのキーに使う)"""
+    h = hashlib.md5()
+    for df in dfs:
+        h.update(",".join(map(str, df.columns)).encode("utf-8"))
+        if not df.empty: h.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return h.hexdigest()
+
+with profiler.span("load_data"): raw_stops_df, raw_students_df, current_source, data_version = load_data()
+
+def build_stop_student_index(students_df):
+    """
+    (route, stop_name) → {"登校": [名前], "下校": [名前], "all": [(名前, 区分の頭文字)]}
+    データ読み込み & スケジュールごとに1回だけ作り、地図のポップアップと時刻表で共用する。
+    """
+    index = {}
+    if students_df.empty: return index
+    for r_name, s_name, name, direction in zip(
+        students_df["route"], students_df["stop_name"], students_df["name"], students_df["direction"]
+    ):
+        bucket = index.get((r_name, s_name))
+        if bucket is None:
+            bucket = index[(r_name, s_name)] = {"登校": [], "下校": [], "all": []}
+        d_raw = str(direction)
+        if "登校" in d_raw: bucket["登校"].append(name)
+        if "下校" in d_raw: bucket["下校"].append(name)
+        bucket["all"].append((name, d_raw[0] if len(d_raw) > 0 else "?"))
+    return index
+
+EMPTY_STOP_BUCKET = {"登校": [], "下校": [], "all": []}
+
+TIMETABLE_STUDENT_COLS = {"登校": "students_to", "下校": "students_from", "all": "students_all"}
+
+def build_route_timetable(stop_orders, routes, students_df):
+    """
+    全路線の時刻表 (バス停順) を1つの DataFrame にまとめる。
+    列: stop_id, route, stop_name, (sequence), time_to, time_from, students_to, students_from, students_all
+    生徒名は (route, stop_name) ごとに「、」で連結済み (students_all は 名前(区分の頭文字))。
+    """
+    cols = ["stop_id", "route", "stop_name", "sequence", "time_to", "time_from"]
+    frames = [stop_orders[r][[c for c in cols if c in stop_orders[r].columns]] for r in routes if r in stop_orders]
+    if not frames: return pd.DataFrame(columns=["stop_id", "route", "stop_name", "time_to", "time_from", *TIMETABLE_STUDENT_COLS.values()])
+    table = pd.concat(frames, ignore_index=True)
+    table["route"] = table["route"].astype(str); table["stop_name"] = table["stop_name"].astype(str)
+    for col in ("time_to", "time_from"):
+        if col not in table.columns: table[col] = "-"
+    if not students_df.empty:
+        s = pd.DataFrame({
+            "route": students_df["route"].astype(str).values,
+            "stop_name": students_df["stop_name"].astype(str).values,
+            "name": students_df["name"].astype(str).values,
+            "direction": students_df["direction"].astype(str).values,
+        })
+        mark = s["direction"].str[0].fillna("?")
+        s["entry"] = s["name"] + "(" + mark + ")"
+        keys = ["route", "stop_name"]
+        groups = [
+            s[s["direction"].str.contains("登校", regex=False)].groupby(keys, sort=False)["name"].agg("、".join).rename("students_to"),
+            s[s["direction"].str.contains("下校", regex=False)].groupby(keys, sort=False)["name"].agg("、".join).rename("students_from"),
+            s.groupby(keys, sort=False)["entry"].agg("、".join).rename("students_all"),
+        ]
+        table = table.join(pd.concat(groups, axis=1), on=keys)
+    for col in TIMETABLE_STUDENT_COLS.values():
+        table[col] = table[col].fillna("") if col in table.columns else ""
+    return table
+
+# ---------------------------------------------------------
+# 🛣️ 路線 GeoJSON (ファイルの更新時刻ごとに1回だけ読み込む)
+# ---------------------------------------------------------
+def route_direction(r_name):
+    if "（登校）" in r_name: return "登校"
+    if "（下校）" in r_name: return "下校"
+    return None
+
+@st.cache_resource(max_entries=8)
+def load_route_geojson(path, mtime, decimals=ROUTE_COORD_DECIMALS, simplify_zoom=ROUTE_SIMPLIFY_ZOOM):
+    """
+    GeoJSON を読み込み、各 feature の name を確定させ、座標の丸め・簡略化をした状態で返す。
+    戻り値: {"data", "names", "directions", "route_groups", "load_ms", "feature_count", "raw_bytes", "bytes"}
+    """
+    t0 = time.perf_counter()
+    with open(path, "r", encoding="utf-8") as f:
+        raw_text = f.read()
+    geojson_data = json.loads(raw_text)
+    names = []
+    for feature in geojson_data.get("features", []):
+        if "properties" not in feature or feature["properties"] is None: feature["properties"] = {}
+        props = feature["properties"]
+        if "name" not in props or props["name"] == "不明":
+            for key in props.keys():
+                if key in ROUTE_COLORS:
+                    props["name"] = key; break
+            if "name" not in props: props["name"] = "不明"
+        names.append(props["name"])
+    if simplify_zoom > 0 or decimals < 15:
+        lats = [c[1] for ft in geojson_data.get("features", []) if (ft.get("geometry") or {}).get("type") == "LineString" for c in ft["geometry"]["coordinates"]]
+        tolerance_m = meters_per_pixel(simplify_zoom, sum(lats) / len(lats)) / 2 if (simplify_zoom > 0 and lats) else 0
+        geojson_data = simplify_geojson(geojson_data, tolerance_m, decimals)
+    unique_names = list(dict.fromkeys(names))
+    return {
+        "data": geojson_data,
+        "raw_bytes": len(raw_text.encode("utf-8")),
+        "bytes": len(json.dumps(geojson_data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")),
+        "names": unique_names,
+        "directions": {n: route_direction(n) for n in unique_names},
+        "route_groups": {},
+        "load_ms": (time.perf_counter() - t0) * 1000,
+        "feature_count": len(names),
+    }
+
+def route_feature_group(route_geo, route_name):
+    """路線名に対応する feature 名の集合 (完全一致 or 部分一致)。路線ごとに1回だけ計算する"""
+    group = route_geo["route_groups"].get(route_name)
+    if group is None:
+        sr = route_name.strip()
+        group = frozenset(n for n in route_geo["names"] if n.strip() == sr or n.strip() in sr or sr in n.strip())
+        route_geo["route_groups"][route_name] = group
+    return group
+
+def build_route_snap(schedule_view, route_geo, max_distance_m=SNAP_MAX_DISTANCE_M):
+    """
+    スケジュールの全バス停を路線ライン (GeoJSON) に載せ、起点からの距離と要確認の印を付ける。
+    戻り値: バス停ごとの DataFrame (stop_id, route, stop_name, sequence, line_name, distance_m, chainage_m, far, out_of_order) と計算時間 [ms]
+    """
+    t0 = time.perf_counter()
+    lines, line_names = [], []
+    for feature in route_geo["data"].get("features", []):
+        geometry = feature.get("geometry") or {}
+        if geometry.get("type") == "LineString": parts = [geometry["coordinates"]]
+        elif geometry.get("type") == "MultiLineString": parts = geometry["coordinates"]
+        else: continue
+        for part in parts:
+            lines.append(part)
+            line_names.append(feature["properties"]["name"])
+    stops = schedule_view["stops"]
+    route_lines = {r: [i for i, n in enumerate(line_names) if n in route_feature_group(route_geo, r)] for r in schedule_view["routes"]}
+    snap = snap_stops_to_routes(stops, SegmentGridIndex(lines), route_lines, max_distance_m)
+    cols = [c for c in ("stop_id", "route", "stop_name", "sequence") if c in stops.columns]
+    result = stops[cols].assign(**{c: snap[c] for c in snap.columns})
+    result["line_name"] = [line_names[i] if i >= 0 else None for i in snap["line"]]
+    return result.drop(columns="line"), (time.perf_counter() - t0) * 1000
+
+# ---------------------------------------------------------
+# 📅 スケジュールごとの表示用データ
+# ---------------------------------------------------------
+SCHEDULES = {
+    "通常便": {"schedule_type": "通常", "route_col": "route_normal", "stop_col": "stop_normal", "geojson": "routes.geojson"},
+    "小中時差便": {"schedule_type": "時差", "route_col": "route_jisa", "stop_col": "stop_jisa", "geojson": "routes_jisa.geojson"},
+    "高時差便": {"schedule_type": "高等部", "route_col": "route_kotobu", "stop_col": "stop_kotobu", "geojson": "routes_kotobu.geojson"},
+}
+
+@st.cache_resource(max_entries=4)
+def build_schedule_bundle(data_version, _raw_stops_df, _raw_students_df):
+    """
+    3つのスケジュールそれぞれの バス停 / 生徒 / 路線一覧 / 路線ごとのバス停順 / 検索インデックス を作る。
+    全セッションで共有するので、返した DataFrame は書き換えないこと。
+    """
+    bundle = {}
+    stop_keys = stop_key_index(_raw_stops_df)  # (route, stop_name) → stop_id
+    for schedule_mode, conf in SCHEDULES.items():
+        if "schedule_type" in _raw_stops_df.columns:
+            stops_df = _raw_stops_df[_raw_stops_df["schedule_type"] == conf["schedule_type"]].copy()
+        else:
+            stops_df = _raw_stops_df.copy()
+        students_df = _raw_students_df.copy()
+        if conf["route_col"] in students_df.columns and conf["stop_col"] in students_df.columns:
+            students_df["route"] = students_df[conf["route_col"]]
+            students_df["stop_name"] = students_df[conf["stop_col"]]
+        students_df = students_df[students_df["route"] != ""]
+        students_df["stop_id"] = lookup_stop_ids(stop_keys, students_df["route"], students_df["stop_name"])
+        stop_orders = {}
+        for r_name, route_stops in stops_df.groupby("route", sort=False, observed=True):
+            stop_orders[r_name] = route_stops.sort_values("sequence") if "sequence" in route_stops.columns else route_stops
+        bundle[schedule_mode] = {
+            "stops": stops_df,
+            "stop_keys": stop_keys,
+            "students": students_df,
+            "routes": sorted(stops_df["route"].unique().tolist()),
+            "stop_orders": stop_orders,
+            "student_index": build_stop_student_index(students_df),
+            "grid_index": StopGridIndex(stops_df),
+            "search_index": StudentSearchIndex(students_df),
+        }
+        bundle[schedule_mode]["timetable"] = build_route_timetable(stop_orders, bundle[schedule_mode]["routes"], students_df)
+    return bundle
 
 # ---------------------------------------------------------
 # 🧠 UI & ロジック
@@ -155,30 +470,19 @@ if st.session_state["current_schedule_mode"] != schedule_mode:
 
 st.sidebar.markdown("---")
 
-# データ前処理
-target_schedule_type = "通常"
-if schedule_mode == "小中時差便": target_schedule_type = "時差"
-elif schedule_mode == "高時差便": target_schedule_type = "高等部"
-
-if "schedule_type" in raw_stops_df.columns:
-    stops_df = raw_stops_df[raw_stops_df["schedule_type"] == target_schedule_type].copy()
-else:
-    stops_df = raw_stops_df.copy()
-
-students_df = raw_students_df.copy()
-if schedule_mode == "通常便": src_route_col, src_stop_col = "route_normal", "stop_normal"
-elif schedule_mode == "小中時差便": src_route_col, src_stop_col = "route_jisa", "stop_jisa"
-else: src_route_col, src_stop_col = "route_kotobu", "stop_kotobu"
-
-if src_route_col in students_df.columns and src_stop_col in students_df.columns:
-    students_df["route"] = students_df[src_route_col]
-    students_df["stop_name"] = students_df[src_stop_col]
-
-students_df = students_df[students_df["route"] != ""]
-
-geojson_file_path = "data/routes.geojson"
-if schedule_mode == "小中時差便": geojson_file_path = "data/routes_jisa.geojson"
-elif schedule_mode == "高時差便": geojson_file_path = "data/routes_kotobu.geojson"
+# データ前処理 (スケジュールごとの表示用データは読み込み1回につき1回だけ作る)
+with profiler.span("schedule_bundle"): schedule_bundle = build_schedule_bundle(data_version, raw_stops_df, raw_students_df)
+schedule_view = schedule_bundle[schedule_mode]
+stops_df = schedule_view["stops"]
+students_df = schedule_view["students"]
+stop_student_index = schedule_view["student_index"]
+stop_grid_index = schedule_view["grid_index"]
+geojson_file_path = os.path.join(DATA_DIR, SCHEDULES[schedule_mode]["geojson"])
+with profiler.span("geojson"):
+    route_geo = None
+    if os.path.exists(geojson_file_path):
+        try: route_geo = load_route_geojson(geojson_file_path, os.path.getmtime(geojson_file_path))
+        except Exception: route_geo = None
 
 mode_selection = st.sidebar.radio("表示モード", ("☀️ 登校 (行き)", "🌙 下校 (帰り)", "🔄 すべて (全体)"), horizontal=False)
 is_to_school = (mode_selection == "☀️ 登校 (行き)")
@@ -213,82 +517,62 @@ st.sidebar.subheader("🏠 住所でバス停検索")
 input_address = st.sidebar.text_input("住所を入力", placeholder="例: 〇〇区〇〇町 3-15")
 st.sidebar.caption("※番地が見つからない場合は自動で周辺を表示します。")
 
-def search_address_ultimate(address_str):
-    """
-    1. 国土地理院API (最強・あいまい検索可)
-    2. 農研機構API
-    3. Geocoding.jp
-    4. 最後の手段: 数字を削除して町名だけで検索
-    """
-    normalized_addr = unicodedata.normalize('NFKC', address_str)
-    
-    # 検索リスト（そのままの住所 と、数字を除去した町名のみ）
-    search_queries = [normalized_addr]
-    
-    # 数字除去バージョンの作成 (例: 深作3 -> 深作)
-    addr_without_digits = re.sub(r'\d+[-]*\d*', '', normalized_addr).strip()
-    if addr_without_digits and addr_without_digits != normalized_addr:
-        search_queries.append(addr_without_digits)
+@st.cache_resource
+def get_geocode_cache():
+    return GeocodeCache(os.path.join(CACHE_DIR, "geocode.sqlite3"))
 
-    for query in search_queries:
-        # --- 1. 国土地理院 API (Msearch) ---
-        try:
-            url_gsi = "https://msearch.gsi.go.jp/address-search/AddressSearch"
-            res_gsi = requests.get(url_gsi, params={"q": query}, timeout=10)
-            if res_gsi.status_code == 200:
-                data = res_gsi.json()
-                if len(data) > 0:
-                    coords = data[0]["geometry"]["coordinates"] # [lon, lat]
-                    return float(coords[1]), float(coords[0]), "国土地理院"
-        except Exception:
-            pass
-
-        # --- 2. 農研機構 API ---
-        try:
-            url_naro = "https://aginfo.cgk.affrc.go.jp/ws/geocode/search"
-            headers = {"User-Agent": "school_bus_app_v5"}
-            res_naro = requests.get(url_naro, params={"addr": query}, headers=headers, timeout=10)
-            if res_naro.status_code == 200:
-                data = res_naro.json()
-                if data.get("result") and len(data["result"]) > 0:
-                    top = data["result"][0]
-                    return float(top["lat"]), float(top["lon"]), "農研機構"
-        except Exception:
-            pass
-
-        # --- 3. Geocoding.jp ---
-        try:
-            url_geo = f"https://www.geocoding.jp/api/?q={query}"
-            res_geo = requests.get(url_geo, timeout=10)
-            if res_geo.status_code == 200:
-                tree = ET.fromstring(res_geo.content)
-                lat_node = tree.find("coordinate/lat")
-                lng_node = tree.find("coordinate/lng")
-                if lat_node is not None and lng_node is not None:
-                    return float(lat_node.text), float(lng_node.text), "Geocoding.jp"
-        except Exception:
-            pass
-            
-    return None, None, None
+@st.cache_resource
+def get_racing_geocoder():
+    return RacingGeocoder()
+
+@st.cache_resource
+def get_shared_cache():
+    """全セッション共有。キーに data_version を含め、データが変わったら古いものは自動で捨てる"""
+    return SharedViewCache(max_entries=SHARED_CACHE_ENTRIES, max_bytes=SHARED_CACHE_MB * 1024 * 1024)
+
+geocode_cache = get_geocode_cache()
+shared_cache = get_shared_cache()
+
+def geocode_search(address):
+    """住所検索を使うときに初めて問い合わせ用のクライアントを作る (requests もここで読み込まれる)"""
+    if GEOCODE_MODE == "race": return get_racing_geocoder().search(address)
+    return search_address_ultimate(address)
+
+@st.cache_resource
+def get_bulk_geocode_session():
+    return pooled_session(BULK_GEOCODE_WORKERS)
+
+def bulk_geocode_search(address):
+    """一括割り当て用: 住所ごとに順番に問い合わせる (見つかったらそこで止める)。画面の検索の RacingGeocoder は使わない"""
+    return search_address_ultimate(address, session=get_bulk_geocode_session())
 
 if st.sidebar.button("最寄りバス停を探す"):
-    if not HAS_GEOPY:
-        st.sidebar.error("⚠️ 'geopy' ライブラリ不足")
-    elif not input_address:
+    if not input_address:
          st.sidebar.warning("住所を入力してください。")
     else:
-        # 実行
-        lat, lng, source_api = search_address_ultimate(input_address)
+        # 実行 (同じデータ・同じ住所・同じ便の結果は全セッションで共有)
+        nearest_params = (normalize_address(input_address), schedule_mode)
+        nearest_hit = shared_cache.get(data_version, "nearest", nearest_params)
+        geocode_error = None
+        if nearest_hit is not None: lat, lng, source_api, top3_stops = nearest_hit
+        else:
+            try:
+                with profiler.span("geocode"):
+                    nearest = find_nearest_stops_batch(stop_grid_index, [input_address], lambda a: geocode_with_cache(a, geocode_cache, geocode_search))[0]
+                lat, lng, source_api = nearest["lat"], nearest["lng"], nearest["source"]
+            except GeocodeUnavailable as e:
+                lat = lng = source_api = None
+                geocode_error = e
+            top3_stops = nearest["stops"] if lat and lng and not stop_grid_index.stops.empty else None
+            if top3_stops is not None: shared_cache.put(data_version, "nearest", nearest_params, (lat, lng, source_api, top3_stops))
             
-        if lat and lng:
+        if geocode_error is not None:
+            st.sidebar.error("⚠️ 住所検索サービスに接続できませんでした。しばらくしてからもう一度お試しください。")
+            st.sidebar.caption(str(geocode_error))
+        elif lat and lng:
             st.session_state["search_coords"] = (lat, lng)
             
-            valid_stops_for_search = stops_df.dropna(subset=["lat", "lng"]).copy()
-            if not valid_stops_for_search.empty:
-                valid_stops_for_search["distance"] = valid_stops_for_search.apply(
-                    lambda row: geodesic((lat, lng), (row["lat"], row["lng"])).meters, axis=1
-                )
-                top3_stops = valid_stops_for_search.sort_values("distance").head(3)
+            if top3_stops is not None:
                 st.session_state["search_results_df"] = top3_stops
                 
                 msg = f"発見しました！ ({source_api})"
@@ -316,10 +600,11 @@ if st.session_state["search_results_df"] is not None and not st.session_state["s
 st.sidebar.markdown("---")
 st.sidebar.subheader("🔍 生徒検索・指定")
 
-search_query = st.sidebar.text_input("名前検索", placeholder="名前を入力")
+search_query = st.sidebar.text_input("名前検索", placeholder="名前・学部・バス停を入力")
 search_candidates = pd.DataFrame()
 if search_query:
-    search_candidates = students_df[students_df["name"].str.contains(search_query, na=False)]
+    # 全角/半角・ひらがな/カタカナ・空白の違いは無視。名前の完全一致 → 前方一致 → 部分一致 → 学部/バス停 の順
+    with profiler.span("name_search"): search_candidates = students_df.loc[schedule_view["search_index"].search(search_query)]
 
 if not search_candidates.empty:
     if len(search_candidates) == 1:
@@ -339,7 +624,7 @@ elif search_query:
     st.sidebar.error("該当者なし")
 
 st.sidebar.markdown("---")
-unique_routes = sorted(stops_df["route"].unique().tolist())
+unique_routes = schedule_view["routes"]
 route_options = ["すべて表示"] + unique_routes
 default_ix = 0
 if target_student_info is not None:
@@ -367,10 +652,54 @@ if selected_route != "すべて表示":
     if selected_student_idx is not None and selected_student_idx in students_in_route.index:
         target_student_info = students_in_route.loc[selected_student_idx]
 
+@st.cache_resource
+def get_tile_proxy():
+    """このプロセス内でタイル中継サーバを起動する (BUS_TILE_PROXY_EMBED=1 のとき・プロセスにつき1回)"""
+    proxy = TileProxy(TileStore(os.path.join(CACHE_DIR, "tiles"), max_bytes=TILE_CACHE_MB * 1024 * 1024))
+    serve_tiles(proxy, host=TILE_PROXY_HOST, port=TILE_PROXY_PORT)
+    return proxy
+
+tile_proxy, use_tile_proxy = None, bool(TILE_PROXY_URL)
+if TILE_PROXY_EMBED and not TILE_PROXY_URL:
+    st.sidebar.warning("BUS_TILE_PROXY_EMBED=1 ですが BUS_TILE_PROXY_URL が未設定のため、タイル中継サーバは起動しません")
+elif TILE_PROXY_EMBED:
+    try: tile_proxy = get_tile_proxy()
+    except OSError as e:
+        use_tile_proxy = False  # 届かない中継を地図に埋め込まない
+        st.sidebar.warning(f"タイル中継サーバを起動できませんでした: {e}")
+
 st.sidebar.markdown("---")
 st.sidebar.caption(f"Source: {current_source}")
+st.sidebar.caption(f"住所キャッシュ: ヒット {geocode_cache.hits} / ミス {geocode_cache.misses} ({len(geocode_cache)}件)")
+with st.sidebar.expander("🛠️ デバッグ情報"):
+    if route_geo is not None:
+        st.caption(f"路線GeoJSON: {os.path.basename(geojson_file_path)} / {route_geo['feature_count']} features / 読込 {route_geo['load_ms']:.1f} ms")
+        st.caption(f"路線データ量: {route_geo['raw_bytes']:,} → {route_geo['bytes']:,} bytes")
+    else:
+        st.caption(f"路線GeoJSON: {os.path.basename(geojson_file_path)} なし")
+    st.caption(f"地図キャッシュ: このセッションのヒット {st.session_state.get('map_cache_hits', 0)} 回")
+    shared_summary = shared_cache.summary()
+    st.caption(
+        f"共有キャッシュ: {shared_summary['entries']} 件 / {shared_summary['bytes'] / 1024 / 1024:.1f} of {shared_summary['max_bytes'] / 1024 / 1024:.0f} MB"
+        f" (削除 {shared_summary['evictions']} / データ更新で破棄 {shared_summary['invalidations']}) "
+        + " / ".join(f"{n} {c['hits']}/{c['hits'] + c['misses']}" for n, c in shared_summary["by_namespace"].items())
+    )
+    if tile_proxy is not None:
+        st.caption(f"タイルキャッシュ: {len(tile_proxy.store)} 枚 / {tile_proxy.store.total_bytes / 1024 / 1024:.1f} MB (ヒット {tile_proxy.hits} / ミス {tile_proxy.misses} / 削除 {tile_proxy.store.evictions})")
+    refresh_status = get_data_refresher().status()
+    st.caption(
+        f"データ更新: {refresh_status['age_s'] or 0:.0f} 秒前に読み込み ({refresh_status['last_duration_s'] or 0:.2f} 秒)"
+        f" / 成功 {refresh_status['refreshes']} / 失敗 {refresh_status['failures']}" + (" / 読み直し中" if refresh_status["refreshing"] else "")
+    )
+    if refresh_status["consecutive_failures"]: st.caption(f"直近の失敗 ({refresh_status['consecutive_failures']} 回連続): {refresh_status['last_error']}")
+    if current_source.startswith("Google Sheets"):
+        sync_stats = get_sheets_sync().stats
+        st.caption(f"Sheets同期: メタデータ確認 {sync_stats['metadata_calls']} 回 / 取得 {sync_stats['batch_gets']} 回 / 変更なし {sync_stats['unchanged']} 回")
+        if sync_stats["last_diff"]:
+            st.caption("前回の差分: " + " / ".join(f"{n} +{d['added']} -{d['removed']}" for n, d in sync_stats["last_diff"].items()))
+profile_panel = st.sidebar.container()  # 計測パネル (中身は最後に書く)
 if st.sidebar.button("ログアウト"):
-    st.session_state["logged_in"] = False; st.rerun()
+    st.session_state["logged_in"] = False; st.session_state["is_admin"] = False; st.rerun()
 
 # =========================================================
 # 📝 メインエリア
@@ -387,7 +716,7 @@ st.markdown(f"""
 """, unsafe_allow_html=True)
 
 if target_student_info is not None:
-    s_stop_info = stops_df[(stops_df["route"] == target_student_info["route"]) & (stops_df["stop_name"] == target_student_info["stop_name"])]
+    s_stop_info = stops_df[stops_df["stop_id"] == target_student_info["stop_id"]]
     t_to = s_stop_info.iloc[0].get("time_to", "-") if not s_stop_info.empty else "-"
     t_from = s_stop_info.iloc[0].get("time_from", "-") if not s_stop_info.empty else "-"
     dept_info = f" ({target_student_info['department']})" if "department" in target_student_info and target_student_info['department'] else ""
@@ -406,230 +735,372 @@ if st.session_state["search_results_df"] is not None and not st.session_state["s
     📍 **{nearest_row['stop_name']}** ({nearest_row['route']}) まで **約{int(nearest_row['distance'])}m**
     """)
 
-valid_stops = stops_df.dropna(subset=["lat", "lng"])
+# ---------------------------------------------------------
+# 🗺️ 地図の生成 (同じ表示状態なら生成済みの HTML を使い回す)
+# ---------------------------------------------------------
+def build_map(stops_df, stop_keys, stop_student_index, route_geo, mode_selection, map_style_selection, selected_route, target_student_info, search_coords, search_results_df, counts=None):
+    """
+    counts に辞書を渡すと、描いたバス停数 (stops_rendered) とポップアップ付きのバス停数 (popup_stops) を入れて返す。
+    対象の生徒・検索結果のバス停は stop_id (stop_keys で引く) で見分ける。
+    """
+    is_to_school = (mode_selection == "☀️ 登校 (行き)")
+    is_from_school = (mode_selection == "🌙 下校 (帰り)")
+    is_all_mode = (mode_selection == "🔄 すべて (全体)")
+    valid_stops = stops_df.dropna(subset=["lat", "lng"])
 
-if st.session_state["search_coords"] is not None:
-    center_lat, center_lng = st.session_state["search_coords"]
-    zoom_start = 15
-elif target_student_info is not None:
-    target_stop = stops_df[(stops_df["route"] == target_student_info["route"]) & (stops_df["stop_name"] == target_student_info["stop_name"])]
-    if not target_stop.empty and pd.notna(target_stop.iloc[0]["lat"]) and pd.notna(target_stop.iloc[0]["lng"]):
-        center_lat, center_lng = target_stop.iloc[0]["lat"], target_stop.iloc[0]["lng"]
-        zoom_start = 16
+    if search_coords is not None:
+        center_lat, center_lng = search_coords
+        zoom_start = 15
+    elif target_student_info is not None:
+        target_stop = stops_df[stops_df["stop_id"] == target_student_info["stop_id"]]
+        if not target_stop.empty and pd.notna(target_stop.iloc[0]["lat"]) and pd.notna(target_stop.iloc[0]["lng"]):
+            center_lat, center_lng = target_stop.iloc[0]["lat"], target_stop.iloc[0]["lng"]
+            zoom_start = 16
+        else:
+            if not valid_stops.empty: center_lat, center_lng = valid_stops["lat"].mean(), valid_stops["lng"].mean()
+            else: center_lat, center_lng = 35.6895, 139.6917
+            zoom_start = 14
     else:
         if not valid_stops.empty: center_lat, center_lng = valid_stops["lat"].mean(), valid_stops["lng"].mean()
         else: center_lat, center_lng = 35.6895, 139.6917
         zoom_start = 14
-else:
-    if not valid_stops.empty: center_lat, center_lng = valid_stops["lat"].mean(), valid_stops["lng"].mean()
-    else: center_lat, center_lng = 35.6895, 139.6917
-    zoom_start = 14
-
-# 🆕 地図タイルの設定 (全選択肢対応)
-attr = None
-if "見やすい地図" in map_style_selection:
-    # 🆕 国土地理院「淡色地図」
-    selected_tiles = "https://cyberjapandata.gsi.go.jp/xyz/pale/{z}/{x}/{y}.png"
-    attr = "<a href='https://maps.gsi.go.jp/development/ichiran.html' target='_blank'>国土地理院</a>"
-elif "標準地図" in map_style_selection:
-    # 復活: 国土地理院「標準地図」
-    selected_tiles = "https://cyberjapandata.gsi.go.jp/xyz/std/{z}/{x}/{y}.png"
-    attr = "<a href='https://maps.gsi.go.jp/development/ichiran.html' target='_blank'>国土地理院</a>"
-elif "航空写真" in map_style_selection:
-    selected_tiles = "https://cyberjapandata.gsi.go.jp/xyz/seamlessphoto/{z}/{x}/{y}.jpg"
-    attr = "<a href='https://maps.gsi.go.jp/development/ichiran.html' target='_blank'>国土地理院</a>"
-elif "シンプル" in map_style_selection:
-    selected_tiles = "CartoDB positron"
-else:
-    selected_tiles = "OpenStreetMap"
-
-m = folium.Map(
-    location=[center_lat, center_lng], 
-    zoom_start=zoom_start, 
-    tiles=selected_tiles, 
-    attr=attr,
-    scrollWheelZoom=False
-)
-Fullscreen(position="topright", title="全画面表示", title_cancel="元のサイズに戻す", force_separate_button=True).add_to(m)
 
-if st.session_state["search_coords"] is not None:
-    folium.Marker(location=st.session_state["search_coords"], icon=folium.Icon(color="green", icon="home", prefix="fa"), tooltip="検索した住所").add_to(m)
-    if st.session_state["search_results_df"] is not None:
-        nearest_row = st.session_state["search_results_df"].iloc[0]
-        folium.PolyLine(locations=[st.session_state["search_coords"], (nearest_row["lat"], nearest_row["lng"])], color="blue", weight=2, dash_array="5, 5", tooltip=f"約{int(nearest_row['distance'])}m").add_to(m)
+    # 🆕 地図タイルの設定 (全選択肢対応)
+    if "見やすい地図" in map_style_selection: tile_source = "pale"  # 🆕 国土地理院「淡色地図」
+    elif "標準地図" in map_style_selection: tile_source = "std"  # 復活: 国土地理院「標準地図」
+    elif "航空写真" in map_style_selection: tile_source = "seamlessphoto"
+    elif "シンプル" in map_style_selection: tile_source = "positron"
+    else: tile_source = "osm"
+    if use_tile_proxy:
+        # タイル中継サーバ経由 (取ったタイルはディスクに残る)
+        selected_tiles, attr = proxied_url(TILE_PROXY_URL, tile_source), TILE_SOURCES[tile_source][2]
+    elif tile_source in ("pale", "std", "seamlessphoto"):
+        selected_tiles, attr = TILE_SOURCES[tile_source][0], TILE_SOURCES[tile_source][2]
+    else:
+        selected_tiles, attr = {"positron": "CartoDB positron", "osm": "OpenStreetMap"}[tile_source], None
 
-nearest_route_name = None
-if st.session_state["search_results_df"] is not None and not st.session_state["search_results_df"].empty:
-    nearest_route_name = st.session_state["search_results_df"].iloc[0]["route"]
+    m = folium.Map(
+        location=[center_lat, center_lng], 
+        zoom_start=zoom_start, 
+        tiles=selected_tiles, 
+        attr=attr,
+        scrollWheelZoom=False
+    )
+    Fullscreen(position="topright", title="全画面表示", title_cancel="元のサイズに戻す", force_separate_button=True).add_to(m)
 
-if os.path.exists(geojson_file_path):
-    try:
-        with open(geojson_file_path, "r", encoding="utf-8") as f:
-            geojson_data = json.load(f)
-        if "features" in geojson_data:
-            for feature in geojson_data["features"]:
-                if "properties" not in feature: feature["properties"] = {}
-                props = feature["properties"]
-                if "name" not in props or props["name"] == "不明":
-                    for key in props.keys():
-                        if key in ROUTE_COLORS:
-                            props["name"] = key; break
-                    if "name" not in props: props["name"] = "不明"
-
-        def style_function(feature):
-            props = feature.get('properties', {})
-            r_name = props.get("name", "不明")
-            is_active = False
-            is_hit = False
-            if selected_route == "すべて表示": is_hit = True
-            else:
-                rn, sr = r_name.strip(), selected_route.strip()
-                if (rn == sr) or (rn in sr) or (sr in rn): is_hit = True
-            if is_hit:
-                if "（登校）" in r_name:
-                    if is_to_school or is_all_mode: is_active = True
-                elif "（下校）" in r_name:
-                    if is_from_school or is_all_mode: is_active = True
-                else: is_active = True
-            if nearest_route_name:
-                n_r, r_n = nearest_route_name.strip(), r_name.strip()
-                if (n_r == r_n) or (n_r in r_n) or (r_n in n_r):
-                    if "（登校）" in r_name:
-                        if is_to_school or is_all_mode: is_active = True
-                    elif "（下校）" in r_name:
-                        if is_from_school or is_all_mode: is_active = True
-                    else: is_active = True
-            line_color = ROUTE_COLORS.get(r_name, ROUTE_COLORS.get(selected_route, DEFAULT_COLOR))
-            return {'color': line_color, 'weight': 6 if is_active else 0, 'opacity': 0.9 if is_active else 0}
-
-        folium.GeoJson(geojson_data, style_function=style_function, tooltip=folium.GeoJsonTooltip(fields=["name"], aliases=["便名: "])).add_to(m)
-    except Exception: pass
+    if search_coords is not None:
+        folium.Marker(location=search_coords, icon=folium.Icon(color="green", icon="home", prefix="fa"), tooltip="検索した住所").add_to(m)
+        if search_results_df is not None:
+            nearest_row = search_results_df.iloc[0]
+            folium.PolyLine(locations=[search_coords, (nearest_row["lat"], nearest_row["lng"])], color="blue", weight=2, dash_array="5, 5", tooltip=f"約{int(nearest_row['distance'])}m").add_to(m)
 
-for _, row in stops_df.iterrows():
-    if pd.isna(row["lat"]) or pd.isna(row["lng"]): continue
-    r_name, s_name = row["route"], row["stop_name"]
-    is_route_selected = (selected_route == "すべて表示") or (selected_route == r_name)
-    is_target_stop = False
-    search_rank = None
-    if st.session_state["search_results_df"] is not None:
-        for i, (idx, res_row) in enumerate(st.session_state["search_results_df"].iterrows()):
-            if res_row["route"] == r_name and res_row["stop_name"] == s_name:
-                search_rank = i; break
-    if target_student_info is not None:
-        if target_student_info["route"] == r_name and target_student_info["stop_name"] == s_name: is_target_stop = True
-
-    if is_target_stop:
-        icon_color, radius, line_weight, fill_opacity, z_index = "#FF0000", 12, 3, 1.0, 1000
-    elif search_rank == 0:
-        icon_color, radius, line_weight, fill_opacity, z_index = "green", 10, 3, 1.0, 900
-    elif search_rank is not None:
-        icon_color, radius, line_weight, fill_opacity, z_index = "lightgreen", 8, 2, 1.0, 800
-    elif is_route_selected:
-        icon_color, radius, line_weight, fill_opacity, z_index = ROUTE_COLORS.get(r_name, DEFAULT_COLOR), 7, 1, 0.9, 0
-    else:
-        icon_color, radius, line_weight, fill_opacity, z_index = "#CCCCCC", 3, 0, 0.4, -1
-    
-    t_display = f"行き:{row.get('time_to','-')} / 帰り:{row.get('time_from','-')}"
-    students_at_stop_map = students_df[(students_df["route"] == r_name) & (students_df["stop_name"] == s_name)]
-    if is_to_school: students_at_stop_map = students_at_stop_map[students_at_stop_map["direction"].str.contains("登校", na=False)]
-    elif is_from_school: students_at_stop_map = students_at_stop_map[students_at_stop_map["direction"].str.contains("下校", na=False)]
-    s_names_list = students_at_stop_map["name"].tolist()
-    s_names_str = "、".join(s_names_list) if s_names_list else "(なし)"
-    popup_html = f"""
-    <div style="font-family:sans-serif; width:220px;">
-        <h4 style="margin:0; color:{ROUTE_COLORS.get(r_name, 'black')};">{s_name}</h4>
-        <div style="background-color:#f0f0f0; padding:5px; margin:5px 0; border-radius:4px;"><small>{t_display}</small></div>
-        <div style="margin-top:5px; font-size:0.9em;"><strong>生徒:</strong> {s_names_str}</div>
-        <small style="color:gray;">{r_name}</small>
-    </div>
-    """
-    folium.CircleMarker(
-        location=[row["lat"], row["lng"]], radius=radius, color="white" if (is_target_stop or search_rank is not None) else icon_color,
-        weight=line_weight, fill=True, fill_color=icon_color, fill_opacity=fill_opacity, popup=folium.Popup(popup_html, max_width=250), z_index_offset=z_index
-    ).add_to(m)
-    if is_target_stop:
-        folium.Marker(location=[row["lat"], row["lng"]], icon=folium.Icon(color="red", icon="user", prefix="fa"), tooltip=f"{target_student_info['name']} さん").add_to(m)
-    elif search_rank == 0:
-         folium.Marker(location=[row["lat"], row["lng"]], icon=folium.Icon(color="green", icon="info-sign", prefix="fa"), tooltip=f"最寄り1位: {s_name}").add_to(m)
+    nearest_route_name = None
+    if search_results_df is not None and not search_results_df.empty:
+        nearest_route_name = search_results_df.iloc[0]["route"]
 
-with st.expander("🗺️ 運行マップ (クリックで開閉)", expanded=True): st_folium(m, use_container_width=True, height=500)
+    if route_geo is not None:
+        try:
+            if selected_route == "すべて表示": hit_names = set(route_geo["names"])
+            else: hit_names = set(route_feature_group(route_geo, selected_route))
+            if nearest_route_name: hit_names |= route_feature_group(route_geo, nearest_route_name)
+            active_route_names = {
+                n for n in hit_names
+                if route_geo["directions"][n] is None
+                or (route_geo["directions"][n] == "登校" and (is_to_school or is_all_mode))
+                or (route_geo["directions"][n] == "下校" and (is_from_school or is_all_mode))
+            }
 
-st.markdown("---")
-if selected_route == "すべて表示": target_routes = sorted(stops_df["route"].unique().tolist())
-else: target_routes = [selected_route]
-
-for r_name in target_routes:
-    r_color = ROUTE_COLORS.get(r_name, DEFAULT_COLOR)
-    st.markdown(f"### <span style='color:{r_color};'>■</span> {r_name}", unsafe_allow_html=True)
-    route_stops = stops_df[stops_df["route"] == r_name].copy()
-    if "sequence" in route_stops.columns: route_stops = route_stops.sort_values("sequence")
-    table_rows = []
-    for _, stop in route_stops.iterrows():
-        s_name = stop["stop_name"]
-        students_at_stop = students_df[(students_df["route"] == r_name) & (students_df["stop_name"] == s_name)]
-        students_list_str = []
-        if is_all_mode:
-            for _, st_row in students_at_stop.iterrows():
-                d_raw = str(st_row["direction"])
-                d_mark = d_raw[0] if len(d_raw) > 0 else "?"
-                students_list_str.append(f"{st_row['name']}({d_mark})")
+            def style_function(feature):
+                r_name = feature.get('properties', {}).get("name", "不明")
+                is_active = r_name in active_route_names
+                line_color = ROUTE_COLORS.get(r_name, ROUTE_COLORS.get(selected_route, DEFAULT_COLOR))
+                return {'color': line_color, 'weight': 6 if is_active else 0, 'opacity': 0.9 if is_active else 0}
+
+            features = route_geo["data"]["features"]
+            if MAP_LIGHT_MODE:
+                # 非表示になる路線はそもそも送らない
+                features = [f for f in features if f["properties"]["name"] in active_route_names]
+            # route_geo は全セッションで共有 (キャッシュ) なので、folium が id やスタイルを書き足しても元が変わらないよう
+            # feature と properties は作り直して渡す (座標の配列は書き換えられないので共有のまま)
+            geojson_to_draw = {**route_geo["data"], "features": [{**f, "properties": dict(f["properties"])} for f in features]}
+            if geojson_to_draw["features"]:
+                folium.GeoJson(geojson_to_draw, style_function=style_function, tooltip=folium.GeoJsonTooltip(fields=["name"], aliases=["便名: "])).add_to(m)
+        except Exception: pass
+
+    search_ranks = {}  # stop_id → 検索結果の順位 (同じバス停が複数回あれば上位を使う)
+    if search_results_df is not None:
+        for i, stop_id in enumerate(lookup_stop_ids(stop_keys, search_results_df["route"], search_results_df["stop_name"])):
+            search_ranks.setdefault(int(stop_id), i)
+    target_stop_id = int(target_student_info["stop_id"]) if target_student_info is not None else None
+
+    inactive_stop_points = []
+    stop_layer = LazyStopLayer()  # ポップアップはクリック時に組み立てる
+    for _, row in stops_df.iterrows():
+        if pd.isna(row["lat"]) or pd.isna(row["lng"]): continue
+        r_name, s_name = row["route"], row["stop_name"]
+        is_route_selected = (selected_route == "すべて表示") or (selected_route == r_name)
+        is_target_stop = target_stop_id is not None and row["stop_id"] == target_stop_id
+        search_rank = search_ranks.get(row["stop_id"])
+
+        if MAP_LIGHT_MODE and not (is_target_stop or search_rank is not None or is_route_selected):
+            inactive_stop_points.append([row["lng"], row["lat"]]); continue
+
+        if is_target_stop:
+            icon_color, radius, line_weight, fill_opacity = "#FF0000", 12, 3, 1.0
+        elif search_rank == 0:
+            icon_color, radius, line_weight, fill_opacity = "green", 10, 3, 1.0
+        elif search_rank is not None:
+            icon_color, radius, line_weight, fill_opacity = "lightgreen", 8, 2, 1.0
+        elif is_route_selected:
+            icon_color, radius, line_weight, fill_opacity = ROUTE_COLORS.get(r_name, DEFAULT_COLOR), 7, 1, 0.9
         else:
-            target_str = "登校" if is_to_school else "下校"
-            filtered = students_at_stop[students_at_stop["direction"].str.contains(target_str, na=False)]
-            students_list_str = filtered["name"].tolist()
-        display_stop = s_name
-        if target_student_info is not None and target_student_info["stop_name"] == s_name and target_student_info["route"] == r_name:
-            display_stop = f"🔴 {s_name}"; target_name = target_student_info["name"]
-            students_list_str = [f"**{s}**" if target_name in s else s for s in students_list_str]
-        if st.session_state["search_results_df"] is not None:
-             for i, (idx, res_row) in enumerate(st.session_state["search_results_df"].iterrows()):
-                 if res_row["stop_name"] == s_name and res_row["route"] == r_name:
-                     rank_icon = ["🥇", "🥈", "🥉"][i] if i < 3 else ""
-                     display_stop = f"{rank_icon} {s_name} (最寄り{i+1})"
-        final_student_str = "、".join(students_list_str)
-        row_data = {"バス停名": display_stop}
+            icon_color, radius, line_weight, fill_opacity = "#CCCCCC", 3, 0, 0.4
+
+        stop_bucket = stop_student_index.get((r_name, s_name), EMPTY_STOP_BUCKET)
+        if is_to_school: s_names_list = stop_bucket["登校"]
+        elif is_from_school: s_names_list = stop_bucket["下校"]
+        else: s_names_list = [name for name, _ in stop_bucket["all"]]
+        stop_layer.add_stop(
+            row["lat"], row["lng"],
+            {"radius": radius, "color": "white" if (is_target_stop or search_rank is not None) else icon_color,
+             "weight": line_weight, "fill_color": icon_color, "fill_opacity": fill_opacity},
+            r_name, s_name, row.get("time_to", "-"), row.get("time_from", "-"),
+            "、".join(s_names_list) if s_names_list else "(なし)", ROUTE_COLORS.get(r_name, "black"),
+        )
+        if is_target_stop:
+            folium.Marker(location=[row["lat"], row["lng"]], icon=folium.Icon(color="red", icon="user", prefix="fa"), tooltip=f"{target_student_info['name']} さん").add_to(m)
+        elif search_rank == 0:
+             folium.Marker(location=[row["lat"], row["lng"]], icon=folium.Icon(color="green", icon="info-sign", prefix="fa"), tooltip=f"最寄り1位: {s_name}").add_to(m)
+
+    if len(stop_layer): stop_layer.add_to(m)
+    if inactive_stop_points:
+        # 選択外のバス停: ポップアップなしの点をまとめて1レイヤーで描く
+        folium.GeoJson(
+            {"type": "FeatureCollection", "features": [{"type": "Feature", "properties": {}, "geometry": {"type": "MultiPoint", "coordinates": inactive_stop_points}}]},
+            marker=folium.CircleMarker(radius=3, weight=0, fill=True, fill_color="#CCCCCC", fill_opacity=0.4),
+            style_function=lambda feature: {"color": "#CCCCCC", "weight": 0, "fillColor": "#CCCCCC", "fillOpacity": 0.4},
+        ).add_to(m)
+    if counts is not None:
+        counts["stops_rendered"] = len(stop_layer) + len(inactive_stop_points)
+        counts["popup_stops"] = len(stop_layer)
+    return m
+
+search_results_df = st.session_state["search_results_df"]
+map_state = (
+    schedule_mode, mode_selection, map_style_selection, selected_route,
+    (target_student_info["route"], target_student_info["stop_name"], target_student_info["name"]) if target_student_info is not None else None,
+    st.session_state["search_coords"],
+    tuple(zip(search_results_df["route"], search_results_df["stop_name"], search_results_df["distance"].astype(int))) if search_results_df is not None else None,
+    (geojson_file_path, route_geo["raw_bytes"] if route_geo is not None else None, os.path.getmtime(geojson_file_path) if route_geo is not None else None),
+    MAP_LIGHT_MODE,
+)
+map_state_key = hashlib.md5(repr(map_state).encode("utf-8")).hexdigest()
+map_html = shared_cache.get(data_version, "map", map_state_key)
+if map_html is None:
+    map_counts = {}
+    with profiler.span("map_build"):
+        m = build_map(stops_df, schedule_view["stop_keys"], stop_student_index, route_geo, mode_selection, map_style_selection, selected_route, target_student_info, st.session_state["search_coords"], search_results_df, counts=map_counts)
+    with profiler.span("map_render"): map_html = m.get_root().render()
+    shared_cache.put(data_version, "map", map_state_key, map_html)
+    for name, value in map_counts.items(): profiler.count(name, value)
+else:
+    st.session_state["map_cache_hits"] = st.session_state.get("map_cache_hits", 0) + 1
+    profiler.count("map_cache_hit")
+profiler.count("map_html_bytes", len(map_html.encode("utf-8")) if profiler.enabled else 0)
+
+with profiler.span("map_embed"):
+    with st.expander("🗺️ 運行マップ (クリックで開閉)", expanded=True): st.iframe(map_html, height=500)
+
+st.markdown("---")
+with profiler.span("route_tables"):
+    if selected_route == "すべて表示": target_routes = schedule_view["routes"]
+    else: target_routes = [selected_route]
+
+    timetable = schedule_view["timetable"]
+    if selected_route != "すべて表示": timetable = timetable[timetable["route"] == selected_route]
+
+    def compute_route_tables():
+        student_key = "all" if is_all_mode else ("登校" if is_to_school else "下校")
+        student_col = TIMETABLE_STUDENT_COLS[student_key]
+        display_stop = timetable["stop_name"].copy()
+        students_str = timetable[student_col].copy()
+        if target_student_info is not None:
+            is_target = timetable["stop_id"] == target_student_info["stop_id"]
+            target_name = target_student_info["name"]
+            display_stop[is_target] = "🔴 " + display_stop[is_target]
+            students_str[is_target] = students_str[is_target].map(lambda v: "、".join(f"**{x}**" if target_name in x else x for x in v.split("、")) if v else v)
+        if search_results_df is not None:
+            # 後の順位ほど優先 (同じバス停が複数回入っている場合)
+            result_stop_ids = lookup_stop_ids(schedule_view["stop_keys"], search_results_df["route"], search_results_df["stop_name"])
+            for i, res_stop_id in enumerate(result_stop_ids):
+                is_hit = timetable["stop_id"] == res_stop_id
+                rank_icon = ["🥇", "🥈", "🥉"][i] if i < 3 else ""
+                display_stop[is_hit] = f"{rank_icon} " + timetable["stop_name"][is_hit] + f" (最寄り{i+1})"
         if is_all_mode:
-            row_data["行き"] = stop.get("time_to", "-"); row_data["帰り"] = stop.get("time_from", "-"); row_data["利用生徒"] = final_student_str
+            timetable_view = pd.DataFrame({"バス停名": display_stop, "行き": timetable["time_to"], "帰り": timetable["time_from"], "利用生徒": students_str})
         elif is_to_school:
-            row_data["時間"] = stop.get("time_to", "-"); row_data["登校生徒"] = final_student_str
-        else:
-            row_data["時間"] = stop.get("time_from", "-"); row_data["下校生徒"] = final_student_str
-        table_rows.append(row_data)
-    df_table = pd.DataFrame(table_rows)
-    if not df_table.empty:
-        cols_config = {"バス停名": st.column_config.TextColumn("🚏 バス停", width="medium")}
-        if is_all_mode:
-            cols_config["行き"] = st.column_config.TextColumn("☀️ 行き", width="small")
-            cols_config["帰り"] = st.column_config.TextColumn("🌙 帰り", width="small")
-            cols_config["利用生徒"] = st.column_config.TextColumn("👶 全利用生徒", width="large")
+            timetable_view = pd.DataFrame({"バス停名": display_stop, "時間": timetable["time_to"], "登校生徒": students_str})
         else:
-            time_label = "時間"; student_label = "登校生徒" if is_to_school else "下校生徒"
-            cols_config[time_label] = st.column_config.TextColumn("⏰ 時間", width="small")
-            cols_config[student_label] = st.column_config.TextColumn(f"👶 {student_label}", width="large")
-        st.dataframe(df_table, hide_index=True, use_container_width=True, column_config=cols_config)
-    else: st.caption("データなし")
-    st.markdown("<br>", unsafe_allow_html=True)
+            timetable_view = pd.DataFrame({"バス停名": display_stop, "時間": timetable["time_from"], "下校生徒": students_str})
+        return dict(tuple(timetable_view.groupby(timetable["route"], sort=False)))
 
-if selected_route != "すべて表示":
-    st.markdown("---")
-    st.subheader(f"👥 {selected_route} 利用生徒名簿 (バス停順)")
-    roster_df = students_df[students_df["route"] == selected_route].copy()
-    if is_to_school: roster_df = roster_df[roster_df["direction"].str.contains("登校", na=False)]
-    elif is_from_school: roster_df = roster_df[roster_df["direction"].str.contains("下校", na=False)]
-    route_stops_order = stops_df[stops_df["route"] == selected_route][["stop_name", "sequence"]]
-    if not route_stops_order.empty and not roster_df.empty:
-        roster_df = pd.merge(roster_df, route_stops_order, on="stop_name", how="left")
-        if "sequence" in roster_df.columns: roster_df = roster_df.sort_values(by=["sequence", "name"])
-        else: roster_df = roster_df.sort_values(by="name")
-    if not roster_df.empty:
-        display_cols = ["name", "stop_name", "direction"]
-        if "department" in roster_df.columns: display_cols.insert(1, "department")
-        roster_display = roster_df[display_cols]
-        col_config = {
-            "name": st.column_config.TextColumn("👤 生徒名", width="medium"),
-            "stop_name": st.column_config.TextColumn("🚏 利用バス停", width="medium"),
-            "direction": st.column_config.TextColumn("↔️ 区分", width="small"),
-        }
-        if "department" in roster_df.columns: col_config["department"] = st.column_config.TextColumn("🎓 学部", width="small")
-        st.dataframe(roster_display, hide_index=True, use_container_width=True, column_config=col_config)
-    else: st.info("この条件での利用者はいません。")
\ No newline at end of file
+    # 同じ表示条件の時刻表は全セッションで共有 (返ってきた表は書き換えない)
+    route_table_params = (
+        schedule_mode, mode_selection, selected_route,
+        (str(target_student_info["route"]), str(target_student_info["stop_name"]), target_student_info["name"]) if target_student_info is not None else None,
+        tuple(zip(search_results_df["route"].astype(str), search_results_df["stop_name"].astype(str))) if search_results_df is not None else None,
+    )
+    route_tables, _ = shared_cache.get_or_compute(data_version, "route_tables", route_table_params, compute_route_tables)
+
+    cols_config = {"バス停名": st.column_config.TextColumn("🚏 バス停", width="medium")}
+    if is_all_mode:
+        cols_config["行き"] = st.column_config.TextColumn("☀️ 行き", width="small")
+        cols_config["帰り"] = st.column_config.TextColumn("🌙 帰り", width="small")
+        cols_config["利用生徒"] = st.column_config.TextColumn("👶 全利用生徒", width="large")
+    else:
+        time_label = "時間"; student_label = "登校生徒" if is_to_school else "下校生徒"
+        cols_config[time_label] = st.column_config.TextColumn("⏰ 時間", width="small")
+        cols_config[student_label] = st.column_config.TextColumn(f"👶 {student_label}", width="large")
+
+    for r_name in target_routes:
+        r_color = ROUTE_COLORS.get(r_name, DEFAULT_COLOR)
+        st.markdown(f"### <span style='color:{r_color};'>■</span> {r_name}", unsafe_allow_html=True)
+        df_table = route_tables.get(str(r_name))
+        if df_table is not None and not df_table.empty:
+            st.dataframe(df_table.reset_index(drop=True), hide_index=True, width="stretch", column_config=cols_config)
+        else: st.caption("データなし")
+        st.markdown("<br>", unsafe_allow_html=True)
+
+with profiler.span("roster"):
+    if selected_route != "すべて表示":
+        st.markdown("---")
+        st.subheader(f"👥 {selected_route} 利用生徒名簿 (バス停順)")
+        # 上の時刻表 (この路線だけに絞ったもの) のバス停順を使う。一括出力の名簿も同じ関数で作る
+        roster_display = build_roster(students_df, timetable, selected_route, "登校" if is_to_school else ("下校" if is_from_school else None))
+        if not roster_display.empty:
+            col_config = {
+                "name": st.column_config.TextColumn("👤 生徒名", width="medium"),
+                "stop_name": st.column_config.TextColumn("🚏 利用バス停", width="medium"),
+                "direction": st.column_config.TextColumn("↔️ 区分", width="small"),
+            }
+            if "department" in roster_display.columns: col_config["department"] = st.column_config.TextColumn("🎓 学部", width="small")
+            st.dataframe(roster_display, hide_index=True, width="stretch", column_config=col_config)
+        else: st.info("この条件での利用者はいません。")
+
+# -----------------------------------------------------
+# 🧭 バス停と路線ラインの照合 (データを読み直すたびに計算し直す)
+# -----------------------------------------------------
+st.markdown("---")
+if route_geo is not None:
+    with profiler.span("route_snap"):
+        (route_snap, snap_ms), snap_cached = shared_cache.get_or_compute(
+            data_version, "route_snap", (schedule_mode, geojson_file_path, os.path.getmtime(geojson_file_path)),
+            lambda: build_route_snap(schedule_view, route_geo),
+        )
+    snap_issues = route_snap[route_snap["far"] | route_snap["out_of_order"] | route_snap["line_name"].isna()]
+    with st.expander("🧭 バス停と路線ラインの照合" + (f" (要確認 {len(snap_issues)} 件)" if len(snap_issues) else "")):
+        st.caption(
+            f"{len(route_snap)} バス停を {os.path.basename(geojson_file_path)} のラインに載せました ({snap_ms:.0f} ms{'・キャッシュ' if snap_cached else ''})。"
+            f"ラインから {SNAP_MAX_DISTANCE_M:.0f} m 以上離れているもの・sequence の順がライン上の順と合わないもの・路線のラインがないものを表示します。"
+        )
+        def snap_table(df):
+            status = np.select([df["line_name"].isna(), df["far"], df["out_of_order"]], ["ラインなし", "ラインから遠い", "順番が合わない"], "")
+            table = pd.DataFrame({"路線": df["route"], "バス停名": df["stop_name"], "ラインからの距離 (m)": df["distance_m"].round(0), "起点から (km)": (df["chainage_m"] / 1000).round(2), "状態": status})
+            if "sequence" in df.columns: table.insert(2, "順番", df["sequence"])
+            return table
+        if not snap_issues.empty: st.dataframe(snap_table(snap_issues), hide_index=True, width="stretch")
+        else: st.success("すべてのバス停が路線ラインの近くに、sequence の順に並んでいます。")
+        if selected_route != "すべて表示":
+            st.markdown(f"**{selected_route}** のバス停 (ライン上の順)")
+            st.dataframe(snap_table(route_snap[route_snap["route"] == selected_route].sort_values("chainage_m")), hide_index=True, width="stretch")
+
+# -----------------------------------------------------
+# 📥 住所CSVから最寄りバス停を一括割り当て
+# -----------------------------------------------------
+with st.expander("📥 住所CSVから最寄りバス停を一括割り当て"):
+    st.caption("住所の列を含むCSVをアップロードすると、便ごと (通常便/小中時差便/高時差便) の最寄りバス停を提案します。"
+               "調べ終わった住所は保存されるので、途中で止まっても再実行すれば続きから処理します。")
+    bulk_file = st.file_uploader("住所CSV", type=["csv"], key="bulk_assign_file")
+    if bulk_file is not None:
+        try:
+            bulk_df, _ = read_csv_bytes(bulk_file.getvalue())
+        except Exception as e:
+            bulk_df = None
+            st.error(f"CSVを読み込めませんでした: {e}")
+        if bulk_df is not None and not bulk_df.empty:
+            columns = list(bulk_df.columns)
+            address_col = st.selectbox("住所の列", columns, index=columns.index(guess_address_column(bulk_df)))
+            if st.button("一括割り当てを実行"):
+                bar = st.progress(0.0, text="ジオコーディング中...")
+                def report(done, total):
+                    bar.progress(done / total if total else 1.0, text=f"ジオコーディング中... {done}/{total}")
+                schedules = {
+                    mode: (schedule_bundle[mode]["grid_index"], conf["route_col"], conf["stop_col"])
+                    for mode, conf in SCHEDULES.items()
+                }
+                with profiler.span("bulk_assign"):
+                    st.session_state["bulk_assign_result"] = bulk_assign(
+                        bulk_df, address_col, geocode_cache, schedules, search=bulk_geocode_search, max_workers=BULK_GEOCODE_WORKERS, progress=report,
+                    )
+                bar.empty()
+    bulk_result = st.session_state.get("bulk_assign_result")
+    if bulk_result is not None:
+        unavailable = int((bulk_result["geocode_source"] == UNAVAILABLE_SOURCE).sum())
+        missing = int(bulk_result["lat"].isna().sum()) - unavailable
+        st.success(f"{len(bulk_result)}件を処理しました" + (f" (住所が見つからなかったもの: {missing}件)" if missing else ""))
+        if unavailable: st.warning(f"住所検索サービスに接続できなかったもの: {unavailable}件。もう一度実行すると、その住所だけを問い合わせ直します。")
+        st.dataframe(bulk_result, hide_index=True, width="stretch")
+        st.download_button("結果をCSVでダウンロード", to_download_csv(bulk_result), file_name="bus_stop_assignment.csv", mime="text/csv")
+
+# -----------------------------------------------------
+# 🖨️ 全路線の時刻表・名簿の一括出力
+# -----------------------------------------------------
+with st.expander("🖨️ 全路線の時刻表・名簿を一括出力 (ZIP)"):
+    st.caption("全スケジュール (通常便/小中時差便/高時差便) × 登校/下校 の、路線ごとの時刻表と利用生徒名簿をまとめて出力します。")
+    export_formats = st.multiselect("形式", available_formats(), default=["csv"], key="export_formats")
+    if st.button("一括出力を作成", disabled=not export_formats):
+        bar = st.progress(0.0, text="作成中...")
+        def report_export(done, total):
+            bar.progress(done / total if total else 1.0, text=f"作成中... {done}/{total}")
+        export_dir = os.path.join(CACHE_DIR, "exports")
+        os.makedirs(export_dir, exist_ok=True)
+        export_prefix = f"routes_{data_version[:12]}_"
+        export_path = os.path.join(export_dir, f"{export_prefix}{'_'.join(export_formats)}.zip")
+        prune_exports(export_dir, export_prefix)  # 前のデータ版の ZIP は要らない
+        tmp = tempfile.NamedTemporaryFile(dir=export_dir, suffix=".tmp", delete=False)
+        try:
+            with profiler.span("route_export"), tmp as f:
+                export_stats = write_export_zip(f, schedule_bundle, export_formats, max_workers=EXPORT_WORKERS, progress=report_export)
+            os.replace(tmp.name, export_path)
+        except BaseException:
+            if os.path.exists(tmp.name): os.unlink(tmp.name)  # 書きかけを残さない
+            raise
+        bar.empty()
+        st.session_state["route_export"] = (export_path, export_stats)
+    export_result = st.session_state.get("route_export")
+    if export_result is not None and os.path.exists(export_result[0]):
+        export_path, export_stats = export_result
+        st.success(
+            f"{export_stats['files']} ファイル / {export_stats['bytes'] / 1024 / 1024:.1f} MB を {export_stats['seconds']:.1f} 秒で作成しました ("
+            + " / ".join(f"{fmt} {sec:.1f}秒" for fmt, sec in export_stats["render_seconds"].items()) + ")"
+        )
+        with open(export_path, "rb") as f:
+            st.download_button("ZIP をダウンロード", f, file_name="bus_routes_export.zip", mime="application/zip")
+
+# -----------------------------------------------------
+# ⏱️ 計測パネル (管理者のみ)
+# -----------------------------------------------------
+profile_record = profiler.finish(schedule_mode=schedule_mode, mode=mode_selection, route=selected_route)
+if profile_record is not None:
+    if "profile_history" not in st.session_state: st.session_state["profile_history"] = deque(maxlen=PROFILE_HISTORY)
+    st.session_state["profile_history"].append(profile_record)
+    if PROFILE_LOG: append_jsonl(PROFILE_LOG, profile_record)
+    if is_admin:
+        with profile_panel.expander("⏱️ 計測 (直近の再実行)"):
+            history = list(st.session_state["profile_history"])
+            st.caption(f"今回: {profile_record['total_ms']:.0f} ms / " + " / ".join(f"{k} {v}" for k, v in profile_record["counts"].items()))
+            st.dataframe(
+                pd.DataFrame([{"total": r["total_ms"], **r["spans"]} for r in reversed(history)]).round(1),
+                hide_index=True, width="stretch",
+            )
+            st.download_button("JSON Lines で保存", to_jsonl(history), file_name="rerun_profile.jsonl", mime="application/jsonl")
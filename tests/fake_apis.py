@@ -0,0 +1,120 @@
+"""
+テストとベンチマークが共有する偽の外部 API (ローカル HTTP サーバ)。外部ネットワークには接続しない。
+
+- FakeSheets / start_fake_api: 偽 Sheets / Drive API (sheets_sync.py 用)
+- start_server / stub_providers: 遅い / 失敗する / 正しく返す 住所検索プロバイダ (geocoding.py 用)
+"""
+import json
+import os
+import sys
+import threading
+import time
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from geocoding import geocode_geocoding_jp, geocode_gsi, geocode_naro
+
+SPREADSHEET_ID = "fake-spreadsheet"
+
+
+class FakeSheets:
+    def __init__(self, n_students):
+        self.sheets = {
+            "bus_stops": [["schedule_type", "route", "stop_name", "lat", "lng", "sequence", "time_to", "time_from"]]
+            + [["通常", "井沼便", f"バス停{i}", "35.9", "139.6", str(i), "8:00", "15:00"] for i in range(200)],
+            "students": [["name", "route_normal", "stop_normal", "direction"]]
+            + [[f"生徒{i}", "井沼便", f"バス停{i % 200}", "登校"] for i in range(n_students)],
+        }
+        self.version = 1
+        self.requests = []  # 受けた問い合わせのパス
+        self.batch_ranges = []  # batchGet ごとの ranges
+        self.fail_metadata = False  # True なら Drive のメタデータ取得を 500 で失敗させる
+
+    def edit(self):
+        self.sheets["students"][1][3] = "下校"
+        self.sheets["students"].append(["新入生", "井沼便", "バス停0", "登下校"])
+        self.version += 1
+
+
+def make_sheets_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            fake.requests.append(url.path)
+            if url.path.startswith("/drive/v3/files/"):
+                if fake.fail_metadata:
+                    self.send_response(500); self.end_headers(); return
+                body = {"modifiedTime": f"2026-04-01T00:00:0{fake.version}Z", "version": str(fake.version)}
+            elif url.path.endswith("/values:batchGet"):
+                ranges = parse_qs(url.query).get("ranges", [])
+                fake.batch_ranges.append(ranges)
+                body = {"valueRanges": [{"range": r, "values": fake.sheets[unquote(r).split("!")[0]]} for r in ranges]}
+            else:
+                self.send_response(404); self.end_headers(); return
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+    return Handler
+
+
+def start_fake_api(fake):
+    """偽 API を別スレッドで起動する。戻り値: (サーバ, build_services に渡す api_endpoint)"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_sheets_handler(fake))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+KNOWN = {"岩槻区本町": (35.95, 139.69)}
+
+
+def make_geocode_handler(behaviour, slow):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self.server.requests += 1
+            params = parse_qs(urlparse(self.path).query)
+            query = (params.get("q") or params.get("addr") or [""])[0]
+            if behaviour == "fail":
+                self.send_response(500); self.end_headers(); return
+            if behaviour == "slow": time.sleep(slow)
+            hit = KNOWN.get(query)
+            if self.path.startswith("/gsi"):
+                body = json.dumps([{"geometry": {"coordinates": [hit[1], hit[0]]}}] if hit else [])
+            elif self.path.startswith("/naro"):
+                body = json.dumps({"result": [{"lat": hit[0], "lon": hit[1]}] if hit else []})
+            else:
+                body = f"<result><coordinate><lat>{hit[0]}</lat><lng>{hit[1]}</lng></coordinate></result>" if hit else "<result/>"
+            self.send_response(200); self.end_headers(); self.wfile.write(body.encode("utf-8"))
+    return Handler
+
+
+class QuietServer(ThreadingHTTPServer):
+    requests = 0  # 受けた問い合わせの数
+
+    def handle_error(self, request, client_address):
+        pass  # 打ち切られた問い合わせの BrokenPipe は想定どおり
+
+
+def start_server(behaviour, slow):
+    server = QuietServer(("127.0.0.1", 0), make_geocode_handler(behaviour, slow))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def stub_providers(servers, gsi, naro, gjp):
+    """servers ({振る舞い: (サーバ, URL)}) のスタブを指すプロバイダ一覧 (優先順)"""
+    return [
+        ("国土地理院", partial(geocode_gsi, url=servers[gsi][1] + "/gsi")),
+        ("農研機構", partial(geocode_naro, url=servers[naro][1] + "/naro")),
+        ("Geocoding.jp", partial(geocode_geocoding_jp, url=servers[gjp][1] + "/gjp")),
+    ]
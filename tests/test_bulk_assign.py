@@ -0,0 +1,86 @@
+"""
+住所CSVの一括割り当て (bulk_assign.py) のテスト。プロバイダは関数のスタブで、外部ネットワークには接続しない。
+
+    python -m pytest -q tests
+"""
+import os
+import sys
+import time
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bulk_assign import UNAVAILABLE_SOURCE, bulk_assign, geocode_many
+from geo_utils import StopGridIndex
+from geocoding import GeocodeCache, RacingGeocoder, search_address_ultimate
+
+N_ADDRESSES = 200
+LATENCY = 0.02  # スタブの応答時間 [s]
+DEADLINE = 0.05  # 応答時間より長いが、順番待ちを含めると足りない締め切り
+
+
+def town_only_provider(name, state=None):
+    """町名だけ (数字を除いた問い合わせ) で見つかる、LATENCY 秒かかるスタブ。state["down"] が真なら接続エラー"""
+    def provider(query, session=None, timeout=None):
+        time.sleep(LATENCY)
+        if state and state["down"]: raise ConnectionError(f"{name} に接続できません")
+        return (35.95, 139.69) if query == "岩槻区本町" else None
+    return provider
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return GeocodeCache(str(tmp_path / "geocode.sqlite3"))
+
+
+@pytest.fixture
+def addresses():
+    return [f"岩槻区本町{i}-1" for i in range(N_ADDRESSES)]
+
+
+def test_bulk_through_a_shared_racing_geocoder_does_not_trip_breakers(cache, addresses):
+    # 一括割り当ての 8 スレッドが、画面の検索と同じ 16 スレッドの RacingGeocoder に 1件あたり最大6件を出す状況
+    providers = [(name, town_only_provider(name)) for name in ("A", "B", "C")]
+    racer = RacingGeocoder(providers, default_deadline=DEADLINE, max_workers=16)
+    try:
+        results = geocode_many(addresses, cache, search=racer.search, max_workers=8)
+    finally:
+        racer.executor.shutdown(wait=False, cancel_futures=True)
+    assert sum(r[0] is not None for r in results.values()) == N_ADDRESSES
+    assert not any(breaker.is_open for breaker in racer.breakers.values())
+
+
+def test_bulk_serial_path_finds_everything(cache, addresses):
+    providers = [(name, town_only_provider(name)) for name in ("A", "B", "C")]
+    results = geocode_many(addresses, cache, search=lambda a: search_address_ultimate(a, providers), max_workers=8)
+    assert {r[2] for r in results.values()} == {"A"}
+    assert len(cache) == N_ADDRESSES
+
+
+def test_unavailable_addresses_are_not_cached_and_resume_on_rerun(cache, addresses):
+    state = {"down": True}
+    providers = [(name, town_only_provider(name, state)) for name in ("A", "B", "C")]
+    search = lambda a: search_address_ultimate(a, providers)
+    results = geocode_many(addresses[:20], cache, search=search, max_workers=8)
+    assert {r[2] for r in results.values()} == {UNAVAILABLE_SOURCE}
+    assert len(cache) == 0
+    state["down"] = False
+    results = geocode_many(addresses[:20], cache, search=search, max_workers=8)
+    assert {r[2] for r in results.values()} == {"A"}
+
+
+def test_bulk_assign_writes_nearest_stop_columns(cache):
+    stops = pd.DataFrame({"route": ["井沼便", "西原便"], "stop_name": ["本町", "遠く"], "lat": [35.951, 36.2], "lng": [139.691, 139.9]})
+    schedules = {"通常便": (StopGridIndex(stops), "route_normal", "stop_normal")}
+    df = pd.DataFrame({"name": ["a", "b", "c"], "住所": ["岩槻区本町3-1", "存在しない町", "接続できない町"]})
+    def search(address):
+        if address.startswith("岩槻区本町"): return 35.95, 139.69, "A"
+        if address == "存在しない町": return None, None, None
+        from geocoding import GeocodeUnavailable
+        raise GeocodeUnavailable([("A", "ConnectionError")])
+    out = bulk_assign(df, "住所", cache, schedules, search=search)
+    assert out["route_normal"].tolist() == ["井沼便", "", ""]
+    assert out["stop_normal"].tolist() == ["本町", "", ""]
+    assert out["geocode_source"].tolist() == ["A", "", UNAVAILABLE_SOURCE]
+    assert cache.get("存在しない町") == (None, None, None) and cache.get("接続できない町") is None
@@ -0,0 +1,161 @@
+"""
+プロセス内キャッシュ (caching.py) のテスト。
+
+    python -m pytest -q tests
+"""
+import os
+import sys
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from caching import BackgroundRefresher, LRUCache, SharedViewCache, estimate_size
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2)
+    cache.put("a", 1); cache.put("b", 2)
+    assert cache.get("a") == 1  # a を直近に使った
+    cache.put("c", 3)
+    assert "b" not in cache and "a" in cache and "c" in cache
+    assert (cache.hits, cache.misses, cache.evictions) == (1, 0, 1)
+    assert cache.get("b", "none") == "none" and cache.misses == 1
+
+
+def test_lru_byte_limit_and_discard():
+    cache = LRUCache(max_entries=10, max_bytes=1000, sizeof=len)
+    cache.put("a", "x" * 400); cache.put("b", "y" * 400)
+    assert cache.bytes == 800
+    cache.put("c", "z" * 400)
+    assert "a" not in cache and cache.bytes == 800
+    cache.put("big", "w" * 5000)  # 1件だけなら上限を超えても持つ
+    assert len(cache) == 1 and cache.bytes == 5000
+    cache.put("d", "v" * 10); cache.put(("v1", "map"), "m")
+    assert cache.discard_if(lambda key: isinstance(key, tuple)) == 1
+    cache.clear()
+    assert len(cache) == 0 and cache.bytes == 0
+
+
+def test_estimate_size_counts_dataframe_contents():
+    small = pd.DataFrame({"name": ["a"] * 10})
+    large = pd.DataFrame({"name": ["a" * 1000] * 10})
+    assert estimate_size(large) > estimate_size(small) + 9000
+    assert estimate_size({"k": [large]}) > estimate_size(large)
+
+
+def test_shared_cache_get_or_compute_computes_once():
+    cache = SharedViewCache(max_entries=8, max_bytes=None)
+    calls = []
+    def compute():
+        calls.append(1)
+        return "table"
+    assert cache.get_or_compute("v1", "tables", ("便1",), compute) == ("table", False)
+    assert cache.get_or_compute("v1", "tables", ("便1",), compute) == ("table", True)
+    assert len(calls) == 1
+    assert cache.summary()["by_namespace"] == {"tables": {"hits": 1, "misses": 1}}
+
+
+def test_refresher_starts_one_thread_for_concurrent_first_gets():
+    calls = []
+    def load(previous):
+        calls.append(previous)
+        time.sleep(0.05)
+        return len(calls)
+    runs = []
+    class CountingRefresher(BackgroundRefresher):
+        def _run(self):
+            runs.append(threading.current_thread())
+            super()._run()
+    refresher = CountingRefresher(load, interval=3600)
+    barrier = threading.Barrier(8)
+    def first_get():
+        barrier.wait()
+        assert refresher.get() == 1
+    threads = [threading.Thread(target=first_get) for _ in range(8)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    time.sleep(0.05)
+    refresher.stop()
+    assert calls == [None]
+    assert len(runs) == 1
+
+
+def test_refresher_returns_seed_and_loads_in_background():
+    loaded = threading.Event()
+    def load(previous):
+        time.sleep(0.05)
+        loaded.set()
+        return ("live", previous)
+    refresher = BackgroundRefresher(load, interval=3600, seed=lambda: "snapshot")
+    t0 = time.perf_counter()
+    assert refresher.get() == "snapshot"
+    assert time.perf_counter() - t0 < 0.05
+    assert loaded.wait(2)
+    deadline = time.time() + 2
+    while refresher.get() == "snapshot" and time.time() < deadline: time.sleep(0.01)
+    assert refresher.get() == ("live", "snapshot")
+    refresher.stop()
+
+
+def test_refresher_waits_for_load_without_seed_value():
+    refresher = BackgroundRefresher(lambda previous: "live", interval=3600, seed=lambda: None)
+    assert refresher.get() == "live"
+    refresher.stop()
+
+
+def test_shared_cache_keeps_current_and_previous_version():
+    cache = SharedViewCache(max_entries=16, max_bytes=None)
+    cache.put("v1", "map", "a", "old map")
+    cache.put("v2", "map", "a", "new map")
+    # 読み直しの直後: 古い版のセッションと新しい版のセッションが交互に来ても捨て合わない
+    for _ in range(3):
+        assert cache.get("v1", "map", "a") == "old map"
+        assert cache.get("v2", "map", "a") == "new map"
+    assert cache.data_version == "v2" and cache.invalidations == 0
+    cache.put("v3", "map", "a", "newest map")
+    assert cache.invalidations == 1  # しばらく使われていない v1 を捨てる
+    assert cache.versions == ["v2", "v3"]
+    assert cache.get("v2", "map", "a") == "new map"
+    assert cache.get("v3", "map", "a") == "newest map"
+
+
+def test_shared_cache_counts_hits_from_many_threads():
+    cache = SharedViewCache(max_entries=16, max_bytes=None)
+    cache.put("v1", "tables", "a", 1)
+    def worker():
+        for _ in range(500): cache.get("v1", "tables", "a"); cache.get("v1", "tables", "b")
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert cache.summary()["by_namespace"]["tables"] == {"hits": 4000, "misses": 4000}
+
+
+def test_refresher_keeps_last_value_on_failure_and_retries():
+    outcomes = iter(["first", RuntimeError("sheets down"), "second"])
+    def load(previous):
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception): raise outcome
+        return outcome
+    refresher = BackgroundRefresher(load, interval=3600, retry_interval=0.01)
+    assert refresher.get() == "first"
+    refresher.refresh_now()  # 失敗 → retry_interval 後に成功、その次は interval 後
+    deadline = time.time() + 2
+    while refresher.get() != "second" and time.time() < deadline:
+        assert refresher.get() in ("first", "second")  # 失敗しても前の値のまま
+        time.sleep(0.005)
+    refresher.stop()
+    status = refresher.status()
+    assert refresher.get() == "second"
+    assert (status["refreshes"], status["failures"], status["consecutive_failures"]) == (2, 1, 0)
+    assert status["last_error"] == "RuntimeError: sheets down"
+
+
+def test_refresher_first_load_failure_raises():
+    def load(previous): raise ValueError("no data")
+    refresher = BackgroundRefresher(load)
+    with pytest.raises(ValueError):
+        refresher.get()
+    assert refresher.status()["failures"] == 1 and refresher._thread is None
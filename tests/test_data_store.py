@@ -0,0 +1,72 @@
+"""
+データの読み込みとスナップショット (data_store.py) のテスト。
+
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from data_store import (
+    SNAPSHOT_FILES, csv_fingerprint, lookup_stop_ids, read_csv_auto_encoding, read_snapshot, read_snapshot_meta,
+    to_compact_model, write_snapshot,
+)
+
+
+@pytest.fixture
+def frames():
+    stops = pd.DataFrame({
+        "route": ["通常便1", "通常便1", "通常便2", "通常便1"], "stop_name": ["本町", "駅前", "本町", "本町"],
+        "lat": ["35.9", "35.91", "", "35.9"], "lng": [139.6, 139.61, 139.62, 139.6], "time_to": ["7:30", "7:40", "8:00", "7:30"],
+    })
+    students = pd.DataFrame({
+        "name": ["佐藤", "鈴木"], "route": ["通常便1", "通常便2"], "stop_name": ["駅前", "本町"], "direction": ["登校", "登下校"],
+    })
+    return stops, students
+
+
+def test_compact_model_types_and_stop_ids(frames):
+    stops, students = to_compact_model(*frames)
+    assert stops["route"].dtype == "category" and students["direction"].dtype == "category"
+    assert stops["lat"].dtype == np.float64 and np.isnan(stops.loc[2, "lat"])
+    assert stops["time_to"].dtype != "category"  # 時刻は文字列のまま
+    # 同じ便・同じ名前のバス停は同じ stop_id
+    assert stops["stop_id"].tolist() == [0, 1, 2, 0]
+    key_index = pd.MultiIndex.from_arrays([stops["route"].astype(str), stops["stop_name"].astype(str)]).unique()
+    assert lookup_stop_ids(key_index, students["route"], students["stop_name"]).tolist() == [1, 2]
+    assert lookup_stop_ids(key_index, ["無い便"], ["本町"]).tolist() == [-1]
+    assert frames[0]["lat"].tolist()[2] == ""  # 元の DataFrame は変えない
+
+
+def test_snapshot_round_trip(tmp_path, frames):
+    stops, students = frames
+    meta = write_snapshot(str(tmp_path), stops, students, "sheets", {"data_version": "abc"})
+    assert meta["source"] == "sheets" and meta["data_version"] == "abc"
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+    read_stops, read_students, read_meta = read_snapshot(str(tmp_path))
+    assert read_meta == meta == read_snapshot_meta(str(tmp_path))
+    assert read_stops["route"].dtype == "category"
+    pd.testing.assert_frame_equal(read_stops, to_compact_model(stops, students)[0].drop(columns="stop_id"))
+    assert read_students["name"].tolist() == ["佐藤", "鈴木"]
+
+
+def test_read_snapshot_missing_or_broken(tmp_path, frames):
+    assert read_snapshot(str(tmp_path)) is None
+    write_snapshot(str(tmp_path), *frames, "csv")
+    with open(tmp_path / SNAPSHOT_FILES["students"], "wb") as f: f.write(b"not feather")
+    assert read_snapshot(str(tmp_path)) is None
+    with open(tmp_path / "snapshot_meta.json", "w") as f: f.write("{broken")
+    assert read_snapshot_meta(str(tmp_path)) is None
+
+
+def test_read_csv_redetects_encoding_and_fingerprint(tmp_path):
+    path = tmp_path / "bus_stops.csv"
+    path.write_bytes("route,stop_name\n通常便1, 本町 \n".encode("cp932"))
+    df, encoding = read_csv_auto_encoding(str(path), "utf-8")  # 記録済みの文字コードで読めなければ判定し直す
+    assert encoding == "cp932" and df["stop_name"].tolist() == ["本町"]
+    fingerprint = csv_fingerprint([str(path), str(tmp_path / "missing.csv")])
+    assert list(fingerprint) == ["bus_stops.csv"] and fingerprint["bus_stops.csv"][1] == path.stat().st_size
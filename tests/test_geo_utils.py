@@ -0,0 +1,208 @@
+"""
+地理計算 (geo_utils.py) のテスト。
+
+    python -m pytest -q tests
+"""
+import json
+import math
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from geo_utils import (
+    WGS84_A, WGS84_E2, SegmentGridIndex, StopGridIndex, decode_polyline, encode_polyline, hubeny_distance, local_xy,
+    sequence_mismatches, simplify_geojson, simplify_line, snap_stops_to_routes,
+)
+
+
+def vincenty_distance(lat1, lng1, lat2, lng2):
+    """Vincenty の逆解法 (WGS84) による楕円体上の距離 [m]。ヒュベニの誤差を測る基準"""
+    f = 1 - math.sqrt(1 - WGS84_E2)
+    b = WGS84_A * (1 - f)
+    u1, u2 = math.atan((1 - f) * math.tan(math.radians(lat1))), math.atan((1 - f) * math.tan(math.radians(lat2)))
+    big_l = lam = math.radians(lng2 - lng1)
+    for _ in range(200):
+        sin_sigma = math.hypot(math.cos(u2) * math.sin(lam), math.cos(u1) * math.sin(u2) - math.sin(u1) * math.cos(u2) * math.cos(lam))
+        if sin_sigma == 0: return 0.0
+        cos_sigma = math.sin(u1) * math.sin(u2) + math.cos(u1) * math.cos(u2) * math.cos(lam)
+        sigma = math.atan2(sin_sigma, cos_sigma)
+        sin_alpha = math.cos(u1) * math.cos(u2) * math.sin(lam) / sin_sigma
+        cos2_alpha = 1 - sin_alpha ** 2
+        cos_2sm = cos_sigma - 2 * math.sin(u1) * math.sin(u2) / cos2_alpha
+        c = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+        lam_prev = lam
+        lam = big_l + (1 - c) * f * sin_alpha * (sigma + c * sin_sigma * (cos_2sm + c * cos_sigma * (-1 + 2 * cos_2sm ** 2)))
+        if abs(lam - lam_prev) < 1e-12: break
+    u_sq = cos2_alpha * (WGS84_A ** 2 - b ** 2) / b ** 2
+    big_a = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+    big_b = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+    delta = big_b * sin_sigma * (cos_2sm + big_b / 4 * (cos_sigma * (-1 + 2 * cos_2sm ** 2) - big_b / 6 * cos_2sm * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sm ** 2)))
+    return b * big_a * (sigma - delta)
+
+
+@pytest.fixture(scope="module")
+def stops():
+    rng = np.random.default_rng(0)
+    n = 1500
+    df = pd.DataFrame({
+        "route": [f"便{i % 20}" for i in range(n)], "stop_name": [f"バス停{i}" for i in range(n)],
+        "lat": 35.90 + rng.random(n) * 0.2, "lng": 139.55 + rng.random(n) * 0.2,
+    })
+    df.loc[10, ["lat", "lng"]] = df.loc[11, ["lat", "lng"]].values  # 同じ場所のバス停
+    df.loc[20, "lat"] = np.nan  # 座標なし (索引には入らない)
+    return df
+
+
+def test_hubeny_within_documented_error_of_ellipsoidal_distance():
+    rng = np.random.default_rng(1)
+    lat1, lng1 = 35.85 + rng.random(300) * 0.3, 139.50 + rng.random(300) * 0.3
+    lat2, lng2 = 35.85 + rng.random(300) * 0.3, 139.50 + rng.random(300) * 0.3
+    approx = hubeny_distance(lat1, lng1, lat2, lng2)
+    exact = np.array([vincenty_distance(*p) for p in zip(lat1, lng1, lat2, lng2)])
+    assert np.all(np.abs(approx - exact) <= exact * 1e-3)  # 0.1% 未満
+    near = exact < 1000
+    assert np.all(np.abs(approx[near] - exact[near]) < 1.0)  # 1km で 1m 未満
+    assert vincenty_distance(35.681236, 139.767125, 35.681236, 139.767125) == 0.0
+
+
+def test_query_many_matches_brute_force_top_k(stops):
+    index = StopGridIndex(stops)
+    rng = np.random.default_rng(2)
+    q_lat = np.concatenate([35.85 + rng.random(400) * 0.3, [stops.loc[11, "lat"], 36.5, 43.06, np.nan]])
+    q_lng = np.concatenate([139.50 + rng.random(400) * 0.3, [stops.loc[11, "lng"], 140.5, 141.35, 139.6]])
+    idx, dist = index.query_many(q_lat, q_lng, k=3)
+    lat, lng = index.lat, index.lng
+    for i in range(len(q_lat) - 1):
+        brute_dist = hubeny_distance(q_lat[i], q_lng[i], lat, lng)
+        brute = np.argsort(brute_dist, kind="stable")[:3]
+        np.testing.assert_array_equal(idx[i], brute)
+        np.testing.assert_allclose(dist[i], brute_dist[brute])
+    assert (idx[-1] == -1).all() and np.isnan(dist[-1]).all()
+
+
+def test_query_many_agrees_with_single_query_and_pads_small_index(stops):
+    index = StopGridIndex(stops, cell_m=200.0)
+    for la, ln in [(35.95, 139.60), (35.0, 139.0)]:
+        single_idx, single_dist = index.query(la, ln, k=5)
+        many_idx, many_dist = index.query_many([la], [ln], k=5)
+        np.testing.assert_array_equal(many_idx[0], single_idx)
+        np.testing.assert_allclose(many_dist[0], single_dist)
+    small = StopGridIndex(stops.head(2))
+    idx, dist = small.query_many([35.95], [139.60], k=3)
+    assert idx[0, 2] == -1 and np.isnan(dist[0, 2]) and (idx[0, :2] >= 0).all()
+    empty_idx, _ = StopGridIndex(stops.head(0)).query_many([35.95], [139.60], k=3)
+    assert (empty_idx == -1).all()
+
+
+@pytest.fixture(scope="module")
+def route_lines():
+    """少しずつ曲がる道を 3 本 (3本目は1点だけで線分なし)"""
+    rng = np.random.default_rng(3)
+    lines = []
+    for start in ([139.60, 35.90], [139.65, 35.95]):
+        angle = rng.uniform(0, 2 * np.pi) + np.cumsum(rng.normal(0, 0.1, 300))
+        lines.append((np.array(start) + np.cumsum(0.0002 * np.column_stack([np.cos(angle), np.sin(angle)]), axis=0)).tolist())
+    lines.append([[139.7, 35.8]])
+    return lines
+
+
+def brute_snap(index, lat, lng, line):
+    """1点をライン上の全線分と比べる → (距離, chainage)"""
+    px, py = local_xy(lat, lng, index.lat0, index.lng0)
+    segments = np.arange(index.line_segments[line], index.line_segments[line + 1])
+    t, dist = index._project(px, py, segments)
+    j = int(np.argmin(dist))
+    return dist[j], index.segment_start[segments[j]] + t[j] * index.segment_length[segments[j]]
+
+
+def test_segment_index_snap_matches_brute_force(route_lines):
+    index = SegmentGridIndex(route_lines, cell_m=50.0)
+    rng = np.random.default_rng(4)
+    coords = np.asarray(route_lines[0])
+    picks = rng.choice(len(coords), 60)
+    lats = coords[picks, 1] + rng.normal(0, 0.0003, 60)
+    lngs = coords[picks, 0] + rng.normal(0, 0.0003, 60)
+    lats[:5] += 0.01  # ラインから 1km ほど離れた点 (セルの外まで探しにいく)
+    distance, chainage, segment = index.snap(lats, lngs, np.zeros(60, dtype=np.int64))
+    for i in range(60):
+        want_dist, want_chainage = brute_snap(index, lats[i], lngs[i], 0)
+        assert distance[i] == pytest.approx(want_dist, abs=1e-6)
+        assert chainage[i] == pytest.approx(want_chainage, abs=1e-6)
+        assert index.line_of_segment[segment[i]] == 0
+    assert np.all(chainage >= 0) and np.all(chainage <= index.line_length[0] + 1e-6)
+
+
+def test_segment_index_snap_unsnappable_points(route_lines):
+    index = SegmentGridIndex(route_lines)
+    distance, chainage, segment = index.snap([35.9, np.nan, 35.8], [139.6, 139.6, 139.7], [0, 0, 2])
+    assert segment[0] >= 0 and not np.isnan(distance[0])
+    assert segment[1] == -1 and np.isnan(distance[1]) and np.isnan(chainage[1])
+    assert segment[2] == -1 and np.isnan(distance[2])  # 線分のないライン
+    empty = SegmentGridIndex([])
+    assert empty.snap([35.9], [139.6])[2][0] == -1
+
+
+def test_sequence_mismatches_accepts_either_direction():
+    assert not sequence_mismatches([1, 2, 3, 4], [10, 20, 30, 40]).any()
+    assert not sequence_mismatches([1, 2, 3, 4], [40, 30, 20, 10]).any()
+    assert sequence_mismatches([1, 2, 3, 4, 5], [10, 20, 5, 40, 50]).tolist() == [False, False, True, False, False]
+
+
+def test_snap_stops_to_routes_picks_line_and_flags_far_and_out_of_order(route_lines):
+    index = SegmentGridIndex(route_lines)
+    coords = np.asarray(route_lines[0])
+    picks = [10, 60, 110, 160, 210, 260]
+    stops = pd.DataFrame({
+        "route": "便A", "stop_name": [f"停{i}" for i in range(6)],
+        "lat": coords[picks, 1], "lng": coords[picks, 0], "sequence": [1, 2, 4, 3, 5, 6],
+    }, index=range(100, 106))
+    stops.loc[105, "lat"] += 0.01  # 約1km 離れたバス停
+    stops.loc[106] = ["便B", "ラインなし", 35.9, 139.6, 1]
+    result = snap_stops_to_routes(stops, index, {"便A": [1, 0]}, max_distance_m=50.0)
+    assert list(result.index) == list(stops.index)
+    assert (result.loc[100:105, "line"] == 0).all()  # 中央値の近い方のライン
+    assert result.loc[100:104, "distance_m"].max() < 1.0
+    assert result.loc[105, "far"] and not result.loc[100:104, "far"].any()
+    assert result.loc[100:105, "out_of_order"].sum() == 1 and (result.loc[102, "out_of_order"] or result.loc[103, "out_of_order"])
+    assert not result.loc[105, "out_of_order"]  # 遠いバス停は順番を判定しない
+    assert result.loc[106, "line"] == -1 and np.isnan(result.loc[106, "distance_m"])
+
+
+def test_simplify_line_stays_within_tolerance_and_keeps_endpoints(route_lines):
+    line = route_lines[0]
+    simplified = simplify_line(line, 5.0)
+    assert simplified[0] == line[0] and simplified[-1] == line[-1]
+    assert 2 <= len(simplified) < len(line)
+    index = SegmentGridIndex([simplified])
+    coords = np.asarray(line)
+    distance, _, _ = index.snap(coords[:, 1], coords[:, 0], np.zeros(len(coords), dtype=np.int64))
+    assert distance.max() <= 5.0 + 0.05  # 平面近似の違いの分だけ余裕を見る
+    assert simplify_line(line[:2], 5.0) == line[:2]
+    assert len(simplify_line(line, 0)) == len(line)
+
+
+def test_simplify_geojson_rounds_without_changing_input(route_lines):
+    data = {"type": "FeatureCollection", "features": [
+        {"type": "Feature", "properties": {"name": "便A"}, "geometry": {"type": "LineString", "coordinates": route_lines[0]}},
+        {"type": "Feature", "properties": {"name": "点"}, "geometry": {"type": "Point", "coordinates": [139.6, 35.9]}},
+    ]}
+    before = json.dumps(data)
+    out = simplify_geojson(data, tolerance_m=1.0, decimals=5)
+    assert json.dumps(data) == before
+    coords = out["features"][0]["geometry"]["coordinates"]
+    assert all(round(v, 5) == v for p in coords for v in p)
+    assert out["features"][1]["geometry"] == data["features"][1]["geometry"]
+
+
+def test_polyline_matches_reference_and_round_trips(route_lines):
+    # Google の Encoded Polyline の説明にある例
+    reference = [[-120.2, 38.5], [-120.95, 40.7], [-126.453, 43.252]]
+    assert encode_polyline(reference) == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+    np.testing.assert_allclose(decode_polyline("_p~iF~ps|U_ulLnnqC_mqNvxq`@"), reference)
+    decoded = np.asarray(decode_polyline(encode_polyline(route_lines[0])))
+    assert np.abs(decoded - np.asarray(route_lines[0])).max() <= 0.5e-5 + 1e-12
+    assert decode_polyline(encode_polyline([])) == []
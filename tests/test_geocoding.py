@@ -0,0 +1,187 @@
+"""
+住所検索 (geocoding.py) のテスト。外部ネットワークには接続しない
+(プロバイダは関数のスタブ、または tests/fake_apis.py のローカルのスタブ HTTP サーバ)。
+
+    python -m pytest -q tests
+"""
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from fake_apis import KNOWN, start_server, stub_providers
+from geocoding import (
+    CircuitBreaker, GeocodeCache, GeocodeUnavailable, RacingGeocoder, geocode_with_cache, search_address_ultimate,
+)
+
+SLOW = 0.6  # 遅いスタブの応答時間 [s]
+
+
+def answer(result):
+    def provider(query, **kwargs):
+        return result(query) if callable(result) else result
+    return provider
+
+
+def broken(query, **kwargs):
+    raise ConnectionError("接続できません")
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return GeocodeCache(str(tmp_path / "geocode.sqlite3"))
+
+
+def test_serial_search_follows_priority_and_falls_back_to_town_name():
+    providers = [
+        ("A", answer(lambda q: (1.0, 1.0) if q == "岩槻区本町" else None)),
+        ("B", answer(lambda q: (2.0, 2.0) if q == "岩槻区本町" else None)),
+    ]
+    assert search_address_ultimate("岩槻区本町3-1", providers) == (1.0, 1.0, "A")
+
+
+def test_error_then_hit_returns_the_hit():
+    assert search_address_ultimate("岩槻区本町3-1", [("A", broken), ("B", answer((2.0, 2.0)))]) == (2.0, 2.0, "B")
+
+
+def test_not_found_is_cached_only_when_every_provider_answered(cache):
+    search = lambda a: search_address_ultimate(a, [("A", answer(None)), ("B", answer(None))])
+    assert geocode_with_cache("存在しない町9-9", cache, search) == (None, None, None)
+    assert cache.get("存在しない町9-9") == (None, None, None)
+
+
+def test_provider_errors_are_not_cached(cache):
+    search = lambda a: search_address_ultimate(a, [("A", broken), ("B", answer(None))])
+    with pytest.raises(GeocodeUnavailable) as excinfo:
+        geocode_with_cache("岩槻区本町3-1", cache, search)
+    assert [name for name, _ in excinfo.value.errors] == ["A", "A"]  # 住所そのまま・町名だけ の2回
+    assert cache.get("岩槻区本町3-1") is None
+    # 障害が直れば、次の検索で問い合わせ直して見つかる
+    assert geocode_with_cache("岩槻区本町3-1", cache, lambda a: (3.0, 3.0, "A")) == (3.0, 3.0, "A")
+    assert cache.get("岩槻区本町3-1") == (3.0, 3.0, "A")
+
+
+def test_cache_key_is_normalized(cache):
+    calls = []
+    def search(address):
+        calls.append(address)
+        return 1.0, 2.0, "A"
+    geocode_with_cache("岩槻区本町３－１", cache, search)
+    geocode_with_cache(" 岩槻区本町3－1 ", cache, search)
+    assert len(calls) == 1
+
+
+def test_negative_entries_expire_sooner(cache):
+    cache.put("どこか", None, None, None, now=0)
+    cache.put("岩槻区本町", 1.0, 2.0, "A", now=0)
+    later = cache.negative_ttl + 1
+    assert cache.get("どこか", now=later) is None
+    assert cache.get("岩槻区本町", now=later) == (1.0, 2.0, "A")
+
+
+# ---------------------------------------------------------
+# RacingGeocoder (ローカルのスタブ HTTP サーバ)
+# ---------------------------------------------------------
+@pytest.fixture(scope="module")
+def servers():
+    servers = {b: start_server(b, SLOW) for b in ("slow", "fail", "ok")}
+    yield servers
+    for server, _ in servers.values(): server.shutdown()
+
+
+@pytest.fixture
+def make_racer():
+    racers = []
+    def make(providers, **kwargs):
+        racer = RacingGeocoder(providers, **kwargs)
+        racers.append(racer)
+        return racer
+    yield make
+    for racer in racers: racer.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def test_race_winner_follows_priority_not_speed(servers, make_racer):
+    # GSI は遅いが締め切り内に答える → 速い農研ではなく GSI を採用する (逐次版と同じ結果)
+    providers = stub_providers(servers, "slow", "ok", "ok")
+    racer = make_racer(providers, default_deadline=SLOW * 3)
+    assert racer.search("岩槻区本町3-1") == (*KNOWN["岩槻区本町"], "国土地理院")
+    assert search_address_ultimate("岩槻区本町3-1", providers) == (*KNOWN["岩槻区本町"], "国土地理院")
+
+
+def test_race_skips_failing_and_late_providers_within_one_deadline(servers, make_racer):
+    racer = make_racer(stub_providers(servers, "slow", "fail", "ok"), default_deadline=SLOW / 2)
+    t0 = time.perf_counter()
+    assert racer.search("岩槻区本町3-1") == (*KNOWN["岩槻区本町"], "Geocoding.jp")
+    assert time.perf_counter() - t0 < SLOW  # 遅い GSI の応答を待たない
+
+
+def test_race_miss_is_not_found_only_when_every_provider_answered(servers, make_racer):
+    racer = make_racer(stub_providers(servers, "ok", "ok", "ok"))
+    assert racer.search("存在しない町9-9") == (None, None, None)
+    racer = make_racer(stub_providers(servers, "ok", "fail", "ok"))
+    with pytest.raises(GeocodeUnavailable):
+        racer.search("存在しない町9-9")
+
+
+def test_breaker_opens_skips_and_half_opens(servers, make_racer):
+    fail_server, _ = servers["fail"]
+    providers = stub_providers(servers, "fail", "fail", "fail")[:1]
+    racer = make_racer(providers, breaker_factory=lambda: CircuitBreaker(max_failures=3, reset_after=0.3))
+    before = fail_server.requests
+    for _ in range(2):  # 1回の検索で 住所そのまま・町名だけ の2件 → 2回目の途中で3回に達する
+        with pytest.raises(GeocodeUnavailable): racer.search("岩槻区本町3-1")
+    breaker = racer.breakers["国土地理院"]
+    assert breaker.is_open
+    seen = fail_server.requests
+    assert seen - before >= 3
+    # 開いている間は問い合わせない。全部開いていたら「見つからない」ではなく GeocodeUnavailable
+    with pytest.raises(GeocodeUnavailable) as excinfo:
+        racer.search("岩槻区本町3-1")
+    assert fail_server.requests == seen
+    assert {reason for _, reason in excinfo.value.errors} == {"ブレーカー作動中"}
+    # reset_after 後は半開で1回だけ試し、失敗したらまた開く
+    time.sleep(0.35)
+    with pytest.raises(GeocodeUnavailable): racer.search("岩槻区本町")
+    assert fail_server.requests == seen + 1
+    assert breaker.is_open
+
+
+def test_breaker_closes_after_success_in_half_open():
+    breaker = CircuitBreaker(max_failures=2, reset_after=10)
+    breaker.record_failure(now=0); breaker.record_failure(now=0)
+    assert breaker.is_open and not breaker.allow(now=5)
+    assert breaker.allow(now=10)
+    breaker.record_success()
+    assert not breaker.is_open and breaker.failures == 0
+
+
+def test_time_waiting_for_a_worker_does_not_count_against_the_provider(make_racer):
+    # スレッド1本に同時に多数の検索: 順番待ちの時間は締め切りに数えないので、全部見つかりブレーカーも開かない
+    def slow_provider(query, session=None, timeout=None):
+        time.sleep(0.02)
+        return (1.0, 2.0) if query == "岩槻区本町" else None
+    racer = make_racer([("A", slow_provider)], default_deadline=0.1, max_workers=1)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(racer.search, [f"岩槻区本町{i}-1" for i in range(20)]))
+    assert results == [(1.0, 2.0, "A")] * 20
+    assert not racer.breakers["A"].is_open
+
+
+def test_queue_timeout_is_unavailable_without_tripping_the_breaker(make_racer):
+    release = threading.Event()
+    def blocking(query, session=None, timeout=None):
+        release.wait(2)
+        return None
+    racer = make_racer([("A", blocking)], default_deadline=0.2, max_workers=1, max_queue_wait=0.0)
+    try:
+        with pytest.raises(GeocodeUnavailable) as excinfo:
+            # 1件目が実行中の間、2件目 (町名だけ) は始まらない → 順番待ちの上限で打ち切る
+            racer.search("岩槻区本町3-1")
+    finally:
+        release.set()
+    assert "順番待ちで時間切れ" in {reason for _, reason in excinfo.value.errors}
+    assert racer.breakers["A"].failures == 1  # 実行した1件目の締め切り超過だけ
@@ -0,0 +1,53 @@
+"""
+地図の独自レイヤー (map_layers.py) のテスト。
+
+    python -m pytest -q tests
+"""
+import json
+import os
+import re
+import sys
+
+import folium
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from map_layers import LazyStopLayer
+
+STYLE = {"radius": 7, "color": "#FF0000", "weight": 1, "fill_color": "#FF0000", "fill_opacity": 0.9}
+
+
+def render(layer):
+    m = folium.Map(location=[35.9, 139.6], tiles=None)
+    layer.add_to(m)
+    return m.get_root().render()
+
+
+def payload(html, name):
+    """埋め込まれた var name = [...]; の JSON"""
+    return json.loads(re.search(rf"var {name} = (.*?);\n", html).group(1))
+
+
+def test_shared_styles_and_routes_are_embedded_once():
+    layer = LazyStopLayer()
+    for i in range(3):
+        layer.add_stop(35.9 + i / 1000, 139.6, STYLE, "便1", f"停{i}", "7:30", "15:30", "佐藤、鈴木", "#FF0000")
+    layer.add_stop(35.95, 139.65, {**STYLE, "radius": 3}, "便2", "駅前", "-", "-", "(なし)", "black")
+    html = render(layer)
+    assert len(layer) == 4
+    assert payload(html, "styles") == [
+        {"radius": 7, "color": "#FF0000", "weight": 1, "fill": True, "fillColor": "#FF0000", "fillOpacity": 0.9},
+        {"radius": 3, "color": "#FF0000", "weight": 1, "fill": True, "fillColor": "#FF0000", "fillOpacity": 0.9},
+    ]
+    assert payload(html, "routes") == [["便1", "#FF0000"], ["便2", "black"]]
+    assert payload(html, "stops")[3] == [35.95, 139.65, 1, 1, "駅前", "-", "-", "(なし)"]
+    # ポップアップの HTML はバス停ごとに埋め込まない (クリック時に組み立てる)
+    assert html.count("佐藤、鈴木") == 3 and "bindPopup(function()" in html and html.count("L.circleMarker") == 1
+
+
+def test_payload_cannot_close_the_script_tag():
+    layer = LazyStopLayer()
+    layer.add_stop(35.9, 139.6, STYLE, "便1", "</script><b>停</b>", "7:30", "15:30", "名前", "red")
+    html = render(layer)
+    assert "</script><b>" not in html
+    assert payload(html, "stops")[0][4] == "</script><b>停</b>"
+    assert LazyStopLayer.to_js({"停": "</"}) == '{"停":"<\\/"}'
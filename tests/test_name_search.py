@@ -0,0 +1,53 @@
+"""
+生徒の名前検索インデックス (name_search.py) のテスト。
+
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from name_search import StudentSearchIndex, normalize_search_text
+
+
+@pytest.fixture(scope="module")
+def students():
+    return pd.DataFrame({
+        "name": ["佐藤 太郎", "サトウ ハナコ", "さとう", "鈴木一郎", "ＳＡＴＯ　Ｋｅｎ", "高橋 さとし"],
+        "department": ["小学部", "中学部", "高等部", "小学部", "中学部", "さとう学級"],
+        "stop_name": ["本町", "佐藤商店前", "駅前", "本町", "駅前", "東口"],
+    }, index=[10, 11, 12, 13, 14, 15])
+
+
+def brute_force(students, query):
+    key = normalize_search_text(query)
+    return {label for label, row in students.iterrows() if any(key in normalize_search_text(row[f]) for f in ("name", "department", "stop_name"))}
+
+
+def test_normalize_folds_width_kana_case_and_spaces():
+    assert normalize_search_text("ＳＡＴＯ　Ｋｅｎ") == "satoken"
+    assert normalize_search_text("サトウ ハナコ") == "さとうはなこ"
+    assert normalize_search_text(" 佐藤　太郎 ") == "佐藤太郎"
+
+
+@pytest.mark.parametrize("query", ["さとう", "サトウ", "佐藤", "sato", "ＳＡＴＯ", "本", "駅前", "学部", "ん", "存在しない"])
+def test_search_matches_brute_force_substring(students, query):
+    assert set(StudentSearchIndex(students).search(query)) == brute_force(students, query)
+
+
+def test_search_ranks_name_matches_before_other_fields(students):
+    index = StudentSearchIndex(students)
+    # 名前の完全一致 → 名前の前方一致 → 名前の部分一致 → ほかの列の前方一致 → ほかの列の部分一致
+    assert index.search("さとう") == [12, 11, 15]
+    assert index.search("佐藤") == [10, 11]
+    assert index.search("さとう", limit=1) == [12]
+    assert index.search("  ") == []
+
+
+def test_search_uses_only_existing_fields():
+    index = StudentSearchIndex(pd.DataFrame({"name": ["山田", "山本"]}))
+    assert index.fields == ["name"]
+    assert index.search("山") == [1, 0]  # 同じ順位なら正規化した名前の順
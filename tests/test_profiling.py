@@ -0,0 +1,52 @@
+"""
+再実行ごとの計測 (profiling.py) のテスト。
+
+    python -m pytest -q tests
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from profiling import RerunProfiler, append_jsonl, to_jsonl
+
+
+def test_spans_add_up_and_counts_accumulate():
+    profiler = RerunProfiler(enabled=True)
+    for _ in range(2):
+        with profiler.span("map_build"): time.sleep(0.01)
+    profiler.count("map_cache_hit"); profiler.count("map_cache_hit")
+    profiler.count("map_html_bytes", 1234)
+    record = profiler.finish(schedule_mode="通常便")
+    assert record["spans"]["map_build"] >= 20.0
+    assert record["total_ms"] >= record["spans"]["map_build"]
+    assert record["counts"] == {"map_cache_hit": 2, "map_html_bytes": 1234}
+    assert record["schedule_mode"] == "通常便"
+
+
+def test_disabled_profiler_records_nothing():
+    profiler = RerunProfiler(enabled=False)
+    with profiler.span("load_data"): pass
+    profiler.count("rows", 10)
+    assert profiler.finish() is None
+    assert profiler.spans == {} and profiler.counts == {}
+    assert profiler.span("a") is profiler.span("b")  # 同じ何もしないコンテキストを使い回す
+
+
+def test_span_records_time_when_block_raises():
+    profiler = RerunProfiler(enabled=True)
+    try:
+        with profiler.span("failing"): raise ValueError
+    except ValueError:
+        pass
+    assert "failing" in profiler.finish()["spans"]
+
+
+def test_jsonl_helpers(tmp_path):
+    records = [{"total_ms": 1.5, "spans": {"地図": 1.0}}, {"total_ms": 2.0, "spans": {}}]
+    path = tmp_path / "logs" / "profile.jsonl"
+    for record in records: append_jsonl(str(path), record)
+    assert [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()] == records
+    assert to_jsonl(records) == path.read_text(encoding="utf-8")
+    assert "地図" in to_jsonl(records[:1])  # 日本語は \uXXXX にしない
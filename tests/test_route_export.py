@@ -0,0 +1,81 @@
+"""
+一括出力 (route_export.py) のテスト。
+
+    python -m pytest -q tests
+"""
+import io
+import os
+import sys
+import time
+import zipfile
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from route_export import available_formats, build_roster, prune_exports, write_export_zip
+
+
+def touch(path, age=0):
+    with open(path, "wb") as f: f.write(b"x")
+    if age: os.utime(path, (time.time() - age, time.time() - age))
+
+
+def test_prune_keeps_current_version_and_fresh_tmp(tmp_path):
+    for name in ("routes_new_csv.zip", "routes_new_csv_pdf.zip", "routes_old_csv.zip", "routes_older_xlsx.zip", "notes.txt"):
+        touch(tmp_path / name)
+    touch(tmp_path / "fresh.tmp")  # 別のセッションが書いている途中
+    touch(tmp_path / "stale.tmp", age=7200)  # 落ちたときの書きかけ
+
+    assert prune_exports(str(tmp_path), "routes_new_") == 3
+    assert sorted(os.listdir(tmp_path)) == ["fresh.tmp", "notes.txt", "routes_new_csv.zip", "routes_new_csv_pdf.zip"]
+    assert prune_exports(str(tmp_path), "routes_new_") == 0
+
+
+@pytest.fixture
+def bundle():
+    timetable = pd.DataFrame({
+        "stop_id": [0, 1, 2], "route": ["便1", "便1", "便2"], "stop_name": ["本町", "駅前", "東口"], "sequence": [1, 2, 1],
+        "time_to": ["7:30", "7:40", "8:00"], "time_from": ["15:30", "15:20", "16:00"],
+        "students_to": ["佐藤", "鈴木、高橋", ""], "students_from": ["佐藤", "高橋", "田中"], "students_all": ["", "", ""],
+    })
+    students = pd.DataFrame({
+        "name": ["鈴木", "佐藤", "高橋", "田中"], "department": ["小", "中", "高", "小"],
+        "route": ["便1", "便1", "便1", "便2"], "stop_name": ["駅前", "本町", "駅前", "東口"],
+        "direction": ["登校", "登下校", "登下校", "下校"],
+    })
+    return {"通常便": {"timetable": timetable, "routes": ["便1", "便2"], "students": students}}
+
+
+def test_roster_in_stop_order_and_filtered_by_direction(bundle):
+    view = bundle["通常便"]
+    route_timetable = view["timetable"][view["timetable"]["route"] == "便1"]
+    roster = build_roster(view["students"], route_timetable, "便1")
+    assert roster["name"].tolist() == ["佐藤", "鈴木", "高橋"]
+    assert list(roster.columns) == ["name", "department", "stop_name", "direction"]
+    assert build_roster(view["students"], route_timetable, "便1", "下校")["name"].tolist() == ["佐藤", "高橋"]
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_export_zip_contains_every_route_table(bundle, workers):
+    buffer, calls = io.BytesIO(), []
+    stats = write_export_zip(buffer, bundle, ["csv"], max_workers=workers, progress=lambda done, total: calls.append((done, total)))
+    with zipfile.ZipFile(io.BytesIO(buffer.getvalue())) as archive:
+        names = archive.namelist()
+        timetable = archive.read("通常便/登校/便1_時刻表.csv").decode("utf-8-sig")
+        roster = archive.read("通常便/下校/便2_名簿.csv").decode("utf-8-sig")
+    assert len(names) == stats["files"] == 8  # 2路線 × 登下校 × (時刻表・名簿)
+    assert timetable.splitlines() == ["バス停名,時間,登校生徒", "本町,7:30,佐藤", "駅前,7:40,鈴木、高橋"]
+    assert roster.splitlines()[1:] == ["田中,小,東口,下校"]
+    assert calls[-1] == (8, 8) and [done for done, _ in calls] == list(range(1, 9))
+
+
+def test_export_other_formats_when_installed(bundle):
+    formats = [fmt for fmt in available_formats() if fmt != "csv"]
+    if not formats: pytest.skip("openpyxl / reportlab が入っていない")
+    buffer = io.BytesIO()
+    stats = write_export_zip(buffer, bundle, formats, schedule_modes=["通常便"])
+    with zipfile.ZipFile(io.BytesIO(buffer.getvalue())) as archive:
+        assert stats["files"] == 8 * len(formats)
+        if "xlsx" in formats: assert archive.read("通常便/登校/便1_時刻表.xlsx")[:2] == b"PK"
+        if "pdf" in formats: assert archive.read("通常便/登校/便1_時刻表.pdf")[:4] == b"%PDF"
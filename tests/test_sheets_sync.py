@@ -0,0 +1,98 @@
+"""
+Sheets 同期 (sheets_sync.py) のテスト。tests/fake_apis.py の偽 Sheets / Drive API (ローカル HTTP サーバ) に接続する。
+
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from fake_apis import SPREADSHEET_ID, FakeSheets, start_fake_api
+from sheets_sync import SheetsSync, build_services, diff_rows
+
+RANGES = {"bus_stops": "bus_stops!A:H", "students": "students!A:I"}
+METADATA = f"/drive/v3/files/{SPREADSHEET_ID}"
+BATCH_GET = f"/v4/spreadsheets/{SPREADSHEET_ID}/values:batchGet"
+
+
+@pytest.fixture
+def fake():
+    fake = FakeSheets(50)
+    server, endpoint = start_fake_api(fake)
+    fake.endpoint = endpoint
+    yield fake
+    server.shutdown()
+
+
+@pytest.fixture
+def make_sync(fake, tmp_path):
+    from google.auth.credentials import AnonymousCredentials
+    sheets, drive = build_services(AnonymousCredentials(), api_endpoint=fake.endpoint)
+    def make():
+        return SheetsSync(sheets, drive, SPREADSHEET_ID, RANGES, snapshot_path=str(tmp_path / "snapshot.json"))
+    return make
+
+
+def sync_requests(fake, sync, **kwargs):
+    fake.requests.clear()
+    tables = sync.sync(**kwargs)
+    return tables, list(fake.requests)
+
+
+def test_first_sync_fetches_both_ranges_in_one_batch_get(fake, make_sync):
+    sync = make_sync()
+    tables, requests = sync_requests(fake, sync)
+    assert requests == [METADATA, BATCH_GET]
+    assert fake.batch_ranges == [list(RANGES.values())]
+    assert tables == fake.sheets
+    assert sync.stats["last_diff"]["students"] == {"added": 50, "removed": 0, "unchanged": 0}
+
+
+def test_unchanged_revision_costs_exactly_one_metadata_call(fake, make_sync):
+    sync = make_sync()
+    sync.sync()
+    tables, requests = sync_requests(fake, sync)
+    assert requests == [METADATA]
+    assert tables == fake.sheets
+    assert sync.stats == {**sync.stats, "metadata_calls": 2, "batch_gets": 1, "unchanged": 1}
+
+
+def test_row_level_diff_after_an_edit(fake, make_sync):
+    sync = make_sync()
+    sync.sync()
+    fake.edit()  # 1行変更 (= 1行削除 + 1行追加) と 1行追加
+    tables, requests = sync_requests(fake, sync)
+    assert requests == [METADATA, BATCH_GET]
+    assert tables["students"] == fake.sheets["students"]
+    assert sync.stats["last_diff"] == {
+        "bus_stops": {"added": 0, "removed": 0, "unchanged": 200},
+        "students": {"added": 2, "removed": 1, "unchanged": 49},
+    }
+
+
+def test_restart_resumes_from_the_saved_snapshot(fake, make_sync):
+    make_sync().sync()
+    restarted = make_sync()
+    tables, requests = sync_requests(fake, restarted)
+    assert requests == [METADATA]
+    assert tables == fake.sheets
+
+
+def test_metadata_failure_or_force_falls_back_to_batch_get(fake, make_sync):
+    sync = make_sync()
+    sync.sync()
+    _, requests = sync_requests(fake, sync, force=True)
+    assert requests == [METADATA, BATCH_GET]
+    fake.fail_metadata = True
+    tables, requests = sync_requests(fake, sync)
+    assert requests[-1] == BATCH_GET and requests.count(BATCH_GET) == 1
+    assert tables == fake.sheets
+
+
+def test_diff_rows_counts_duplicates():
+    header = ["name", "stop"]
+    old = [header, ["a", "1"], ["a", "1"], ["b", "2"]]
+    new = [header, ["a", "1"], ["b", "2"], ["c", "3"]]
+    assert diff_rows(old, new) == {"added": [["c", "3"]], "removed": [["a", "1"]], "unchanged": 2}
@@ -0,0 +1,130 @@
+"""
+地図タイルのキャッシュ / 中継サーバ (tile_cache.py) のテスト。上流はローカルのスタブ HTTP サーバ。
+
+    python -m pytest -q tests
+"""
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from tile_cache import (
+    TILE_SOURCES, TileProxy, TileStore, etag_for, main, prefetch, proxied_url, serve, stops_bbox, tile_xy, tiles_for_bbox,
+)
+
+
+class QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass
+
+
+@pytest.fixture
+def upstream():
+    """/xyz/pale/{z}/{x}/{y}.png を返す偽の上流。z=0 は 404、z=1 は 500。受けた path を requests に記録する"""
+    requests_seen = []
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            requests_seen.append(self.path)
+            status = {"/xyz/pale/0/": 404, "/xyz/pale/1/": 500}.get(self.path[:len("/xyz/pale/0/")], 200)
+            body = ("tile " + self.path).encode("utf-8") if status == 200 else b""
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+    server = QuietServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield {"pale": (url + "/xyz/pale/{z}/{x}/{y}.png", "png", "stub")}, requests_seen
+    server.shutdown(); server.server_close()
+
+
+def test_store_lru_eviction_by_last_use(tmp_path):
+    store = TileStore(str(tmp_path), max_bytes=1000)
+    for y in range(3):
+        store.put("pale", 15, 1, y, "png", b"x" * 300)
+        os.utime(store.path("pale", 15, 1, y, "png"), (time.time() - 100 + y, time.time() - 100 + y))
+    assert store.get("pale", 15, 1, 0, "png") == b"x" * 300  # 0 を使ったので一番古いのは 1
+    store.put("pale", 15, 1, 3, "png", b"x" * 300)
+    assert store.get("pale", 15, 1, 1, "png") is None
+    assert store.total_bytes <= 900 and store.evictions == 1 and len(store) == 3
+    reopened = TileStore(str(tmp_path), max_bytes=1000)  # 起動時にディスクの中身を数え直す
+    assert reopened.total_bytes == store.total_bytes and len(reopened) == 3
+
+
+def test_proxy_fetches_once_then_serves_from_disk(tmp_path, upstream):
+    sources, seen = upstream
+    proxy = TileProxy(TileStore(str(tmp_path)), sources=sources)
+    data, ext = proxy.fetch("pale", 15, 100, 200)
+    assert data == b"tile /xyz/pale/15/100/200.png" and ext == "png"
+    assert proxy.fetch("pale", 15, 100, 200) == (data, "png")
+    assert (proxy.hits, proxy.misses, len(seen)) == (1, 1, 1)
+    assert proxy.fetch("pale", 0, 0, 0) is None  # 上流に無い
+    with pytest.raises(requests.HTTPError):
+        proxy.fetch("pale", 1, 0, 0)
+    assert proxy.store.get("pale", 1, 0, 0, "png") is None  # 失敗は保存しない
+
+
+def test_server_etag_cache_control_and_errors(tmp_path, upstream):
+    sources, _ = upstream
+    proxy = TileProxy(TileStore(str(tmp_path)), sources=sources)
+    server = serve(proxy, host="127.0.0.1", port=0, max_age=60)
+    try:
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        assert proxied_url(base + "/", "pale") == base + "/tiles/pale/{z}/{x}/{y}.png"
+        res = requests.get(f"{base}/tiles/pale/15/1/2.png", timeout=5)
+        assert res.status_code == 200 and res.headers["Content-Type"] == "image/png"
+        assert res.headers["ETag"] == etag_for(res.content) and res.headers["Cache-Control"] == "public, max-age=60"
+        again = requests.get(f"{base}/tiles/pale/15/1/2.png", headers={"If-None-Match": res.headers["ETag"]}, timeout=5)
+        assert again.status_code == 304 and again.content == b""
+        assert requests.get(f"{base}/tiles/pale/0/0/0.png", timeout=5).status_code == 404
+        assert requests.get(f"{base}/tiles/pale/1/0/0.png", timeout=5).status_code == 502
+        assert requests.get(f"{base}/tiles/unknown/15/1/2.png", timeout=5).status_code == 404
+        assert requests.get(f"{base}/tiles/pale/15/x/2.png", timeout=5).status_code == 404
+    finally:
+        server.shutdown(); server.server_close()
+
+
+def test_tile_math_and_bbox():
+    assert tile_xy(0.0, 0.0, 1) == (1, 1)
+    assert tile_xy(85.1, -180.0, 2) == (0, 0) and tile_xy(-85.1, 180.0, 2) == (3, 3)
+    tiles = tiles_for_bbox(35.93, 139.65, 36.03, 139.75, zooms=(14, 15))
+    assert len(set(tiles)) == len(tiles)
+    for z in (14, 15):
+        x0, y0 = tile_xy(36.03, 139.65, z); x1, y1 = tile_xy(35.93, 139.75, z)
+        assert sum(t[0] == z for t in tiles) == (x1 - x0 + 1) * (y1 - y0 + 1)
+    assert stops_bbox([35.9, float("nan"), 36.0], [139.6, 139.7, float("nan")], margin_deg=0) == (35.9, 139.6, 36.0, 139.7)
+    assert stops_bbox([float("nan")], [139.6]) is None
+
+
+def test_prefetch_counts_fetched_then_cached(tmp_path, upstream):
+    sources, seen = upstream
+    proxy = TileProxy(TileStore(str(tmp_path)), sources=sources)
+    bbox = (35.95, 139.68, 35.97, 139.70)
+    first = prefetch(proxy, "pale", bbox, zooms=(15, 16), max_workers=4)
+    assert first["tiles"] == len(tiles_for_bbox(*bbox, zooms=(15, 16))) == first["fetched"]
+    assert first["cached"] == first["missing"] == first["failed"] == 0
+    second = prefetch(proxy, "pale", bbox, zooms=(15, 16))
+    assert second["cached"] == second["tiles"] and second["fetched"] == 0
+    assert len(seen) == first["tiles"]
+
+
+def test_prefetch_refuses_osm_and_carto(tmp_path, upstream):
+    sources, seen = upstream
+    proxy = TileProxy(TileStore(str(tmp_path)), sources={**TILE_SOURCES, "mine": sources["pale"]})
+    for source in ("osm", "positron"):
+        with pytest.raises(ValueError, match="利用規約"):
+            prefetch(proxy, source, (35.95, 139.68, 35.97, 139.70))
+    assert prefetch(proxy, "mine", (35.95, 139.68, 35.96, 139.69), zooms=(15,))["fetched"] > 0  # 自前の上流はよい
+    with pytest.raises(SystemExit):
+        main(["prefetch", "--source", "osm", "--cache-dir", str(tmp_path)])
+    assert len(os.listdir(tmp_path)) == 1  # mine だけ
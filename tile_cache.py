@@ -0,0 +1,264 @@
+"""
+地図タイルのローカルキャッシュ & タイル中継サーバ
+
+- TileStore: タイルを <root>/<source>/<z>/<x>/<y>.<ext> に保存する。合計サイズが max_bytes を超えたら
+  最後に使われたのが古いものから消す (LRU。使うたびにファイルの更新時刻を今にする)
+- TileProxy: キャッシュにあればそれを、なければ上流 (国土地理院 / CartoDB / OSM) から取ってきて保存して返す
+- serve(): /tiles/<source>/<z>/<x>/<y>.<ext> で配る HTTP サーバ (ETag / If-None-Match → 304 / Cache-Control)
+- prefetch(): バス停全体の範囲 (bbox) のタイルを指定ズーム (14〜16) で先に取っておく
+  (国土地理院か自前の上流だけ。OSM / CARTO のタイルは利用規約で一括ダウンロードが禁じられている)
+
+    python tile_cache.py serve [--port 8765] [--cache-dir .cache/tiles] [--max-mb 500]
+    python tile_cache.py prefetch --stops data/bus_stops.csv [--source pale] [--zooms 14 15 16]
+"""
+import argparse
+import hashlib
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# 名前 → (上流の URL テンプレート, 拡張子, 帰属表示)
+GSI_ATTR = "<a href='https://maps.gsi.go.jp/development/ichiran.html' target='_blank'>国土地理院</a>"
+OSM_ATTR = "&copy; <a href='https://www.openstreetmap.org/copyright'>OpenStreetMap</a> contributors"
+TILE_SOURCES = {
+    "pale": ("https://cyberjapandata.gsi.go.jp/xyz/pale/{z}/{x}/{y}.png", "png", GSI_ATTR),
+    "std": ("https://cyberjapandata.gsi.go.jp/xyz/std/{z}/{x}/{y}.png", "png", GSI_ATTR),
+    "seamlessphoto": ("https://cyberjapandata.gsi.go.jp/xyz/seamlessphoto/{z}/{x}/{y}.jpg", "jpg", GSI_ATTR),
+    "positron": ("https://a.basemaps.cartocdn.com/light_all/{z}/{x}/{y}.png", "png", OSM_ATTR + " &copy; <a href='https://carto.com/attributions'>CARTO</a>"),
+    "osm": ("https://tile.openstreetmap.org/{z}/{x}/{y}.png", "png", OSM_ATTR),
+}
+# 先読み (一括ダウンロード) してよい公開の上流
+PREFETCH_SOURCES = ("pale", "std", "seamlessphoto")
+CONTENT_TYPES = {"png": "image/png", "jpg": "image/jpeg"}
+USER_AGENT = "school_bus_app_v5 tile cache"
+
+class TileStore:
+    def __init__(self, root, max_bytes=500 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._sizes = {}  # path → bytes
+        for dirpath, _, filenames in os.walk(root):
+            for name in filenames:
+                if name.endswith(".tmp"): continue
+                path = os.path.join(dirpath, name)
+                self._sizes[path] = os.path.getsize(path)
+        self.total_bytes = sum(self._sizes.values())
+
+    def path(self, source, z, x, y, ext):
+        return os.path.join(self.root, source, str(z), str(x), f"{y}.{ext}")
+
+    def get(self, source, z, x, y, ext):
+        """保存済みならその中身 (bytes)、なければ None"""
+        path = self.path(source, z, x, y, ext)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # LRU 用に「最後に使った時刻」を更新
+            return data
+        except FileNotFoundError:
+            return None
+
+    def put(self, source, z, x, y, ext, data):
+        path = self.path(source, z, x, y, ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.total_bytes += len(data) - self._sizes.get(path, 0)
+            self._sizes[path] = len(data)
+            if self.total_bytes > self.max_bytes: self._evict()
+
+    def _evict(self):
+        """max_bytes の 9割 まで、最後に使われたのが古いものから消す"""
+        target = self.max_bytes * 0.9
+        by_age = sorted(self._sizes, key=lambda p: os.path.getmtime(p) if os.path.exists(p) else 0)
+        for path in by_age:
+            if self.total_bytes <= target: break
+            try: os.remove(path)
+            except FileNotFoundError: pass
+            self.total_bytes -= self._sizes.pop(path)
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self._sizes)
+
+def etag_for(data):
+    return '"' + hashlib.md5(data).hexdigest() + '"'
+
+class TileProxy:
+    """
+    fetch(source, z, x, y) → (bytes, ext) / 上流に無ければ None。
+    sources は TILE_SOURCES と同じ形 (テスト用の偽の上流を指すこともできる)。
+    """
+    def __init__(self, store, sources=None, timeout=10, max_connections=8):
+        self.store = store
+        self.sources = TILE_SOURCES if sources is None else sources
+        self.timeout = timeout
+        import requests  # 中継するときだけ使う (アプリの起動時には読まない)
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        adapter = requests.adapters.HTTPAdapter(pool_connections=len(self.sources), pool_maxsize=max_connections)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.hits = 0
+        self.misses = 0
+
+    def fetch(self, source, z, x, y):
+        url_template, ext, _ = self.sources[source]
+        data = self.store.get(source, z, x, y, ext)
+        if data is not None:
+            self.hits += 1
+            return data, ext
+        self.misses += 1
+        res = self.session.get(url_template.format(z=z, x=x, y=y), timeout=self.timeout)
+        if res.status_code == 404: return None
+        res.raise_for_status()
+        self.store.put(source, z, x, y, ext, res.content)
+        return res.content, ext
+
+def make_handler(proxy, max_age):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            parts = self.path.split("?", 1)[0].strip("/").split("/")
+            try:
+                if len(parts) != 5 or parts[0] != "tiles" or parts[1] not in proxy.sources: raise ValueError
+                source, z, x = parts[1], int(parts[2]), int(parts[3])
+                y = int(parts[4].rsplit(".", 1)[0])
+            except ValueError:
+                self.send_error(404); return
+            try:
+                hit = proxy.fetch(source, z, x, y)
+            except Exception:
+                self.send_error(502); return
+            if hit is None:
+                self.send_error(404); return
+            data, ext = hit
+            etag = etag_for(data)
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", f"public, max-age={max_age}")
+                self.end_headers(); return
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPES.get(ext, "application/octet-stream"))
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", f"public, max-age={max_age}")
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.end_headers()
+            self.wfile.write(data)
+    return Handler
+
+def serve(proxy, host="127.0.0.1", port=8765, max_age=7 * 24 * 3600, background=True):
+    """タイル中継サーバを起動する。background=True ならスレッドで動かしてサーバを返す"""
+    server = ThreadingHTTPServer((host, port), make_handler(proxy, max_age))
+    server.daemon_threads = True
+    if not background:
+        server.serve_forever()
+        return server
+    threading.Thread(target=server.serve_forever, daemon=True, name="tile-proxy").start()
+    return server
+
+def proxied_url(base_url, source):
+    """folium の tiles に渡す URL (中継サーバ経由)"""
+    return f"{base_url.rstrip('/')}/tiles/{source}/{{z}}/{{x}}/{{y}}.{TILE_SOURCES[source][1]}"
+
+# ---------------------------------------------------------
+# 📦 先読み
+# ---------------------------------------------------------
+def tile_xy(lat, lng, zoom):
+    """緯度経度 → その点を含むタイルの (x, y) (Web メルカトル)"""
+    n = 2 ** zoom
+    lat_rad = math.radians(max(min(lat, 85.0511), -85.0511))
+    x = int((lng + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+def tiles_for_bbox(min_lat, min_lng, max_lat, max_lng, zooms=(14, 15, 16)):
+    """bbox を覆うタイルの (z, x, y) のリスト"""
+    tiles = []
+    for z in zooms:
+        x0, y0 = tile_xy(max_lat, min_lng, z)  # 左上
+        x1, y1 = tile_xy(min_lat, max_lng, z)  # 右下
+        tiles.extend((z, x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))
+    return tiles
+
+def stops_bbox(lats, lngs, margin_deg=0.01):
+    lats = [v for v in lats if not math.isnan(v)]
+    lngs = [v for v in lngs if not math.isnan(v)]
+    if not lats or not lngs: return None
+    return min(lats) - margin_deg, min(lngs) - margin_deg, max(lats) + margin_deg, max(lngs) + margin_deg
+
+def can_prefetch(proxy, source):
+    """PREFETCH_SOURCES か、TILE_SOURCES にない自前の上流なら True"""
+    url = proxy.sources[source][0]
+    public = {template: name for name, (template, _, _) in TILE_SOURCES.items()}
+    return url not in public or public[url] in PREFETCH_SOURCES
+
+def prefetch(proxy, source, bbox, zooms=(14, 15, 16), max_workers=4, progress=None):
+    """bbox のタイルを取っておく。戻り値: {"tiles", "fetched", "cached", "missing", "failed", "seconds"}"""
+    if not can_prefetch(proxy, source):
+        raise ValueError(f"{source}: OSM / CARTO のタイルは利用規約で一括ダウンロードが禁じられているため先読みできません")
+    t0 = time.perf_counter()
+    tiles = tiles_for_bbox(*bbox, zooms=zooms)
+    stats = {"tiles": len(tiles), "fetched": 0, "cached": 0, "missing": 0, "failed": 0}
+    misses_before = proxy.misses
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tile-prefetch") as executor:
+        futures = [executor.submit(proxy.fetch, source, z, x, y) for z, x, y in tiles]
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                if future.result() is None: stats["missing"] += 1
+            except Exception:
+                stats["failed"] += 1
+            if progress: progress(done, len(tiles))
+    fetched_or_failed = proxy.misses - misses_before
+    stats["fetched"] = fetched_or_failed - stats["missing"] - stats["failed"]
+    stats["cached"] = len(tiles) - fetched_or_failed
+    stats["seconds"] = round(time.perf_counter() - t0, 2)
+    return stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["serve", "prefetch"])
+    parser.add_argument("--cache-dir", default=os.path.join(os.environ.get("BUS_CACHE_DIR", ".cache"), "tiles"))
+    parser.add_argument("--max-mb", type=int, default=500)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-age", type=int, default=7 * 24 * 3600, help="Cache-Control の max-age [s]")
+    parser.add_argument("--stops", default=os.path.join(os.environ.get("BUS_DATA_DIR", "data"), "bus_stops.csv"))
+    parser.add_argument("--source", default="pale", choices=PREFETCH_SOURCES, help="先読みする上流 (国土地理院のみ)")
+    parser.add_argument("--zooms", type=int, nargs="+", default=[14, 15, 16])
+    args = parser.parse_args(argv)
+
+    proxy = TileProxy(TileStore(args.cache_dir, max_bytes=args.max_mb * 1024 * 1024))
+    if args.command == "serve":
+        print(f"serving tiles on http://{args.host}:{args.port}/tiles/<source>/{{z}}/{{x}}/{{y}}.<ext> (cache: {args.cache_dir})")
+        serve(proxy, args.host, args.port, args.max_age, background=False)
+        return 0
+    from data_store import read_csv_auto_encoding
+    stops, _ = read_csv_auto_encoding(args.stops)
+    import pandas as pd
+    bbox = stops_bbox(pd.to_numeric(stops["lat"], errors="coerce").tolist(), pd.to_numeric(stops["lng"], errors="coerce").tolist())
+    if bbox is None:
+        print("no stop coordinates"); return 1
+    stats = prefetch(proxy, args.source, bbox, zooms=args.zooms,
+                     progress=lambda done, total: print(f"\r{done}/{total}", end="", file=sys.stderr))
+    print(file=sys.stderr)
+    print(stats)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())